@@ -0,0 +1,36 @@
+import argparse
+
+from logic.report import render_reports
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Gera os relatórios PDF de alertas de vários usuários."
+    )
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out-dir", help="diretório para um PDF por usuário")
+    target.add_argument("--zip", dest="zip_path", help="arquivo zip de saída")
+    parser.add_argument(
+        "--users",
+        type=lambda value: [int(v) for v in value.split(",") if v],
+        help="IDs de usuário separados por vírgula (padrão: todos)",
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--db", help="caminho do banco de dados")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    written = render_reports(
+        user_ids=args.users,
+        out_dir=args.out_dir,
+        zip_path=args.zip_path,
+        workers=args.workers,
+        db_path=args.db,
+    )
+    print(f"{len(written)} relatório(s) gerado(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,13 @@
 import streamlit as st
-from logic.database import (
-    fetch_all_medications,
-    connect_db,
-    create_user,
-    get_user_by_email,
-    validate_user,
-    insert_medication,
-    update_stock,
-)
-from logic.config import get_refill_day, load_config, get_application_version
-from datetime import datetime, timedelta
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-import tempfile
-
-from pathlib import Path
-import json
-
-
-def calculate_days_left(stock, dosage):
-    if dosage == 0:
-        return float("inf")
-    return stock / dosage
-
-
-def get_status_labels(med, days_until_refill):
-    alerts = []
-    days_left = calculate_days_left(med["stock_in_units"], med["dosage_per_intake"])
-    if days_left < days_until_refill:
-        alerts.append("⚠ Estoque")
-    expiry = datetime.strptime(med["prescription_expiry"], "%Y-%m-%d").date()
-    days_to_expiry = (expiry - datetime.today().date()).days
-    # Alerta se a receita está para vencer em menos de 15 dias
-    if 0 <= days_to_expiry < 15:
-        alerts.append(f"⚠ Receita vence em {days_to_expiry} dia(s)")
-    # Alerta se a receita já venceu
-    if days_to_expiry < 0:
-        alerts.append("❌ Receita médica vencida! Não é possível comprar.")
-    return ", ".join(alerts) if alerts else "OK"
-
-
-def generate_pdf_report(alerts, config_data):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        path = Path(tmp.name)
-    _, height = A4
-    c = canvas.Canvas(str(path), pagesize=A4)
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(50, height - 50, "Relatório de Medicamentos com Alerta")
-    c.setFont("Helvetica", 10)
-    c.drawString(
-        50, height - 65, f"Data de geração: {datetime.today().strftime('%d/%m/%Y')}"
-    )
-    y = height - 100
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(50, y, "Nome")
-    c.drawString(250, y, "Estoque (dias)")
-    c.drawString(400, y, "Receita vence em")
-    c.setFont("Helvetica", 11)
-    for row in alerts:
-        y -= 20
-        if y < 50:
-            c.showPage()
-            y = height - 50
-        c.drawString(50, y, row[0])
-        c.drawString(250, y, row[1])
-        c.drawString(400, y, row[2])
-    y -= 40
-    c.setFont("Helvetica-Oblique", 10)
-    c.drawString(50, y, f"Total de alertas: {len(alerts)} medicamento(s)")
-    y -= 20
-    c.drawString(
-        50, y, f"Data inicial do controle: {config_data.get('initial_date', '-')}"
-    )
-    c.save()
-    return path
+from logic.bootstrap import bootstrap
+from logic.instrumentation import finish_run, start_run
+from logic.database import create_user, get_user_by_email
+from logic.config import get_application_version
+from logic.auth import AuthBusyError, RateLimitedError, authenticate, is_valid_email
 
+# Logs, caminho do banco e migrações: uma única vez por processo
+bootstrap()
+run_stats = start_run("streamlit")
 
 # --- Autenticação de Usuário ---
 st.title("Controle de Medicamentos")
@@ -92,7 +25,13 @@ def login_form():
         password = st.text_input("Senha", type="password")
         submit = st.form_submit_button("Entrar")
         if submit:
-            user = validate_user(email, password)
+            try:
+                user = authenticate(
+                    email, password, getattr(st.context, "ip_address", None)
+                )
+            except (RateLimitedError, AuthBusyError) as e:
+                st.error(str(e))
+                return
             if user:
                 st.session_state["user_id"] = user["id"]
                 st.session_state["email"] = user["email"]
@@ -104,20 +43,21 @@ def login_form():
 
 def register_form():
     st.subheader("Cadastrar novo usuário")
-    import re
-
     with st.form("register_form"):
         email = st.text_input("E-mail")
         password = st.text_input("Nova senha", type="password")
         submit = st.form_submit_button("Cadastrar")
         if submit:
-            email_regex = r"^[\w\.-]+@[\w\.-]+\.\w+$"
-            if not re.match(email_regex, email):
+            if not is_valid_email(email):
                 st.error("E-mail inválido. Informe um e-mail válido.")
             elif get_user_by_email(email):
                 st.error("E-mail já cadastrado.")
             else:
-                create_user(email, password)
+                try:
+                    create_user(email, password)
+                except AuthBusyError as e:
+                    st.error(str(e))
+                    return
                 st.success("Usuário cadastrado! Faça login.")
 
 
@@ -127,6 +67,30 @@ if not st.session_state["user_id"]:
     register_form()
     st.stop()
 
+# Dependências da área logada (pandas, previsões, importação) só são
+# importadas depois do login, para que a página de login abra mais rápido
+import sqlite3
+from datetime import datetime
+
+from logic.config import load_config
+from logic.database import (
+    UnitOfWork,
+    bump_data_version,
+    fetch_alerting_medications,
+    fetch_forecasts,
+    fetch_medications_page,
+    fetch_refill_events,
+    fetch_scheduler_run,
+    fetch_stock_movements,
+    get_user_settings,
+    search_medication_catalog,
+    search_medications,
+    update_user_settings,
+)
+from logic.forecast import day_number, from_day_number, next_refill_date
+from logic.status import COMPUTED_COLUMNS, alert_rows, evaluate_medications
+from logic.transfer import FORMATS, export_medications, import_medications
+
 st.success(f"Usuário logado: {st.session_state['email']}")
 if st.button("Sair"):
     st.session_state["user_id"] = None
@@ -143,156 +107,314 @@ with st.expander("ℹ️ Como usar o Controle de Medicamentos?", expanded=True):
 3. **Acompanhe o estoque**: O sistema calcula automaticamente quanto tempo o estoque dura e alerta quando for necessário comprar.
 4. **Receitas**: O sistema alerta quando a receita médica está próxima do vencimento ou vencida. Não é possível reabastecer medicamentos com receita vencida ou com mais de 6 meses.
 5. **Reabastecimento automático**: No dia base de compra, o medicamento de referência é reabastecido automaticamente se a receita estiver válida.
-6. **Promoções**: Se comprar mais unidades, basta editar o estoque manualmente.
+6. **Promoções**: Se comprar mais unidades, use "🛒 Registrar compra" em "✏️ Editar Medicamento"; o histórico de movimentações do estoque aparece logo abaixo.
 
 > Dúvidas? Consulte o README ou entre em contato com o suporte.
     """)
 
 user_id = st.session_state["user_id"]
-
+# Alterações dos formulários desta execução, gravadas juntas mais abaixo
+edits = UnitOfWork(user_id)
 
 config_data = load_config()
-refill_base = get_refill_day()
-next_refill = refill_base
-while next_refill < datetime.today().date():
-    next_refill += timedelta(days=30)
-days_until_refill = (next_refill - datetime.today().date()).days
-
-
-# --- Lógica de reabastecimento automático do medicamento de referência ---
-REFERENCE_DAYS = 30
 today = datetime.today().date()
-last_update = config_data.get("last_stock_update")
-if last_update:
-    last_update = datetime.strptime(last_update, "%Y-%m-%d").date()
-else:
-    last_update = None
-
-# Só executa se for o dia da compra e ainda não foi feito hoje
-if today == next_refill and (not last_update or last_update < today):
-    meds_ref = [
-        dict(m) for m in fetch_all_medications(user_id=user_id) if m["is_reference"]
-    ]
-    for med in meds_ref:
-        # Verifica validade da receita (6 meses = 180 dias)
-        expiry = datetime.strptime(med["prescription_expiry"], "%Y-%m-%d").date()
-        days_to_expiry = (expiry - today).days
-        if days_to_expiry < 0:
+# Data base de compra e prazo da receita do usuário (tabela user_settings)
+settings = get_user_settings(user_id)
+refill_base = from_day_number(settings["refill_day"])
+next_refill = next_refill_date(refill_base, today)
+days_until_refill = (next_refill - today).days
+
+# O consumo diário e o reabastecimento automático são aplicados pelo
+# agendador (refill_scheduler.py); a página apenas lê os resultados. Quando
+# há uma execução nova do agendador, o cache de leitura do usuário é descartado.
+# Com shards, vale a execução no shard do usuário.
+scheduler_run = fetch_scheduler_run(day_number(today), user_id)
+if scheduler_run is None:
+    st.warning(
+        "O agendador ainda não processou o dia de hoje; o estoque exibido pode "
+        "não incluir o consumo mais recente."
+    )
+elif st.session_state.get("scheduler_run") != tuple(scheduler_run):
+    st.session_state["scheduler_run"] = tuple(scheduler_run)
+    bump_data_version(user_id)
+
+# Avisos do reabastecimento do medicamento de referência no dia da compra
+if settings["last_stock_update"] == day_number(today):
+    for event in fetch_refill_events(user_id, settings["last_stock_update"]):
+        if event["outcome"] == "expired":
+            expiry = datetime.strptime(event["prescription_expiry"], "%Y-%m-%d").date()
             st.warning(
-                f"❌ Não foi possível reabastecer '{med['name']}' porque a receita está vencida desde {expiry.strftime('%d/%m/%Y')}."
+                f"❌ Não foi possível reabastecer '{event['name']}' porque a receita está vencida desde {expiry.strftime('%d/%m/%Y')}."
             )
-            continue
-        if (expiry - timedelta(days=180)) < today:
+        elif event["outcome"] == "too_old":
             st.warning(
-                f"⚠ Não foi possível reabastecer '{med['name']}' porque a receita tem mais de 6 meses. Atualize a receita para continuar comprando."
+                f"⚠ Não foi possível reabastecer '{event['name']}' porque a receita tem mais de 6 meses. Atualize a receita para continuar comprando."
             )
-            continue
-        novo_estoque = med["stock_in_units"] + REFERENCE_DAYS * med["dosage_per_intake"]
-        update_stock(med["id"], novo_estoque)
-    # Atualiza o campo last_stock_update no config.json
-    config_data["last_stock_update"] = today.strftime("%Y-%m-%d")
-    with open("config.json", "w", encoding="utf-8") as f:
-        json.dump(config_data, f, indent=4, ensure_ascii=False)
 
 st.info(
     f"🗓️ Próxima compra: {next_refill.strftime('%d/%m/%Y')} (em {days_until_refill} dias)"
 )
 
-meds = [dict(m) for m in fetch_all_medications(user_id=user_id)]
-for m in meds:
-    m["status"] = get_status_labels(m, days_until_refill)
-
 st.subheader("Lista de Medicamentos")
-st.dataframe(meds)
-
-# Alertas
-alerts = []
-for med in meds:
-    dosage = float(med["dosage_per_intake"])
-    days_left = med["stock_in_units"] / dosage if dosage else float("inf")
-    expiry = datetime.strptime(med["prescription_expiry"], "%Y-%m-%d").date()
-    days_to_expiry = (expiry - datetime.today().date()).days
-    if days_left < days_until_refill or days_to_expiry < 15:
-        alerts.append([med["name"], f"{days_left:.1f} dias", f"{days_to_expiry} dias"])
+
+# Lista paginada por chave: cada execução carrega só a página exibida.
+# med_page_cursors guarda o after_id de cada página visitada.
+PAGE_SIZE = 50
+PAGE_SORTS = {"Nome": "name", "ID": "id"}
+# Tipos de movimento do livro de estoque (logic.ledger.MOVEMENT_KINDS)
+MOVEMENT_LABELS = {
+    "refill": "Reabastecimento",
+    "purchase": "Compra",
+    "consumption": "Consumo",
+    "adjustment": "Ajuste",
+}
+
+
+def reset_page():
+    st.session_state["med_page_cursors"] = [None]
+
+
+def next_page(after_id):
+    st.session_state["med_page_cursors"].append(after_id)
+
+
+def previous_page():
+    st.session_state["med_page_cursors"].pop()
+
+
+if "med_page_cursors" not in st.session_state:
+    reset_page()
+sort_label = st.radio(
+    "Ordenar por", list(PAGE_SORTS), horizontal=True, on_change=reset_page
+)
+page_cursors = st.session_state["med_page_cursors"]
+meds, next_after_id = fetch_medications_page(
+    user_id, page_cursors[-1], PAGE_SIZE, PAGE_SORTS[sort_label]
+)
+if not meds and len(page_cursors) > 1:
+    # A página ficou vazia (ex.: medicamentos removidos): volta ao início
+    reset_page()
+    page_cursors = st.session_state["med_page_cursors"]
+    meds, next_after_id = fetch_medications_page(
+        user_id, None, PAGE_SIZE, PAGE_SORTS[sort_label]
+    )
+status_frame = evaluate_medications(meds, days_until_refill, today)
+st.dataframe(status_frame.drop(columns=COMPUTED_COLUMNS))
+
+col_prev, col_page, col_next = st.columns(3)
+col_prev.button("◀ Anterior", disabled=len(page_cursors) == 1, on_click=previous_page)
+col_page.write(f"Página {len(page_cursors)}")
+col_next.button(
+    "Próxima ▶",
+    disabled=next_after_id is None,
+    on_click=next_page,
+    args=(next_after_id,),
+)
+
+# Alertas: busca por índice apenas dos medicamentos que requerem atenção
+alert_meds = fetch_alerting_medications(user_id, days_until_refill, today=today)
+alerts = alert_rows(evaluate_medications(alert_meds, days_until_refill, today))
 
 if alerts:
     st.warning(f"{len(alerts)} medicamento(s) requer(em) atenção!")
     if st.button("Gerar PDF de Alertas"):
-        pdf_path = generate_pdf_report(alerts, config_data)
-        with open(pdf_path, "rb") as f:
-            st.download_button("Baixar PDF", f, file_name="alertas.pdf")
-        pdf_path.unlink()
+        from logic.report import build_pdf_report
+
+        pdf = build_pdf_report(alerts, config_data)
+        st.download_button(
+            "Baixar PDF", pdf, file_name="alertas.pdf", mime="application/pdf"
+        )
 else:
     st.success("Nenhum medicamento requer atenção no momento.")
 
+# Previsão materializada de falta de estoque (considera as próximas compras)
+forecasts = fetch_forecasts(user_id)
+if forecasts:
+    with st.expander("📉 Previsão de falta de estoque"):
+        st.dataframe(
+            [
+                {
+                    "Medicamento": f["name"],
+                    "Falta prevista": from_day_number(f["stockout_day"]).strftime("%d/%m/%Y")
+                    if f["stockout_day"] is not None
+                    else "-",
+                    "Comprar até": from_day_number(f["reorder_day"]).strftime("%d/%m/%Y")
+                    if f["reorder_day"] is not None
+                    else "-",
+                }
+                for f in forecasts
+            ]
+        )
+
+# Configuração de reabastecimento do usuário
+with st.expander("⚙️ Configurações de compra"):
+    with st.form("user_settings"):
+        new_refill_base = st.date_input("Data base de compra", value=refill_base)
+        new_validity_days = st.number_input(
+            "Prazo máximo da receita para reabastecer (dias)",
+            min_value=1,
+            value=settings["validity_days"],
+        )
+        if st.form_submit_button("Salvar configurações"):
+            update_user_settings(
+                user_id, refill_day=new_refill_base, validity_days=new_validity_days
+            )
+            st.success("Configurações salvas!")
+            st.rerun()
+
 # Adicionar medicamento
 with st.expander("➕ Adicionar Medicamento"):
+    # O nome fica fora do formulário para que as sugestões do catálogo (nomes
+    # já cadastrados, dos mais usados para os menos) apareçam ao digitar
+    name = st.text_input("Nome do Medicamento").strip()
+    suggestions = [row["name"] for row in search_medication_catalog(name)]
+    if suggestions:
+        name = st.selectbox(
+            "Nome a cadastrar",
+            [name] + [suggestion for suggestion in suggestions if suggestion != name],
+            help="Prefira a grafia já usada para o mesmo medicamento.",
+        )
     with st.form("add_med"):
-        name = st.text_input("Nome do Medicamento")
         dose = st.number_input("Dosagem por Uso", min_value=0.0)
         stock = st.number_input("Estoque em Unidades", min_value=0)
         validity = st.date_input("Validade da Receita")
         submitted = st.form_submit_button("Salvar")
         if submitted:
-            try:
-                insert_medication(
-                    user_id,
-                    name,
-                    dose,
-                    "Tablet",
-                    "daily",
-                    "box",
-                    30,
-                    stock,
-                    "Active",
-                    0,
-                    validity.strftime("%Y-%m-%d"),
-                )
-                st.success("Medicamento adicionado!")
-                st.rerun()
-            except Exception as e:
-                st.error(f"Erro ao adicionar: {e}")
+            edits.add(
+                name=name,
+                dosage_per_intake=dose,
+                type="Tablet",
+                schedule="daily",
+                packaging="box",
+                quantity_per_package=30,
+                stock_in_units=stock,
+                status="Active",
+                is_reference=0,
+                prescription_expiry=validity.strftime("%Y-%m-%d"),
+            )
 
 # Editar medicamento
 with st.expander("✏️ Editar Medicamento"):
-    med_ids = [m["id"] for m in meds]
-    if med_ids:
-        edit_id = st.selectbox("Selecione o ID do medicamento para editar", med_ids)
-        med = next((m for m in meds if m["id"] == edit_id), None)
+    query = st.text_input(
+        "Buscar medicamento pelo nome",
+        help="Início de qualquer palavra do nome; acentos e maiúsculas são ignorados.",
+    )
+    matches = search_medications(user_id, query)
+    if matches:
+        by_id = {m.id: m for m in matches}
+        edit_id = st.selectbox(
+            "Selecione o medicamento para editar",
+            list(by_id),
+            format_func=lambda med_id: f"{by_id[med_id].name} (#{med_id})",
+        )
+        med = by_id.get(edit_id)
         if med:
+            # Versão do medicamento exibida na execução anterior, quando o
+            # formulário foi preenchido; a gravação só ocorre se ela não mudou
+            version_key = f"edit_med_version_{edit_id}"
+            seen_version = st.session_state.get(version_key, med.row_version)
+            st.session_state[version_key] = med.row_version
             with st.form("edit_med"):
-                new_name = st.text_input("Nome", value=med["name"])
-                new_dose = st.number_input("Dosagem", value=med["dosage_per_intake"])
-                new_stock = st.number_input("Estoque", value=med["stock_in_units"])
-                new_validity = st.date_input(
-                    "Validade",
-                    value=datetime.strptime(med["prescription_expiry"], "%Y-%m-%d"),
-                )
+                new_name = st.text_input("Nome", value=med.name)
+                new_dose = st.number_input("Dosagem", value=med.dosage_per_intake)
+                new_stock = st.number_input("Estoque", value=med.stock_in_units)
+                new_validity = st.date_input("Validade", value=med.prescription_expiry)
                 submitted = st.form_submit_button("Salvar alterações")
                 if submitted:
-                    try:
-                        conn = connect_db()
-                        cursor = conn.cursor()
-                        cursor.execute(
-                            """
-                            UPDATE medications
-                            SET name=?, dosage_per_intake=?, stock_in_units=?, prescription_expiry=?
-                            WHERE id=? AND user_id=?
-                        """,
-                            (
-                                new_name,
-                                new_dose,
-                                new_stock,
-                                new_validity.strftime("%Y-%m-%d"),
-                                edit_id,
-                                user_id,
-                            ),
-                        )
-                        conn.commit()
-                        conn.close()
-                        st.success("Medicamento atualizado!")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Erro ao atualizar: {e}")
+                    edits.update(
+                        edit_id,
+                        seen_version,
+                        name=new_name,
+                        dosage_per_intake=new_dose,
+                        stock_in_units=new_stock,
+                        prescription_expiry=new_validity.strftime("%Y-%m-%d"),
+                    )
+            # A compra soma ao estoque e fica no histórico como "Compra"; como
+            # a edição, só é gravada se o medicamento não mudou em outra sessão
+            with st.form("purchase_med"):
+                purchased = st.number_input("Unidades compradas", min_value=1, value=1)
+                if st.form_submit_button("🛒 Registrar compra"):
+                    edits.purchase(edit_id, seen_version, purchased)
+            movements = fetch_stock_movements(edit_id, user_id, limit=20)
+            if movements:
+                st.caption("Últimas movimentações de estoque")
+                st.dataframe(
+                    [
+                        {
+                            "Data": from_day_number(m["day"]).strftime("%d/%m/%Y"),
+                            "Tipo": MOVEMENT_LABELS.get(m["kind"], m["kind"]),
+                            "Quantidade": m["quantity"],
+                        }
+                        for m in movements
+                    ]
+                )
+    elif query.strip():
+        st.info("Nenhum medicamento encontrado.")
     else:
         st.info("Nenhum medicamento para editar.")
+
+# Grava em uma única transação as alterações feitas nesta execução
+if edits.pending:
+    try:
+        conflicts = edits.commit()
+    except sqlite3.Error as e:
+        st.error(f"Erro ao salvar: {e}")
+    else:
+        if conflicts:
+            st.error(
+                "O(s) medicamento(s) "
+                + ", ".join(str(med_id) for med_id in conflicts)
+                + " foi(ram) alterado(s) em outra sessão e não foi(ram) salvo(s). "
+                "Os dados foram recarregados; revise e salve novamente."
+            )
+        else:
+            st.success("Alterações salvas!")
+            st.rerun()
+
+# Importação e exportação em lote (Parquet ou CSV)
+with st.expander("📦 Importar / Exportar"):
+    uploaded = st.file_uploader(
+        "Importar medicamentos (colunas obrigatórias: name, dosage_per_intake, "
+        "stock_in_units, prescription_expiry)",
+        type=list(FORMATS),
+    )
+    if uploaded is not None and st.button("Importar"):
+        try:
+            result = import_medications(uploaded, user_id=user_id)
+        except ValueError as e:
+            st.error(f"Erro ao importar: {e}")
+        else:
+            st.success(f"{result.imported} medicamento(s) importado(s).")
+            if result.rejected:
+                st.warning(
+                    f"{result.rejected} linha(s) ignorada(s): "
+                    + "; ".join(f"linha {line}: {msg}" for line, msg in result.errors[:10])
+                )
+            for chunk, message in result.failed_chunks:
+                st.error(f"Bloco {chunk} não importado: {message}")
+
+    export_format = st.radio("Formato da exportação", FORMATS, horizontal=True)
+    if st.button("Preparar exportação"):
+        import tempfile
+
+        # Arquivo temporário em disco: a exportação é gravada em blocos
+        with tempfile.TemporaryFile() as export_file:
+            export_medications(export_file, export_format, user_id=user_id)
+            export_file.seek(0)
+            st.download_button(
+                "Baixar arquivo",
+                export_file.read(),
+                file_name=f"medicamentos.{export_format}",
+            )
+
+# Painel de diagnóstico: consultas desta execução da página
+if config_data.get("debug_panel") or st.query_params.get("debug") == "1":
+    with st.expander("🛠️ Diagnóstico"):
+        st.json(run_stats.summary())
+        st.dataframe(
+            [
+                {"sql": q["sql"], "ms": round(q["seconds"] * 1000, 3), "rows": q["rows"]}
+                for q in run_stats.queries
+            ]
+        )
+finish_run()
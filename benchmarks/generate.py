@@ -0,0 +1,70 @@
+import random
+import sqlite3
+from datetime import date, timedelta
+
+from logic.database import MEDICATION_COLUMNS, create_tables, ensure_user_settings
+from logic.forecast import day_number, refresh_all_forecasts
+from logic.ledger import record_opening_stock
+
+NAMES = [
+    "Aradois",
+    "Atorvastatina",
+    "Losartana",
+    "Metformina",
+    "Omeprazol",
+    "Sinvastatina",
+    "Levotiroxina",
+    "Anlodipino",
+    "Hidroclorotiazida",
+    "Clopidogrel",
+]
+DOSAGES = (0.5, 1.0, 1.0, 1.0, 2.0, 3.0)
+# Os usuários sintéticos não fazem login; o hash é apenas um marcador
+PASSWORD_HASH = "!"
+
+
+# Cria um meds.db sintético (em um caminho novo) com `medications` linhas espalhadas
+# por `users` usuários. A mesma semente sempre gera o mesmo banco.
+def generate_database(path, medications, users, seed=42, batch_size=10_000):
+    rng = random.Random(seed)
+    create_tables(path)
+    today = date.today()
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (email, password_hash) VALUES (?, ?)",
+                ((f"user{i}@example.com", PASSWORD_HASH) for i in range(1, users + 1)),
+            )
+            ensure_user_settings(conn, range(1, users + 1))
+        columns = ", ".join(MEDICATION_COLUMNS)
+        placeholders = ", ".join("?" * len(MEDICATION_COLUMNS))
+        sql = f"INSERT INTO medications ({columns}) VALUES ({placeholders})"
+        for start in range(0, medications, batch_size):
+            rows = []
+            for i in range(start, min(start + batch_size, medications)):
+                expiry = today + timedelta(days=rng.randint(-30, 365))
+                rows.append(
+                    (
+                        i % users + 1,
+                        rng.choice(NAMES),
+                        rng.choice(DOSAGES),
+                        "Tablet",
+                        "daily",
+                        "box",
+                        30,
+                        rng.randint(0, 120),
+                        "Active",
+                        int(rng.random() < 0.2),
+                        expiry.strftime("%Y-%m-%d"),
+                    )
+                )
+            with conn:
+                conn.executemany(sql, rows)
+        with conn:
+            record_opening_stock(conn, 1, medications, day_number(today))
+            refresh_all_forecasts(conn)
+    finally:
+        conn.close()
+    return path
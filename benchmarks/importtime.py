@@ -0,0 +1,73 @@
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# O que a página de login importa antes do st.stop()
+STARTUP_MODULES = ("logic.bootstrap", "logic.auth", "logic.config", "logic.database")
+# Dependências pesadas que só podem ser carregadas sob demanda
+LAZY_MODULES = ("pandas", "numpy", "pyarrow", "reportlab", "bcrypt", "multiprocessing")
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mede o tempo de importação dos módulos da inicialização "
+        "(python -X importtime) e verifica se os pesados continuam sob demanda."
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--modules",
+        default=",".join(STARTUP_MODULES),
+        help="módulos importados, separados por vírgula",
+    )
+    return parser.parse_args(argv)
+
+
+# Executa um interpretador novo com -X importtime. Devolve o tempo cumulativo
+# (segundos) dos módulos de primeiro nível e os módulos pesados carregados.
+def measure(modules):
+    code = (
+        f"import {', '.join(modules)}, sys; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        # Sem recuo = importado diretamente, não por outro módulo
+        if match and match.group(3) == " ":
+            total += int(match.group(2))
+    loaded = [name for name in completed.stdout.strip().split(",") if name]
+    return total / 1_000_000, loaded
+
+
+# Melhor tempo entre `repeat` interpretadores e os módulos pesados carregados
+def bench_imports(modules=STARTUP_MODULES, repeat=5):
+    best, loaded = float("inf"), []
+    for _ in range(repeat):
+        seconds, loaded = measure(modules)
+        best = min(best, seconds)
+    return best, loaded
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    modules = [module for module in args.modules.split(",") if module]
+    seconds, loaded = bench_imports(modules, args.repeat)
+    print(f"{'import/startup':40} {seconds * 1000:10.3f} ms")
+    if loaded:
+        print(f"Importados na inicialização: {', '.join(loaded)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from benchmarks.generate import generate_database
+from benchmarks.importtime import bench_imports
+from logic import database
+from logic.consumption import apply_daily_consumption
+from logic.models import MedicationTable
+from logic.report import build_pdf_report
+from logic.status import evaluate_medications
+
+DEFAULT_SIZES = "1000,100000"
+DEFAULT_USERS = 10_000
+DEFAULT_THRESHOLD = 0.25
+# Diferenças menores que isso (em ms) são ruído, qualquer que seja a razão
+DEFAULT_MIN_DELTA_MS = 1.0
+PDF_ROWS = (10, 100, 1000)
+# Usuários cujos medicamentos de referência entram no teste de reabastecimento
+REFILL_USERS = 100
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mede os caminhos críticos em bancos SQLite sintéticos."
+    )
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help="quantidades de medicamentos, separadas por vírgula (ex.: 1000,100000,1000000)",
+    )
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--workdir",
+        help="diretório dos bancos gerados; bancos existentes são reaproveitados "
+        "(padrão: diretório temporário)",
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="regressão tolerada em relação ao baseline (0.25 = 25%%)",
+    )
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=DEFAULT_MIN_DELTA_MS,
+        help="diferença mínima em ms para contar como regressão",
+    )
+    return parser.parse_args(argv)
+
+
+# Melhor tempo (em segundos) entre `repeat` execuções
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Mediana (em segundos) de `repeat` execuções de fn(i), para escritas: cada
+# execução altera o banco, então a melhor não é representativa
+def timed_median(fn, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+# Cópia consistente do banco gerado (API de backup do SQLite): os testes de
+# escrita rodam na cópia, e o banco em --workdir fica igual para a próxima
+# execução
+def copy_database(source, dest):
+    remove_database(dest)
+    src, dst = sqlite3.connect(source), sqlite3.connect(dest)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+def bench_database(path, repeat):
+    path = str(path)
+    results = {}
+    results["connect_cold"] = timed(
+        lambda: database._open_connection(path).close(), repeat
+    )
+    database.connect_db(path)
+    results["connect_warm"] = timed(lambda: database.connect_db(path), repeat)
+
+    def fetch_cold():
+        database.clear_read_cache()
+        database.fetch_all_medications(1, path)
+
+    results["fetch_user_cold"] = timed(fetch_cold, repeat)
+    results["fetch_user_warm"] = timed(
+        lambda: database.fetch_all_medications(1, path), repeat
+    )
+
+    def fetch_page():
+        database.clear_read_cache()
+        database.fetch_medications_page(1, None, 50, "name", path)
+
+    results["fetch_page_cold"] = timed(fetch_page, repeat)
+    # Busca por prefixo no índice FTS5 (usuário e catálogo de nomes)
+    results["search_user"] = timed(
+        lambda: database.search_medications(1, "ator", db_path=path), repeat
+    )
+    results["search_catalog"] = timed(
+        lambda: database.search_medication_catalog("a", db_path=path), repeat
+    )
+
+    user_rows = database.fetch_all_medications(1, path)
+    all_rows = MedicationTable()
+    for chunk in database.iter_medication_chunks(db_path=path):
+        all_rows.extend(chunk)
+    evaluate_medications(user_rows, 15)
+    results["status_user"] = timed(lambda: evaluate_medications(user_rows, 15), repeat)
+    results["status_all"] = timed(lambda: evaluate_medications(all_rows, 15), repeat)
+    del all_rows
+
+    refills = [
+        (row.id, row.stock_in_units)
+        for user_id in range(1, REFILL_USERS + 1)
+        for row in database.fetch_reference_medications(user_id, path)
+    ]
+    # Cada execução grava um estoque diferente, para que sempre haja mudança
+    results["refill_per_row"] = timed_median(
+        lambda i: [
+            database.update_stock(med_id, stock + i + 1, path)
+            for med_id, stock in refills
+        ],
+        repeat,
+    )
+    results["refill_batch"] = timed_median(
+        lambda i: database.update_stock_many(
+            [(med_id, stock + repeat + i + 1) for med_id, stock in refills], path
+        ),
+        repeat,
+    )
+
+    # Cada execução usa um dia à frente, para que sempre haja consumo a aplicar
+    results["consumption_all_users"] = timed_median(
+        lambda i: apply_daily_consumption(
+            today=date.today() + timedelta(days=i + 1), db_path=path
+        ),
+        repeat,
+    )
+    return results
+
+
+def bench_pdf(repeat):
+    results, sizes = {}, {}
+    for count in PDF_ROWS:
+        alerts = [[f"Medicamento {i}", "3.0 dias", "10 dias"] for i in range(count)]
+        results[f"pdf_{count}_rows"] = timed(lambda: build_pdf_report(alerts, {}), repeat)
+        sizes[f"pdf_{count}_rows"] = len(build_pdf_report(alerts, {}))
+    return results, sizes
+
+
+def run(args):
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        for size in sizes:
+            path = workdir / f"meds_{size}_{args.users}_{args.seed}.db"
+            if not path.exists():
+                generate_database(path, size, min(args.users, size), args.seed)
+            run_path = workdir / f"{path.stem}.run.db"
+            copy_database(path, run_path)
+            try:
+                for name, seconds in bench_database(run_path, args.repeat).items():
+                    timings[f"{size}/{name}"] = seconds
+            finally:
+                database.close_connections()
+                remove_database(run_path)
+    pdf_timings, pdf_sizes = bench_pdf(args.repeat)
+    timings.update(pdf_timings)
+    timings["import/startup"], lazy_loaded = bench_imports(repeat=args.repeat)
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "timings": timings,
+        "pdf_bytes": pdf_sizes,
+        "startup_imports": lazy_loaded,
+    }
+
+
+# Métricas mais lentas que baseline × (1 + threshold) e por pelo menos
+# min_delta_ms
+def compare(current, baseline, threshold, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    regressions = []
+    for name, seconds in current["timings"].items():
+        reference = baseline.get("timings", {}).get(name)
+        if (
+            reference
+            and seconds > reference * (1 + threshold)
+            and (seconds - reference) * 1000 >= min_delta_ms
+        ):
+            regressions.append((name, reference, seconds))
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    Path(args.output).write_text(json.dumps(results, indent=4), encoding="utf-8")
+    for name, seconds in results["timings"].items():
+        print(f"{name:40} {seconds * 1000:10.3f} ms")
+    # Módulo pesado importado na inicialização conta como regressão
+    failed = bool(results["startup_imports"])
+    if failed:
+        print(
+            f"REGRESSÃO importados na inicialização: {', '.join(results['startup_imports'])}",
+            file=sys.stderr,
+        )
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(
+            results, baseline, args.threshold, args.min_delta_ms
+        )
+        for name, reference, seconds in regressions:
+            print(
+                f"REGRESSÃO {name}: {reference * 1000:.3f} ms -> {seconds * 1000:.3f} ms",
+                file=sys.stderr,
+            )
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
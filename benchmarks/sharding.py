@@ -0,0 +1,98 @@
+import argparse
+import random
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.generate import generate_database
+from logic import database
+from logic.shards import split
+
+DEFAULT_SHARDS = "1,2,4"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mede a vazão de escritas concorrentes (uma transação por "
+        "alteração de estoque) com o banco inteiro e particionado em shards."
+    )
+    parser.add_argument("--medications", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--shards",
+        default=DEFAULT_SHARDS,
+        help="quantidades de shards, separadas por vírgula (1 = sem particionar)",
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--workdir", help="diretório dos bancos (padrão: temporário)")
+    return parser.parse_args(argv)
+
+
+# Cada thread altera o estoque de medicamentos aleatórios dos seus usuários
+# até o prazo; devolve escritas por segundo
+def bench_writes(db_path, users, threads, seconds, seed):
+    medications = {
+        user_id: [row.id for row in database.fetch_all_medications(user_id, db_path)]
+        for user_id in users
+    }
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        mine = [user_id for user_id in users[index::threads] if medications[user_id]]
+        while time.perf_counter() < deadline:
+            med_id = rng.choice(medications[rng.choice(mine)])
+            database.update_stock(med_id, rng.randint(0, 500), db_path)
+            counts[index] += 1
+        database.close_connections()
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def run(args):
+    shard_counts = [int(count) for count in args.shards.split(",") if count]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        source = workdir / f"meds_{args.medications}_{args.users}_{args.seed}.db"
+        if not source.exists():
+            generate_database(source, args.medications, args.users, args.seed)
+        users = list(range(1, min(args.users, args.medications) + 1))
+        for count in shard_counts:
+            target = workdir / f"shards_{count}" / "meds.db"
+            shutil.rmtree(target.parent, ignore_errors=True)
+            target.parent.mkdir(parents=True)
+            shutil.copy(source, target)
+            if count > 1:
+                split(count, target)
+            results[count] = bench_writes(
+                target, users, args.threads, args.seconds, args.seed
+            )
+            database.close_connections()
+            database.clear_routes()
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    single = results.get(1)
+    for count, rate in results.items():
+        ratio = f"  ({rate / single:.2f}×)" if single else ""
+        print(f"{f'writes/{count}_shards':40} {rate:10.1f} /s{ratio}")
+
+
+if __name__ == "__main__":
+    main()
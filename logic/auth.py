@@ -0,0 +1,185 @@
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+from logic.config import load_config
+
+DEFAULT_BCRYPT_ROUNDS = 12
+# Processos dedicados ao bcrypt e limite de pedidos aguardando na fila
+HASH_WORKERS = 2
+MAX_PENDING_HASHES = 32
+QUEUE_TIMEOUT_SECONDS = 5.0
+
+# Tentativas de login permitidas por janela de tempo
+EMAIL_ATTEMPTS, EMAIL_WINDOW_SECONDS = 5, 300
+IP_ATTEMPTS, IP_WINDOW_SECONDS = 30, 60
+
+EMAIL_PATTERN = re.compile(r"^[\w\.-]+@[\w\.-]+\.\w+$")
+
+
+class AuthBusyError(Exception):
+    pass
+
+
+class RateLimitedError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Muitas tentativas; tente novamente em {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# Funções executadas no pool (precisam ser de nível de módulo)
+def _hash(password, rounds):
+    import bcrypt
+
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode()
+
+
+def _check(password, password_hash):
+    import bcrypt
+
+    return bcrypt.checkpw(password, password_hash)
+
+
+def is_valid_email(email):
+    return EMAIL_PATTERN.match(email) is not None
+
+
+def get_bcrypt_rounds():
+    return int(load_config().get("bcrypt_rounds", DEFAULT_BCRYPT_ROUNDS))
+
+
+def hash_rounds(password_hash):
+    # Formato "$2b$12$...": o terceiro campo é o custo
+    return int(password_hash.split("$")[2])
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_PENDING_HASHES)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Importado só no primeiro hash: concurrent.futures.process traz
+            # o multiprocessing, desnecessário para abrir a página de login.
+            # Executáveis congelados (PyInstaller) não iniciam subprocessos
+            # com segurança; o bcrypt libera o GIL, então threads bastam ali.
+            if getattr(sys, "frozen", False):
+                from concurrent.futures import ThreadPoolExecutor
+
+                _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+            else:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                # spawn: o servidor do Streamlit tem várias threads, e um fork
+                # dele pode herdar travas presas
+                _executor = ProcessPoolExecutor(
+                    max_workers=HASH_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return _executor
+
+
+# Envia o trabalho ao pool; se a fila estiver cheia por mais de
+# QUEUE_TIMEOUT_SECONDS, recusa com AuthBusyError em vez de acumular.
+def _run(fn, *args):
+    if not _slots.acquire(timeout=QUEUE_TIMEOUT_SECONDS):
+        raise AuthBusyError("Servidor ocupado; tente novamente.")
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def hash_password(password, rounds=None):
+    return _run(_hash, password.encode(), rounds or get_bcrypt_rounds())
+
+
+def check_password(password, password_hash):
+    return _run(_check, password.encode(), password_hash.encode())
+
+
+# Hash usado quando o e-mail não existe, para que a resposta leve o mesmo
+# tempo de um usuário real e não revele quais e-mails estão cadastrados. O do
+# custo padrão vem pronto (senha "dummy-password"); outro custo configurado
+# é calculado uma única vez, no pool, no primeiro uso.
+DUMMY_PASSWORD_HASH = "$2b$12$LlOeKreXwHlZqpTpFkBsHOUHcaKqgosunHSgQDdm3ZnaWFoj2OZDy"
+_dummy_hashes = {DEFAULT_BCRYPT_ROUNDS: DUMMY_PASSWORD_HASH}
+_dummy_lock = threading.Lock()
+
+
+def _dummy_hash(rounds):
+    with _dummy_lock:
+        if rounds not in _dummy_hashes:
+            _dummy_hashes[rounds] = hash_password("dummy-password", rounds)
+        return _dummy_hashes[rounds]
+
+
+# Janela deslizante de tentativas por chave (e-mail ou IP)
+class RateLimiter:
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                raise RateLimitedError(hits[0] + self.window - now)
+            hits.append(now)
+            if len(self._hits) > 10_000:
+                self._prune(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def _prune(self, now):
+        cutoff = now - self.window
+        for key in [k for k, hits in self._hits.items() if hits[-1] <= cutoff]:
+            del self._hits[key]
+
+
+_email_limiter = RateLimiter(EMAIL_ATTEMPTS, EMAIL_WINDOW_SECONDS)
+_ip_limiter = RateLimiter(IP_ATTEMPTS, IP_WINDOW_SECONDS)
+
+
+# Confere e-mail e senha sem limite de tentativas. Se o custo configurado
+# mudou desde o cadastro, a senha é recalculada com o novo custo.
+def verify_credentials(email, password, db_path=None):
+    from logic.database import get_user_by_email, update_password_hash
+
+    rounds = get_bcrypt_rounds()
+    user = get_user_by_email(email, db_path)
+    if user is None:
+        check_password(password, _dummy_hash(rounds))
+        return None
+    if not check_password(password, user["password_hash"]):
+        return None
+    if hash_rounds(user["password_hash"]) != rounds:
+        update_password_hash(user["id"], hash_password(password, rounds), db_path)
+    return user
+
+
+def authenticate(email, password, ip_address=None, db_path=None):
+    if ip_address:
+        _ip_limiter.hit(ip_address)
+    key = email.strip().lower()
+    _email_limiter.hit(key)
+    user = verify_credentials(email, password, db_path)
+    if user is not None:
+        _email_limiter.reset(key)
+    return user
@@ -0,0 +1,22 @@
+import threading
+
+from logic.database import create_tables, get_db_path
+from logic.instrumentation import configure_logging
+
+_bootstrapped = set()
+_bootstrap_lock = threading.Lock()
+
+
+# Preparação única por processo: configura os logs, resolve o caminho do banco
+# (no executável congelado, copia o banco empacotado) e aplica as migrações.
+# As reexecuções do script Streamlit só consultam o conjunto _bootstrapped.
+def bootstrap(db_path=None):
+    key = str(db_path) if db_path is not None else None
+    if key in _bootstrapped:
+        return
+    with _bootstrap_lock:
+        if key in _bootstrapped:
+            return
+        configure_logging()
+        create_tables(db_path or get_db_path())
+        _bootstrapped.add(key)
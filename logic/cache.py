@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+# Cache LRU com expiração por tempo (TTL), seguro para várias threads.
+# Usado tanto pelo app Streamlit quanto pelos scripts de linha de comando.
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Contadores de versão dos dados por (banco, usuário). Toda escrita incrementa
+# o contador do usuário e o do banco inteiro (usuário None); entradas de cache
+# gravadas com uma versão anterior deixam de valer. A época do banco cobre as
+# escritas de outras conexões (outros processos ou threads), em que o usuário
+# não é conhecido: ela entra na versão de todos.
+_versions = {}
+_epochs = {}
+_versions_lock = threading.Lock()
+
+
+def data_version(db_key, user_id=None):
+    return _versions.get((db_key, user_id), 0), _epochs.get(db_key, 0)
+
+
+def bump_version(db_key, user_id):
+    with _versions_lock:
+        for key in ((db_key, user_id), (db_key, None)):
+            _versions[key] = _versions.get(key, 0) + 1
+
+
+def bump_epoch(db_key):
+    with _versions_lock:
+        _epochs[db_key] = _epochs.get(db_key, 0) + 1
@@ -1,32 +1,145 @@
 import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
 CONFIG_PATH = Path("config.json")
+DEFAULT_VALIDITY_DAYS = 180
+
+# Cópia em memória do config.json, recarregada só quando o arquivo muda
+# (inode, mtime ou tamanho diferentes do que foi lido da última vez).
+_cache = {"key": None, "data": {}}
+_cache_lock = threading.Lock()
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _read_config(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Trava exclusiva entre processos, baseada em um arquivo auxiliar. Com
+# blocking=False, levanta BlockingIOError se outro processo já tem a trava.
+@contextmanager
+def file_lock(path, blocking=True):
+    with open(path, "a+b") as handle:
+        if os.name == "nt":
+            import msvcrt
+
+            handle.seek(0)
+            try:
+                msvcrt.locking(
+                    handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1
+                )
+            except OSError as e:
+                if blocking:
+                    raise
+                raise BlockingIOError(f"Trava em uso: {path}") from e
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _lock_path():
+    return CONFIG_PATH.with_name(CONFIG_PATH.name + ".lock")
 
 
 def load_config():
-    if CONFIG_PATH.exists():
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+    key = _stat_key(CONFIG_PATH)
+    if key != _cache["key"]:
+        with _cache_lock:
+            data = _read_config(CONFIG_PATH) if key else {}
+            _cache["key"], _cache["data"] = key, data
+    return dict(_cache["data"])
+
+
+def _write_config(config):
+    # Grava em arquivo temporário e troca atomicamente: leitores concorrentes
+    # veem sempre o JSON antigo ou o novo, nunca um arquivo pela metade.
+    directory = CONFIG_PATH.parent
+    fd, tmp_name = tempfile.mkstemp(
+        dir=directory, prefix=f".{CONFIG_PATH.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        if CONFIG_PATH.exists():
+            os.chmod(tmp_name, CONFIG_PATH.stat().st_mode & 0o777)
+        os.replace(tmp_name, CONFIG_PATH)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    with _cache_lock:
+        _cache["key"], _cache["data"] = _stat_key(CONFIG_PATH), dict(config)
 
 
-def get_refill_day():
+def save_config(config):
+    with file_lock(_lock_path()):
+        _write_config(config)
+
+
+# Lê, altera e grava o config.json sob a trava, sem perder alterações de
+# outras sessões feitas entre a leitura e a gravação.
+def update_config(changes):
+    with file_lock(_lock_path()):
+        config = _read_config(CONFIG_PATH) if CONFIG_PATH.exists() else {}
+        config.update(changes)
+        _write_config(config)
+    return dict(config)
+
+
+# Data base de compra dos usuários que ainda não têm configuração própria
+# (tabela user_settings)
+def get_default_refill_day():
     config = load_config()
     value = config.get("refill_day")
     if not value:
         from datetime import date
 
         today = date.today()
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            config["refill_day"] = today.strftime("%Y-%m-%d")
-            json.dump(config, f, indent=4, ensure_ascii=False)
+        update_config({"refill_day": today.strftime("%Y-%m-%d")})
         return today
     from datetime import datetime
 
     return datetime.strptime(value, "%Y-%m-%d").date()
 
 
+# Último reabastecimento aplicado quando a configuração ficava só no
+# config.json; vale para os usuários anteriores à tabela user_settings
+def get_legacy_last_stock_update():
+    value = load_config().get("last_stock_update")
+    if not value:
+        return None
+    from datetime import datetime
+
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def get_default_validity_days():
+    return int(load_config().get("default_validity_days", DEFAULT_VALIDITY_DAYS))
+
+
 def get_application_version():
     config = load_config()
     return config.get("APPLICATION_VERSION", "Unknown")
@@ -0,0 +1,103 @@
+import threading
+from datetime import date
+
+from logic.database import (
+    bump_data_version,
+    clear_read_cache,
+    fan_out,
+    user_db_path,
+    write_transaction,
+)
+from logic.ledger import INSERT_MOVEMENT_SQL, take_snapshots
+
+_EPOCH = date(1970, 1, 1)
+
+# Usuários cujo consumo já foi aplicado hoje neste processo, para que as
+# reexecuções da página não voltem ao banco só para descobrir que não há nada.
+_applied = {}
+_applied_lock = threading.Lock()
+
+
+CONSUMED_STOCK_SQL = (
+    "MAX(stock_in_units - dosage_per_intake * (:today - consumed_through_day), 0)"
+)
+CONSUMPTION_SQL = f"""
+    UPDATE medications
+    SET stock_in_units = {CONSUMED_STOCK_SQL},
+        consumed_through_day = :today,
+        row_version = row_version + 1,
+        movements_since_snapshot =
+            movements_since_snapshot + ({CONSUMED_STOCK_SQL} != stock_in_units)
+    WHERE consumed_through_day < :today {{user_filter}}
+"""
+# Movimento de consumo de cada medicamento que o UPDATE acima vai alterar;
+# roda antes dele, na mesma transação
+CONSUMPTION_LEDGER_SQL = (
+    INSERT_MOVEMENT_SQL
+    + f"""
+    SELECT id, user_id, :today, 'consumption', {CONSUMED_STOCK_SQL} - stock_in_units
+    FROM medications
+    WHERE consumed_through_day < :today {{user_filter}}
+      AND {CONSUMED_STOCK_SQL} != stock_in_units
+"""
+)
+
+
+def _consume(conn, user_filter, params):
+    conn.execute(CONSUMPTION_LEDGER_SQL.format(user_filter=user_filter), params)
+    cursor = conn.execute(CONSUMPTION_SQL.format(user_filter=user_filter), params)
+    return cursor.rowcount
+
+
+# Consumo dos usuários com id entre first_user_id e last_user_id, dentro da
+# transação do chamador (usado pelo agendador, que processa em lotes e grava
+# os snapshots do livro ao fim de cada lote).
+def consume_user_range(conn, today, first_user_id, last_user_id):
+    return _consume(
+        conn,
+        "AND user_id BETWEEN :first_user_id AND :last_user_id",
+        {
+            "today": (today - _EPOCH).days,
+            "first_user_id": first_user_id,
+            "last_user_id": last_user_id,
+        },
+    )
+
+
+# Desconta do estoque dosagem_diária × dias_passados desde consumed_through_day,
+# com um único UPDATE para todos os medicamentos do usuário (ou de todos os
+# usuários, se user_id for None, um UPDATE por shard em paralelo). Rodar de
+# novo no mesmo dia não altera nada. Devolve a quantidade de medicamentos
+# atualizados.
+def apply_daily_consumption(user_id=None, today=None, db_path=None):
+    today = today or date.today()
+    if user_id is not None:
+        return _apply_daily_consumption(user_id, today, user_db_path(user_id, db_path))
+    return sum(
+        fan_out(lambda path: _apply_daily_consumption(None, today, path), db_path)
+    )
+
+
+def _apply_daily_consumption(user_id, today, db_path):
+    memo_key = (str(db_path), user_id)
+    if _applied.get(memo_key) == today:
+        return 0
+
+    params = {"today": (today - _EPOCH).days, "user_id": user_id}
+    user_filter = "AND user_id = :user_id" if user_id is not None else ""
+    with write_transaction(db_path) as conn:
+        updated = _consume(conn, user_filter, params)
+        if updated:
+            if user_id is not None:
+                take_snapshots(conn, "m.user_id = :user_id", {"user_id": user_id})
+            else:
+                take_snapshots(conn, "true")
+
+    if updated:
+        if user_id is not None:
+            bump_data_version(user_id, db_path)
+        else:
+            clear_read_cache()
+    with _applied_lock:
+        _applied[memo_key] = today
+    return updated
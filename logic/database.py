@@ -1,11 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+import atexit
+import contextvars
+import heapq
+import json
+import random
+import re
 import sys
 import sqlite3
 import shutil
-import bcrypt
+import threading
+import time
+import unicodedata
+import weakref
+from contextlib import contextmanager
+from datetime import date
+from logic.config import (
+    get_default_refill_day,
+    get_default_validity_days,
+    get_legacy_last_stock_update,
+)
+from logic.forecast import (
+    day_number,
+    from_day_number,
+    last_refill_date,
+    refresh_all_forecasts,
+    refresh_forecast,
+)
+from logic.cache import TTLCache, bump_epoch, bump_version, data_version
+from logic.instrumentation import (
+    InstrumentedConnection,
+    logger,
+    record_connection,
+)
+from logic.ledger import (
+    INSERT_MOVEMENT_SQL,
+    reconcile,
+    record_opening_stock,
+    record_stock_targets,
+    stock_balance,
+    take_snapshots,
+)
+from logic.migrations import FORECAST_TABLES_VERSION, migrate
+from logic.models import MEDICATION_SELECT, MedicationTable, medication_row
 
+# Quantidade de instruções preparadas mantidas em cache por conexão
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=67108864",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+)
 
-def get_db_path():
+# Pool do processo: cada thread usa com exclusividade uma conexão por caminho
+# de banco, tirada das conexões livres; quando a thread termina (no Streamlit,
+# a cada nova execução da página), as conexões voltam para as livres e a
+# próxima thread as reaproveita já abertas e configuradas.
+_local = threading.local()
+_idle = {}
+_idle_lock = threading.Lock()
+# Conexões livres mantidas por caminho; as que sobram são fechadas
+IDLE_CONNECTIONS_PER_PATH = 8
+# Cache de leitura das listas de medicamentos, validado pela versão dos dados
+CACHE_TTL_SECONDS = 300
+_medications_cache = TTLCache(maxsize=1024, ttl=CACHE_TTL_SECONDS)
+# Bancos já migrados neste processo (as migrações rodam uma vez por caminho)
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _main_db_path():
     try:
         if getattr(sys, "frozen", False):
             base_path = Path(sys.executable).parent / "data"
@@ -21,74 +91,347 @@ def get_db_path():
                     internal_db = None
                 if internal_db is not None and internal_db.exists():
                     shutil.copy(internal_db, db_path)
-                    print(f"📦 Copiado banco empacotado para: {db_path}")
+                    logger.info("Copiado banco empacotado para: %s", db_path)
                 else:
-                    print(f"⚠️ Banco empacotado não encontrado em: {internal_db}")
-                print(f"Caminho do DB (modo frozen): {db_path}")
+                    logger.warning("Banco empacotado não encontrado em: %s", internal_db)
+            logger.info("Caminho do DB (modo frozen): %s", db_path)
             return db_path
         else:
             base_path = Path(__file__).parent.parent / "data"
             base_path.mkdir(exist_ok=True, parents=True)
             db_path = base_path / "meds.db"
-            print("DB path (dev):", db_path)
+            logger.info("Caminho do DB (dev): %s", db_path)
             return db_path
     except Exception as e:
-        print(f"❌ Erro ao determinar o caminho do banco de dados: {e}")
+        logger.error("Erro ao determinar o caminho do banco de dados: %s", e)
         return Path("data/meds.db")  # fallback padrão
 
 
-def connect_db(db_path=None):
-    db_path = db_path or get_db_path()
-    print("📌 Caminho recebido para o banco:", db_path)  # <-- Adicione isso
-    conn = sqlite3.connect(db_path)
+def _open_connection(db_path):
+    started = time.perf_counter()
+    # A conexão troca de thread ao voltar para as livres, mas nunca é usada
+    # por duas threads ao mesmo tempo
+    conn = sqlite3.connect(
+        db_path,
+        timeout=5.0,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=InstrumentedConnection,
+        check_same_thread=False,
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if db_path not in _migrated:
+        with _migrate_lock:
+            migrate(conn, _after_migrations)
+            _migrated.add(db_path)
+    record_connection(db_path, time.perf_counter() - started)
     return conn
 
 
-def create_tables():
-    with connect_db() as conn:
-        cursor = conn.cursor()
-        # Cria tabela de usuários (e-mail único, senha hash)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL
-            )
-        """)
-        # Cria tabela de medicamentos com user_id
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS medications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                dosage_per_intake REAL NOT NULL,
-                type TEXT,
-                schedule TEXT,
-                packaging TEXT,
-                quantity_per_package INTEGER NOT NULL,
-                stock_in_units INTEGER NOT NULL,
-                status TEXT,
-                is_reference INTEGER,
-                prescription_expiry DATE,
-                FOREIGN KEY(user_id) REFERENCES users(id)
-            )
-        """)
-        conn.commit()
+# Conexões em uso por uma thread; quando o objeto é coletado (a thread
+# terminou), _release_connections as devolve
+class _ThreadConnections:
+    def __init__(self):
+        self.connections = {}
+        weakref.finalize(self, _release_connections, self.connections)
+
+
+def _release_connections(connections):
+    while connections:
+        key, conn = connections.popitem()
+        if conn.in_transaction:
+            conn.rollback()
+        with _idle_lock:
+            idle = _idle.setdefault(key, [])
+            if len(idle) < IDLE_CONNECTIONS_PER_PATH:
+                idle.append(conn)
+                continue
+        conn.close()
+
+
+def _pool():
+    checkout = getattr(_local, "checkout", None)
+    if checkout is None:
+        checkout = _local.checkout = _ThreadConnections()
+    return checkout.connections
+
+
+# Retorna a conexão persistente da thread atual para o banco informado.
+# Use "with connect_db() as conn" para delimitar transações; não feche a conexão.
+def connect_db(db_path=None):
+    key = str(db_path or get_db_path())
+    pool = _pool()
+    conn = pool.get(key)
+    if conn is None:
+        with _idle_lock:
+            idle = _idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn = _open_connection(key)
+        pool[key] = conn
+    return conn
+
+
+# Fecha as conexões da thread atual e as livres do processo
+def close_connections():
+    pool = _pool()
+    while pool:
+        _, conn = pool.popitem()
+        conn.close()
+    _close_idle_connections()
+    _close_watchers()
+
+
+@atexit.register
+def _close_idle_connections():
+    with _idle_lock:
+        idle = [conn for conns in _idle.values() for conn in conns]
+        _idle.clear()
+    for conn in idle:
+        conn.close()
+
+
+# Preenche as previsões de um banco que chegou sem as tabelas delas, na
+# transação das migrações
+def _after_migrations(conn, version):
+    if version < FORECAST_TABLES_VERSION:
+        refresh_all_forecasts(conn)
+
+
+def create_tables(db_path=None):
+    migrate(connect_db(db_path), _after_migrations)
+
+
+# Banco principal (usuários e diretório de shards); com user_id, o banco em
+# que ficam os dados desse usuário (o shard dele, se houver shards)
+def get_db_path(user_id=None):
+    if user_id is None:
+        return _main_db_path()
+    return user_db_path(user_id)
+
+
+# Particionamento (logic.shards): o banco principal guarda os usuários e o
+# diretório de shards; os medicamentos, configurações, previsões e o livro de
+# estoque de cada usuário ficam inteiros em um arquivo de shard. Os ids de
+# medicamento do shard k começam em k × SHARD_ID_SPAN, então o id sozinho
+# indica o shard. Nas funções deste módulo, db_path é o banco principal; um
+# shard não tem diretório e por isso atende a si mesmo.
+SHARD_ID_SPAN = 2**40
+# O diretório só muda com logic.shards, que exige o app e o agendador
+# parados; o cache apenas evita uma consulta ao diretório por chamada
+ROUTE_TTL_SECONDS = 60
+_routes = TTLCache(maxsize=100_000, ttl=ROUTE_TTL_SECONDS)
+# Threads que consultam os shards em paralelo (o sqlite3 libera o GIL)
+FAN_OUT_WORKERS = 8
+_fan_out_executor = None
+_fan_out_lock = threading.Lock()
+
+
+def clear_routes():
+    _routes.clear()
+
+
+# {id do shard: caminho}; vazio se o banco não é particionado
+def shard_paths(db_path=None):
+    db_path = db_path or get_db_path()
+    key = (str(db_path), None)
+    paths = _routes.get(key)
+    if paths is None:
+        rows = connect_db(db_path).execute("SELECT id, path FROM shards ORDER BY id")
+        paths = {row["id"]: Path(db_path).parent / row["path"] for row in rows}
+        _routes.set(key, paths)
+    return paths
+
+
+# Bancos com medicamentos: os shards, ou o próprio banco se não é particionado
+def data_paths(db_path=None):
+    db_path = db_path or get_db_path()
+    return list(shard_paths(db_path).values()) or [db_path]
+
+
+# Shard do usuário. Usuários ainda sem shard (novos, ou criados antes do
+# particionamento e sem dados) são distribuídos pelo id; a atribuição só é
+# gravada no diretório com assign=True, pelos caminhos que gravam dados do
+# usuário. Uma leitura de um usuário sem shard (inclusive inexistente) não
+# escreve nada e só encontra dados vazios.
+def user_db_path(user_id, db_path=None, assign=False):
+    db_path = db_path or get_db_path()
+    shards = shard_paths(db_path)
+    if not shards:
+        return db_path
+    key = (str(db_path), user_id)
+    # (shard_id, gravado no diretório)
+    route = _routes.get(key)
+    if route is None or (assign and not route[1]):
+        conn = connect_db(db_path)
+        row = conn.execute(
+            "SELECT shard_id FROM user_shards WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is not None:
+            route = (row["shard_id"], True)
+        else:
+            route = (sorted(shards)[user_id % len(shards)], assign)
+            if assign:
+                with conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO user_shards (user_id, shard_id) "
+                        "VALUES (?, ?)",
+                        (user_id, route[0]),
+                    )
+        _routes.set(key, route)
+    return shards[route[0]]
+
+
+# Shard do medicamento, pela faixa do id
+def medication_db_path(med_id, db_path=None):
+    db_path = db_path or get_db_path()
+    return shard_paths(db_path).get(med_id // SHARD_ID_SPAN, db_path)
+
+
+# Agrupa itens pelo banco de cada um, mantendo a ordem: {caminho: [itens]}
+def group_by_path(items, path_of):
+    groups = {}
+    for item in items:
+        groups.setdefault(path_of(item), []).append(item)
+    return groups
+
+
+def _get_fan_out_executor():
+    global _fan_out_executor
+    if _fan_out_executor is None:
+        with _fan_out_lock:
+            if _fan_out_executor is None:
+                _fan_out_executor = ThreadPoolExecutor(
+                    FAN_OUT_WORKERS, thread_name_prefix="shard"
+                )
+    return _fan_out_executor
+
+
+# Executa fn(caminho) em cada banco de `paths` (padrão: data_paths(db_path))
+# em paralelo e devolve os resultados na mesma ordem. As threads herdam o
+# contexto do chamador, então as consultas entram nas estatísticas da execução.
+def fan_out(fn, db_path=None, paths=None):
+    paths = list(paths if paths is not None else data_paths(db_path))
+    if len(paths) == 1:
+        return [fn(paths[0])]
+    executor = _get_fan_out_executor()
+    futures = [
+        executor.submit(contextvars.copy_context().run, fn, path) for path in paths
+    ]
+    return [future.result() for future in futures]
+
+
+# Invalida as leituras em cache do usuário; chame após qualquer escrita
+# em medications feita fora das funções deste módulo.
+def bump_data_version(user_id, db_path=None):
+    if user_id is not None:
+        bump_version(str(user_db_path(user_id, db_path)), user_id)
+
+
+def clear_read_cache():
+    _medications_cache.clear()
+
+
+# Vigia de cada banco: uma conexão do processo, usada só sob a trava, com o
+# último PRAGMA data_version visto. O valor muda quando outra conexão grava
+# no banco (o agendador e os scripts em outro processo, ou outra thread).
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+# Versão dos dados do usuário no banco para o cache de leituras; uma escrita
+# vista pelo vigia invalida o cache do banco inteiro.
+def _read_version(db_path, user_id=None):
+    key = str(db_path)
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is None:
+            watcher = _watchers[key] = [_open_connection(key), None]
+        current = watcher[0].execute("PRAGMA data_version").fetchone()[0]
+        if watcher[1] != current:
+            if watcher[1] is not None:
+                bump_epoch(key)
+            watcher[1] = current
+    return data_version(key, user_id)
+
+
+@atexit.register
+def _close_watchers():
+    with _watchers_lock:
+        watchers = list(_watchers.values())
+        _watchers.clear()
+    for conn, _ in watchers:
+        conn.close()
+
+
+# Transação de escrita explícita: BEGIN IMMEDIATE reserva a trava de escrita
+# logo no início, e tudo é confirmado com um único commit (um único fsync).
+@contextmanager
+def write_transaction(db_path=None):
+    conn = connect_db(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+# Novas tentativas de uma transação com o banco ocupado (SQLITE_BUSY): cada
+# tentativa espera no máximo RETRY_BUSY_TIMEOUT_MS pela trava de escrita, e
+# entre elas a espera cresce exponencialmente até BUSY_BACKOFF_MAX_SECONDS.
+BUSY_RETRIES = 5
+RETRY_BUSY_TIMEOUT_MS = 200
+BUSY_BACKOFF_SECONDS = 0.05
+BUSY_BACKOFF_MAX_SECONDS = 1.0
+
+
+def is_busy_error(error):
+    code = getattr(error, "sqlite_errorcode", None)
+    return code is not None and code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+# Executa work(conn) em write_transaction e devolve o resultado; com o banco
+# ocupado, desfaz e tenta de novo após uma espera aleatória limitada, em vez
+# de deixar vários escritores enfileirados no busy_timeout da conexão.
+# work precisa poder ser repetido (tudo o que ele grava é desfeito a cada falha).
+def run_write_transaction(work, db_path=None, retries=BUSY_RETRIES):
+    conn = connect_db(db_path)
+    for attempt in range(retries + 1):
+        conn.execute(f"PRAGMA busy_timeout={RETRY_BUSY_TIMEOUT_MS}")
+        try:
+            with write_transaction(db_path) as conn:
+                return work(conn)
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if attempt == retries or not is_busy_error(e):
+                raise
+        finally:
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        delay = min(BUSY_BACKOFF_SECONDS * 2**attempt, BUSY_BACKOFF_MAX_SECONDS)
+        time.sleep(random.uniform(delay / 2, delay))
 
 
 # Funções de usuário
 def create_user(email, password, db_path=None):
+    from logic.auth import hash_password
+
     db_path = db_path or get_db_path()
-    password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    password_hash = hash_password(password)
     with connect_db(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute(
             "INSERT INTO users (email, password_hash) VALUES (?, ?)",
             (email, password_hash),
         )
-        conn.commit()
-        return cursor.lastrowid
+        user_id = cursor.lastrowid
+    # A configuração fica no shard do usuário (atribuído aqui, pelo id)
+    with connect_db(user_db_path(user_id, db_path, assign=True)) as conn:
+        ensure_user_settings(conn, [user_id])
+    return user_id
 
 
 def get_user_by_email(email, db_path=None):
@@ -99,12 +442,153 @@ def get_user_by_email(email, db_path=None):
         return cursor.fetchone()
 
 
-def validate_user(email, password, db_path=None):
+def update_password_hash(user_id, password_hash, db_path=None):
     db_path = db_path or get_db_path()
-    user = get_user_by_email(email, db_path)
-    if user and bcrypt.checkpw(password.encode(), user["password_hash"].encode()):
-        return user
-    return None
+    with connect_db(db_path) as conn:
+        conn.execute(
+            "UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id)
+        )
+
+
+# Cria, com os padrões do config.json, a configuração dos usuários que ainda
+# não têm uma, dentro da transação do chamador. A compra mais recente já conta
+# como atendida: para um usuário novo, a anterior ao cadastro; para um usuário
+# de antes de user_settings (legacy_users), a última aplicada pela versão
+# anterior (last_stock_update do config.json).
+def ensure_user_settings(conn, user_ids, today=None):
+    refill_base = get_default_refill_day()
+    last_refill = last_refill_date(refill_base, today)
+    legacy_update = get_legacy_last_stock_update()
+    defaults = {
+        "refill_day": day_number(refill_base),
+        "last_refill": day_number(last_refill) if last_refill else None,
+        "legacy_update": day_number(legacy_update) if legacy_update else None,
+        "validity_days": get_default_validity_days(),
+    }
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO user_settings
+            (user_id, refill_day, last_stock_update, validity_days)
+        SELECT :user_id, :refill_day,
+               CASE WHEN EXISTS (SELECT 1 FROM legacy_users WHERE user_id = :user_id)
+                    THEN :legacy_update ELSE :last_refill END,
+               :validity_days
+        """,
+        ({"user_id": user_id, **defaults} for user_id in user_ids),
+    )
+
+
+# Configuração de reabastecimento do usuário: uma busca pela chave primária
+def get_user_settings(user_id, db_path=None):
+    db_path = user_db_path(user_id, db_path, assign=True)
+    conn = connect_db(db_path)
+    query = "SELECT * FROM user_settings WHERE user_id = ?"
+    row = conn.execute(query, (user_id,)).fetchone()
+    if row is None:
+        with conn:
+            ensure_user_settings(conn, [user_id])
+        row = conn.execute(query, (user_id,)).fetchone()
+    return row
+
+
+def get_refill_day(user_id, db_path=None):
+    return from_day_number(get_user_settings(user_id, db_path)["refill_day"])
+
+
+# Datas base de compra de vários usuários, {user_id: date}
+def get_refill_days(user_ids, db_path=None):
+    groups = group_by_path(
+        user_ids, lambda user_id: user_db_path(user_id, db_path, assign=True)
+    )
+    refill_days = {}
+    for path, user_ids in groups.items():
+        refill_days.update(_get_refill_days(user_ids, path))
+    return refill_days
+
+
+def _get_refill_days(user_ids, db_path):
+    refill_days = {}
+    with connect_db(db_path) as conn:
+        ensure_user_settings(conn, user_ids)
+        for start in range(0, len(user_ids), _IN_CHUNK):
+            chunk = user_ids[start : start + _IN_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = conn.execute(
+                "SELECT user_id, refill_day FROM user_settings "
+                f"WHERE user_id IN ({placeholders})",
+                chunk,
+            )
+            for row in cursor:
+                refill_days[row["user_id"]] = from_day_number(row["refill_day"])
+    return refill_days
+
+
+# Altera a configuração de um único usuário (uma atualização de linha);
+# as previsões dos medicamentos dele são recalculadas.
+def update_user_settings(user_id, refill_day=None, validity_days=None, db_path=None):
+    db_path = user_db_path(user_id, db_path, assign=True)
+    get_user_settings(user_id, db_path)
+    with write_transaction(db_path) as conn:
+        conn.execute(
+            """
+            UPDATE user_settings
+            SET refill_day = COALESCE(?, refill_day),
+                validity_days = COALESCE(?, validity_days)
+            WHERE user_id = ?
+            """,
+            (
+                day_number(refill_day) if refill_day is not None else None,
+                validity_days,
+                user_id,
+            ),
+        )
+        refresh_all_forecasts(conn, user_id)
+    bump_data_version(user_id, db_path)
+
+
+def validate_user(email, password, db_path=None):
+    from logic.auth import verify_credentials
+
+    return verify_credentials(email, password, db_path)
+
+
+MEDICATION_COLUMNS = (
+    "user_id",
+    "name",
+    "dosage_per_intake",
+    "type",
+    "schedule",
+    "packaging",
+    "quantity_per_package",
+    "stock_in_units",
+    "status",
+    "is_reference",
+    "prescription_expiry",
+)
+# Limite de parâmetros por consulta "IN (...)"
+_IN_CHUNK = 500
+
+
+# Condição "m.id na lista" com um único parâmetro (lista em JSON), para
+# listas de qualquer tamanho
+def _id_filter(med_ids):
+    return (
+        "m.id IN (SELECT value FROM json_each(:med_ids))",
+        {"med_ids": json.dumps(med_ids)},
+    )
+
+
+def _medication_owners(conn, med_ids):
+    owners = {}
+    for start in range(0, len(med_ids), _IN_CHUNK):
+        chunk = med_ids[start : start + _IN_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        cursor = conn.execute(
+            f"SELECT id, user_id FROM medications WHERE id IN ({placeholders})",
+            chunk,
+        )
+        owners.update((row["id"], row["user_id"]) for row in cursor)
+    return owners
 
 
 def insert_medication(
@@ -121,7 +605,7 @@ def insert_medication(
     prescription_expiry,
     db_path=None,
 ):
-    db_path = db_path or get_db_path()
+    db_path = user_db_path(user_id, db_path, assign=True)
     with connect_db(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute(
@@ -154,42 +638,792 @@ def insert_medication(
                 prescription_expiry,
             ),
         )
+        record_opening_stock(
+            conn, cursor.lastrowid, cursor.lastrowid, day_number(date.today())
+        )
+        refresh_forecast(conn, [cursor.lastrowid])
         conn.commit()
+    bump_data_version(user_id, db_path)
 
 
-def fetch_all_medications(user_id=None, db_path=None):
-    db_path = db_path or get_db_path()
+# Executa "SELECT {MEDICATION_SELECT} FROM medications {clause}" com
+# medication_row como row_factory: cada linha lida já vira um Medication.
+def _select_medications(conn, clause, params=()):
+    cursor = conn.cursor()
+    cursor.row_factory = medication_row
+    cursor.execute(f"SELECT {MEDICATION_SELECT} FROM medications {clause}", params)
+    return cursor
+
+
+# Lê pelo cache quando a versão dos dados do usuário não mudou desde a
+# última consulta; caso contrário executa load(conn) e guarda o resultado.
+def _cached_rows(key, user_id, db_path, load):
+    version = _read_version(db_path, user_id)
+    cached = _medications_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return list(cached[1])
     with connect_db(db_path) as conn:
-        cursor = conn.cursor()
+        rows = load(conn)
+    _medications_cache.set(key, (version, tuple(rows)))
+    return rows
+
+
+# Medicamentos do usuário; sem user_id, os de todos os usuários (de todos os
+# shards, lidos em paralelo)
+def fetch_all_medications(user_id=None, db_path=None):
+    if user_id is None:
+        return [
+            row
+            for rows in fan_out(lambda path: _fetch_all_medications(None, path), db_path)
+            for row in rows
+        ]
+    return _fetch_all_medications(user_id, user_db_path(user_id, db_path))
+
+
+def _fetch_all_medications(user_id, db_path):
+    def load(conn):
         if user_id is not None:
-            cursor.execute("SELECT * FROM medications WHERE user_id = ?", (user_id,))
+            cursor = _select_medications(conn, "WHERE user_id = ?", (user_id,))
         else:
-            cursor.execute("SELECT * FROM medications")
+            cursor = _select_medications(conn, "")
         return cursor.fetchall()
 
+    return _cached_rows(("all", str(db_path), user_id), user_id, db_path, load)
 
-def get_medication_by_id(med_id, db_path=None):
-    db_path = db_path or get_db_path()
+
+# Medicamentos que requerem atenção: estoque acaba em menos de horizon_days
+# dias ou receita vence em menos de expiry_horizon_days dias. Usa os índices
+# (user_id, stock_exhaustion_day) e (user_id, prescription_expiry_day).
+def fetch_alerting_medications(
+    user_id,
+    horizon_days,
+    expiry_horizon_days=15,
+    today=None,
+    db_path=None,
+):
+    db_path = user_db_path(user_id, db_path)
+    today_day = day_number(today or date.today())
+    params = (
+        user_id,
+        today_day + horizon_days,
+        user_id,
+        today_day + expiry_horizon_days,
+    )
+
+    def load(conn):
+        cursor = _select_medications(
+            conn,
+            """
+            WHERE id IN (
+                SELECT id FROM medications
+                WHERE user_id = ? AND stock_exhaustion_day < ?
+                UNION
+                SELECT id FROM medications
+                WHERE user_id = ? AND prescription_expiry_day < ?
+            )
+            ORDER BY id
+            """,
+            params,
+        )
+        return cursor.fetchall()
+
+    key = ("alerts", str(db_path), user_id, params)
+    return _cached_rows(key, user_id, db_path, load)
+
+
+# Ordenações aceitas por fetch_medications_page: (coluna de ordem, ORDER BY,
+# filtro "depois da âncora"). O filtro recebe o valor da coluna de ordem
+# (:after_key) e o id (:after_id) do último medicamento da página anterior.
+MEDICATION_PAGE_SORTS = {
+    "id": ("id", "id", "id > :after_id"),
+    "name": (
+        "name",
+        "name COLLATE NOCASE, id",
+        "name COLLATE NOCASE >= :after_key"
+        " AND (name COLLATE NOCASE > :after_key OR id > :after_id)",
+    ),
+}
+
+
+# Página de até `limit` medicamentos do usuário depois do medicamento
+# after_id (None = primeira página), por paginação por chave: o custo não
+# depende de quantas páginas vêm antes. Devolve (linhas, after_id da próxima
+# página ou None se esta for a última).
+def fetch_medications_page(user_id, after_id=None, limit=50, sort="id", db_path=None):
+    if sort not in MEDICATION_PAGE_SORTS:
+        raise ValueError(f"Ordenação inválida: {sort}")
+    db_path = user_db_path(user_id, db_path)
+    key_column, order_by, after_filter = MEDICATION_PAGE_SORTS[sort]
+
+    def load(conn):
+        params = {"user_id": user_id, "after_id": after_id, "limit": limit + 1}
+        where = "user_id = :user_id"
+        if after_id is not None:
+            anchor = conn.execute(
+                f"SELECT {key_column} FROM medications "
+                "WHERE id = ? AND user_id = ?",
+                (after_id, user_id),
+            ).fetchone()
+            # Âncora removida: recomeça da primeira página
+            if anchor is not None:
+                params["after_key"] = anchor[0]
+                where += f" AND {after_filter}"
+        cursor = _select_medications(
+            conn, f"WHERE {where} ORDER BY {order_by} LIMIT :limit", params
+        )
+        return cursor.fetchall()
+
+    key = ("page", str(db_path), user_id, after_id, limit, sort)
+    rows = _cached_rows(key, user_id, db_path, load)
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+# Expressão MATCH do FTS5 em que cada palavra digitada é prefixo de uma
+# palavra do nome (coluna `column`); None se não houver palavra. Sinais e
+# aspas são descartados, então o texto do usuário nunca vira sintaxe FTS5.
+def _fts_prefix_query(text, column="name"):
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " AND ".join(f'{column} : "{word}"*' for word in words)
+
+
+# Minúsculas e sem acentos, como o tokenizador dos índices FTS5
+def _fold(text):
+    return "".join(
+        char for char in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(char)
+    ).casefold()
+
+
+# Medicamentos do usuário com uma palavra do nome começando por cada palavra
+# de `query`, sem diferenciar maiúsculas nem acentos ("dipi sod" acha
+# "Dipirona Sódica"), pelo índice medications_fts, que também filtra o
+# usuário. Primeiro os nomes que começam pela primeira palavra buscada,
+# depois os mais curtos (o bm25 do FTS5 contaria os documentos de todos os
+# usuários a cada busca por prefixo). Sem texto, lista em ordem de nome.
+def search_medications(user_id, query, limit=20, db_path=None):
+    db_path = user_db_path(user_id, db_path)
+    query = query.strip()
+    with connect_db(db_path) as conn:
+        if not query:
+            cursor = _select_medications(
+                conn,
+                "WHERE user_id = ? ORDER BY name COLLATE NOCASE, id LIMIT ?",
+                (user_id, limit),
+            )
+            return cursor.fetchall()
+        match = _fts_prefix_query(query)
+        if match is None:
+            return []
+        cursor = _select_medications(
+            conn,
+            """
+            WHERE user_id = ? AND id IN (
+                SELECT rowid FROM medications_fts WHERE medications_fts MATCH ?
+            )
+            """,
+            (user_id, f'user_id : "{int(user_id)}" AND ({match})'),
+        )
+        first_word = _fold(re.search(r"\w+", query).group())
+        meds = cursor.fetchall()
+    meds.sort(
+        key=lambda med: (
+            not _fold(med.name).startswith(first_word),
+            len(med.name),
+            _fold(med.name),
+            med.id,
+        )
+    )
+    return meds[:limit]
+
+
+# Nomes examinados por search_medication_catalog antes de ordenar por uso
+CATALOG_CANDIDATES = 200
+
+
+# Nomes distintos já cadastrados por todos os usuários que combinam com
+# `query` (mesmas regras de search_medications), para sugerir a grafia mais
+# usada ao cadastrar: (name, uses), do mais usado para o menos. Só os
+# primeiros CATALOG_CANDIDATES nomes encontrados são ordenados, para que
+# buscas muito amplas (uma ou duas letras) não percorram o catálogo inteiro.
+# Cada shard tem seu catálogo; os usos do mesmo nome são somados.
+def search_medication_catalog(query, limit=10, db_path=None):
+    match = _fts_prefix_query(query)
+    if match is None:
+        return []
+    results = fan_out(lambda path: _search_catalog(match, limit, path), db_path)
+    if len(results) == 1:
+        return results[0]
+    uses, names = {}, {}
+    for rows in results:
+        for row in rows:
+            key = row["name"].casefold()
+            names.setdefault(key, row["name"])
+            uses[key] = uses.get(key, 0) + row["uses"]
+    ranked = sorted(uses, key=lambda key: (-uses[key], names[key]))
+    return [{"name": names[key], "uses": uses[key]} for key in ranked[:limit]]
+
+
+def _search_catalog(match, limit, db_path):
     with connect_db(db_path) as conn:
+        cursor = conn.execute(
+            """
+            SELECT c.name, c.uses
+            FROM (
+                SELECT rowid AS hit FROM medication_catalog_fts
+                WHERE medication_catalog_fts MATCH ?
+                LIMIT ?
+            )
+            JOIN medication_catalog c ON c.id = hit
+            ORDER BY c.uses DESC, c.name
+            LIMIT ?
+            """,
+            (match, CATALOG_CANDIDATES, limit),
+        )
+        return cursor.fetchall()
+
+
+# Usuários que possuem ao menos um medicamento, em ordem crescente
+def fetch_user_ids(db_path=None):
+    def load(path):
+        with connect_db(path) as conn:
+            cursor = conn.execute(
+                "SELECT DISTINCT user_id FROM medications ORDER BY user_id"
+            )
+            return [row["user_id"] for row in cursor]
+
+    return list(heapq.merge(*fan_out(load, db_path)))
+
+
+# Percorre os medicamentos em blocos de chunk_size linhas (fetchmany), em ordem
+# de user_id dentro de cada shard (um shard depois do outro), sem carregar a
+# tabela inteira na memória. Os medicamentos de um usuário nunca se dividem
+# entre shards. Cada bloco é uma MedicationTable montada direto das tuplas do
+# cursor.
+def iter_medication_chunks(user_ids=None, chunk_size=5000, db_path=None):
+    for chunks in iter_shard_chunks(user_ids, chunk_size, db_path):
+        yield from chunks
+
+
+# Um iterador de blocos por banco (shard): as linhas só vêm ordenadas por
+# user_id dentro de cada um
+def iter_shard_chunks(user_ids=None, chunk_size=5000, db_path=None):
+    if user_ids is None:
+        groups = {path: None for path in data_paths(db_path)}
+    else:
+        groups = group_by_path(
+            sorted(set(user_ids)), lambda user_id: user_db_path(user_id, db_path)
+        )
+    for path, group in groups.items():
+        yield _iter_medication_chunks(group, chunk_size, path)
+
+
+# Consultas de uma lista de usuários em partes de até _IN_CHUNK ids (o IN
+# nunca passa do limite de parâmetros do SQLite); com ids em ordem, as
+# partes saem em ordem de user_id
+def _user_id_chunks(user_ids):
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), _IN_CHUNK):
+        yield user_ids[start : start + _IN_CHUNK]
+
+
+def _iter_medication_chunks(user_ids, chunk_size, db_path):
+    if user_ids is None:
+        queries = [(f"SELECT {MEDICATION_SELECT} FROM medications ORDER BY user_id", ())]
+    else:
+        queries = (
+            (
+                f"SELECT {MEDICATION_SELECT} FROM medications "
+                f"WHERE user_id IN ({','.join('?' * len(chunk))}) ORDER BY user_id",
+                chunk,
+            )
+            for chunk in _user_id_chunks(user_ids)
+        )
+    conn = connect_db(db_path)
+    for sql, params in queries:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM medications WHERE id = ?", (med_id,))
-        return cursor.fetchone()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        try:
+            while rows := cursor.fetchmany(chunk_size):
+                yield MedicationTable.from_rows(rows)
+        finally:
+            cursor.close()
 
 
-def update_stock(med_id, new_stock, db_path=None):
-    db_path = db_path or get_db_path()
+def fetch_reference_medications(user_id, db_path=None):
+    db_path = user_db_path(user_id, db_path)
     with connect_db(db_path) as conn:
+        cursor = _select_medications(
+            conn, "WHERE user_id = ? AND is_reference = 1", (user_id,)
+        )
+        return cursor.fetchall()
+
+
+def get_medication_by_id(med_id, db_path=None):
+    db_path = medication_db_path(med_id, db_path)
+    key = ("one", str(db_path), med_id)
+    cached = _medications_cache.get(key)
+    db_version = _read_version(db_path)
+    if cached is not None and cached[0] == data_version(key[1], cached[1].user_id):
+        return cached[1]
+    # Só guarda o resultado se nenhuma escrita ocorreu durante a leitura
+    with connect_db(db_path) as conn:
+        row = _select_medications(conn, "WHERE id = ?", (med_id,)).fetchone()
+    if row is not None and data_version(key[1]) == db_version:
+        _medications_cache.set(key, (data_version(key[1], row.user_id), row))
+    return row
+
+
+# Grava o novo estoque e a diferença no livro como movimento `kind`
+# (um de logic.ledger.MOVEMENT_KINDS)
+def update_stock(med_id, new_stock, db_path=None, kind="adjustment"):
+    db_path = medication_db_path(med_id, db_path)
+    with connect_db(db_path) as conn:
+        record_stock_targets(conn, [(new_stock, med_id)], kind, day_number(date.today()))
         cursor = conn.cursor()
         cursor.execute(
-            "UPDATE medications SET stock_in_units = ? WHERE id = ?",
+            "UPDATE medications SET stock_in_units = ?, row_version = row_version + 1, "
+            "movements_since_snapshot = movements_since_snapshot + 1 "
+            "WHERE id = ? RETURNING user_id",
             (new_stock, med_id),
-        )  # noqa: E501
+        )
+        changed = cursor.fetchall()
+        take_snapshots(conn, "m.id = :med_id", {"med_id": med_id})
+        refresh_forecast(conn, [med_id] if changed else [])
         conn.commit()
+    for row in changed:
+        bump_data_version(row["user_id"], db_path)
 
 
 def delete_medication(med_id, db_path=None):
-    db_path = db_path or get_db_path()
+    db_path = medication_db_path(med_id, db_path)
     with connect_db(db_path) as conn:
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM medications WHERE id = ?", (med_id,))
+        cursor.execute(
+            "DELETE FROM medications WHERE id = ? RETURNING user_id", (med_id,)
+        )
+        changed = cursor.fetchall()
+        refresh_forecast(conn, [med_id])
         conn.commit()
+    for row in changed:
+        bump_data_version(row["user_id"], db_path)
+
+
+# Campos que a UnitOfWork pode gravar (o dono do medicamento não muda)
+EDITABLE_COLUMNS = frozenset(MEDICATION_COLUMNS) - {"user_id"}
+
+
+def _check_columns(fields):
+    unknown = set(fields) - EDITABLE_COLUMNS
+    if unknown:
+        raise ValueError(f"Campos inválidos: {', '.join(sorted(unknown))}")
+
+
+# Alterações nos medicamentos de um usuário acumuladas durante uma execução
+# da página e gravadas juntas por commit(), em uma única transação (com novas
+# tentativas se o banco estiver ocupado). Edições e compras do mesmo
+# medicamento viram um único UPDATE. Atualizações e remoções levam a
+# row_version que o usuário viu e só são aplicadas se ela ainda for a atual;
+# as demais são devolvidas por commit() como conflitos, sem sobrescrever a
+# alteração de outra sessão. Mudanças de estoque entram no livro
+# (logic.ledger): o valor digitado como ajuste e as compras como "purchase".
+class UnitOfWork:
+    def __init__(self, user_id, db_path=None):
+        self.user_id = user_id
+        self.db_path = user_db_path(user_id, db_path, assign=True)
+        self._inserts = []
+        self._updates = {}
+        self._deletes = {}
+
+    @property
+    def pending(self):
+        return bool(self._inserts or self._updates or self._deletes)
+
+    def add(self, **fields):
+        _check_columns(fields)
+        self._inserts.append(fields)
+
+    # [versão vista, campos, unidades compradas]; mantém a versão da primeira
+    # edição, que é a que o usuário viu
+    def _pending_update(self, med_id, row_version):
+        if med_id not in self._updates:
+            self._updates[med_id] = [row_version, {}, 0]
+        return self._updates[med_id]
+
+    def update(self, med_id, row_version, **fields):
+        _check_columns(fields)
+        if med_id not in self._deletes:
+            self._pending_update(med_id, row_version)[1].update(fields)
+
+    # Compra de `units` unidades: soma ao estoque (depois de um ajuste
+    # pendente do mesmo medicamento, se houver)
+    def purchase(self, med_id, row_version, units):
+        if units <= 0:
+            raise ValueError("A quantidade comprada deve ser positiva")
+        if med_id not in self._deletes:
+            self._pending_update(med_id, row_version)[2] += units
+
+    def delete(self, med_id, row_version):
+        previous = self._updates.pop(med_id, None)
+        self._deletes[med_id] = previous[0] if previous else row_version
+
+    def _apply_update(self, conn, med_id, row_version, fields, purchased):
+        params = {
+            **fields,
+            "id": med_id,
+            "user_id": self.user_id,
+            "row_version": row_version,
+            "day": day_number(date.today()),
+            "purchased": purchased,
+        }
+        guard = "id = :id AND user_id = :user_id AND row_version = :row_version"
+        assignments = [
+            f"{column} = :{column}" for column in fields if column != "stock_in_units"
+        ]
+        if "stock_in_units" in fields:
+            conn.execute(
+                INSERT_MOVEMENT_SQL
+                + "SELECT id, user_id, :day, 'adjustment', :stock_in_units - stock_in_units "
+                f"FROM medications WHERE {guard} AND stock_in_units != :stock_in_units",
+                params,
+            )
+            assignments.append("stock_in_units = :stock_in_units + :purchased")
+        elif purchased:
+            assignments.append("stock_in_units = stock_in_units + :purchased")
+        if "stock_in_units" in fields or purchased:
+            assignments.append("movements_since_snapshot = movements_since_snapshot + 1")
+        if purchased:
+            conn.execute(
+                INSERT_MOVEMENT_SQL
+                + "SELECT id, user_id, :day, 'purchase', :purchased "
+                f"FROM medications WHERE {guard}",
+                params,
+            )
+        assignments.append("row_version = row_version + 1")
+        cursor = conn.execute(
+            f"UPDATE medications SET {', '.join(assignments)} WHERE {guard}", params
+        )
+        return cursor.rowcount
+
+    def _apply(self, conn):
+        changed, conflicts = [], []
+        for med_id, (row_version, fields, purchased) in self._updates.items():
+            if self._apply_update(conn, med_id, row_version, fields, purchased):
+                changed.append(med_id)
+            else:
+                conflicts.append(med_id)
+        for med_id, row_version in self._deletes.items():
+            cursor = conn.execute(
+                "DELETE FROM medications "
+                "WHERE id = ? AND user_id = ? AND row_version = ?",
+                (med_id, self.user_id, row_version),
+            )
+            (changed if cursor.rowcount else conflicts).append(med_id)
+        for fields in self._inserts:
+            columns = ", ".join(("user_id", *fields))
+            placeholders = ", ".join(("?",) * (len(fields) + 1))
+            cursor = conn.execute(
+                f"INSERT INTO medications ({columns}) VALUES ({placeholders})",
+                (self.user_id, *fields.values()),
+            )
+            record_opening_stock(
+                conn, cursor.lastrowid, cursor.lastrowid, day_number(date.today())
+            )
+            changed.append(cursor.lastrowid)
+        take_snapshots(conn, *_id_filter(changed))
+        refresh_forecast(conn, changed)
+        return conflicts
+
+    # Grava tudo e devolve os ids em conflito (alterados ou removidos por
+    # outra sessão desde a leitura). As alterações pendentes são descartadas.
+    def commit(self):
+        if not self.pending:
+            return []
+        try:
+            conflicts = run_write_transaction(self._apply, self.db_path)
+        finally:
+            self._inserts, self._updates, self._deletes = [], {}, {}
+        bump_data_version(self.user_id, self.db_path)
+        return conflicts
+
+
+# Operações em lote: cada chamada roda em uma única transaction por shard com
+# executemany e devolve um resultado por item, na mesma ordem da entrada.
+
+
+# Recebe dicionários com as chaves de MEDICATION_COLUMNS e devolve os ids criados
+def insert_medications_many(medications, db_path=None):
+    groups = group_by_path(
+        enumerate(medications),
+        lambda item: user_db_path(item[1]["user_id"], db_path, assign=True),
+    )
+    med_ids = [None] * len(medications)
+    for path, items in groups.items():
+        created = _insert_medications_many([med for _, med in items], path)
+        for (position, _), med_id in zip(items, created):
+            med_ids[position] = med_id
+    return med_ids
+
+
+def _insert_medications_many(medications, db_path):
+    rows = [tuple(med.get(col) for col in MEDICATION_COLUMNS) for med in medications]
+    if not rows:
+        return []
+    columns = ", ".join(MEDICATION_COLUMNS)
+    placeholders = ", ".join("?" * len(MEDICATION_COLUMNS))
+    with write_transaction(db_path) as conn:
+        # Com a trava de escrita em mãos, AUTOINCREMENT gera ids consecutivos
+        first_id = conn.execute("""
+            SELECT MAX(
+                COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'medications'), 0),
+                COALESCE((SELECT MAX(id) FROM medications), 0)
+            ) + 1
+        """).fetchone()[0]
+        conn.executemany(
+            f"INSERT INTO medications ({columns}) VALUES ({placeholders})", rows
+        )
+        med_ids = list(range(first_id, first_id + len(rows)))
+        record_opening_stock(conn, med_ids[0], med_ids[-1], day_number(date.today()))
+        refresh_forecast(conn, med_ids)
+    for user_id in {row[0] for row in rows}:
+        bump_data_version(user_id, db_path)
+    return med_ids
+
+
+# Recebe pares (med_id, novo_estoque); devolve True para cada id atualizado.
+# As diferenças vão para o livro como movimentos `kind`.
+def update_stock_many(updates, db_path=None, kind="adjustment"):
+    updates = list(updates)
+    groups = group_by_path(updates, lambda item: medication_db_path(item[0], db_path))
+    updated = {}
+    for path, items in groups.items():
+        results = _update_stock_many(items, path, kind)
+        updated.update(zip((med_id for med_id, _ in items), results))
+    return [updated[med_id] for med_id, _ in updates]
+
+
+def _update_stock_many(updates, db_path, kind):
+    updates = [(new_stock, med_id) for med_id, new_stock in updates]
+    if not updates:
+        return []
+    med_ids = [med_id for _, med_id in updates]
+    with write_transaction(db_path) as conn:
+        owners = _medication_owners(conn, med_ids)
+        record_stock_targets(conn, updates, kind, day_number(date.today()))
+        conn.executemany(
+            "UPDATE medications SET stock_in_units = ?, row_version = row_version + 1, "
+            "movements_since_snapshot = movements_since_snapshot + 1 WHERE id = ?",
+            updates,
+        )
+        take_snapshots(conn, *_id_filter(list(owners)))
+        refresh_forecast(conn, list(owners))
+    for user_id in set(owners.values()):
+        bump_data_version(user_id, db_path)
+    return [med_id in owners for med_id in med_ids]
+
+
+# Devolve True para cada id efetivamente removido
+def delete_medications_many(med_ids, db_path=None):
+    med_ids = list(med_ids)
+    groups = group_by_path(med_ids, lambda med_id: medication_db_path(med_id, db_path))
+    deleted = {}
+    for path, group in groups.items():
+        deleted.update(zip(group, _delete_medications_many(group, path)))
+    return [deleted[med_id] for med_id in med_ids]
+
+
+def _delete_medications_many(med_ids, db_path):
+    if not med_ids:
+        return []
+    with write_transaction(db_path) as conn:
+        owners = _medication_owners(conn, med_ids)
+        conn.executemany(
+            "DELETE FROM medications WHERE id = ?", [(med_id,) for med_id in med_ids]
+        )
+        refresh_forecast(conn, list(owners))
+    for user_id in set(owners.values()):
+        bump_data_version(user_id, db_path)
+    return [med_id in owners for med_id in med_ids]
+
+
+# Livro de estoque (logic.ledger). Histórico de um medicamento do mais
+# recente para o mais antigo, por páginas: before_id é o id do último
+# movimento da página anterior (paginação por chave, pelo índice
+# (medication_id, id)).
+def fetch_stock_movements(med_id, user_id, before_id=None, limit=50, db_path=None):
+    db_path = user_db_path(user_id, db_path)
+    with connect_db(db_path) as conn:
+        cursor = conn.execute(
+            """
+            SELECT id, day, kind, quantity FROM stock_movements
+            WHERE medication_id = ? AND user_id = ? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            (med_id, user_id, before_id if before_id is not None else 2**63 - 1, limit),
+        )
+        return cursor.fetchall()
+
+
+# Saldo do medicamento no fim do dia (date) informado, ou o atual
+def fetch_stock_balance(med_id, day=None, db_path=None):
+    db_path = medication_db_path(med_id, db_path)
+    with connect_db(db_path) as conn:
+        return stock_balance(conn, med_id, day_number(day) if day else None)
+
+
+# Medicamentos cujo estoque não confere com o livro, do usuário ou de todos
+def reconcile_stock(user_id=None, db_path=None):
+    def load(path):
+        with connect_db(path) as conn:
+            return reconcile(conn, user_id)
+
+    if user_id is not None:
+        return load(user_db_path(user_id, db_path))
+    return [row for rows in fan_out(load, db_path) for row in rows]
+
+
+# Previsões de falta de estoque (tabela medication_forecast), por usuário
+# ou por intervalo de dias, sempre por índice.
+def fetch_forecasts(user_id, db_path=None):
+    db_path = user_db_path(user_id, db_path)
+    with connect_db(db_path) as conn:
+        cursor = conn.execute(
+            """
+            SELECT m.id, m.name, f.stockout_day, f.reorder_day
+            FROM medication_forecast f JOIN medications m ON m.id = f.medication_id
+            WHERE f.user_id = ?
+            ORDER BY f.stockout_day
+            """,
+            (user_id,),
+        )
+        return cursor.fetchall()
+
+
+def fetch_stockouts_between(start_day, end_day, user_ids=None, db_path=None):
+    if user_ids is None:
+        return list(
+            heapq.merge(
+                *fan_out(
+                    lambda path: _fetch_stockouts(path, start_day, end_day), db_path
+                ),
+                key=lambda row: row["stockout_day"],
+            )
+        )
+    groups = group_by_path(
+        sorted(set(user_ids)), lambda user_id: user_db_path(user_id, db_path)
+    )
+    return list(
+        heapq.merge(
+            *(
+                _fetch_stockouts(path, start_day, end_day, chunk)
+                for path, group in groups.items()
+                for chunk in _user_id_chunks(group)
+            ),
+            key=lambda row: row["stockout_day"],
+        )
+    )
+
+
+def _fetch_stockouts(db_path, start_day, end_day, user_ids=None):
+    params = [start_day, end_day]
+    user_filter = ""
+    if user_ids is not None:
+        user_filter = f"AND f.user_id IN ({','.join('?' * len(user_ids))})"
+        params.extend(user_ids)
+    with connect_db(db_path) as conn:
+        cursor = conn.execute(
+            f"""
+            SELECT f.user_id, m.id, m.name, f.stockout_day, f.reorder_day
+            FROM medication_forecast f JOIN medications m ON m.id = f.medication_id
+            WHERE f.stockout_day BETWEEN ? AND ? {user_filter}
+            ORDER BY f.stockout_day
+            """,
+            params,
+        )
+        return cursor.fetchall()
+
+
+def fetch_forecast_cycles(med_id, db_path=None):
+    db_path = medication_db_path(med_id, db_path)
+    with connect_db(db_path) as conn:
+        cursor = conn.execute(
+            "SELECT cycle, refill_day, projected_stock FROM medication_forecast_cycles "
+            "WHERE medication_id = ? ORDER BY cycle",
+            (med_id,),
+        )
+        return cursor.fetchall()
+
+
+def refresh_forecasts(med_ids=None, user_id=None, db_path=None):
+    if med_ids is not None:
+        groups = group_by_path(med_ids, lambda med_id: medication_db_path(med_id, db_path))
+        for path, group in groups.items():
+            with write_transaction(path) as conn:
+                refresh_forecast(conn, group)
+        return
+
+    def refresh_all(path):
+        with write_transaction(path) as conn:
+            refresh_all_forecasts(conn, user_id)
+
+    if user_id is not None:
+        refresh_all(user_db_path(user_id, db_path))
+    else:
+        fan_out(refresh_all, db_path)
+
+
+# Execução do agendador (refill_scheduler.py) no dia informado, ou None, no
+# shard do usuário. Sem user_id, junta as execuções de todos os shards
+# (combine_scheduler_runs); None se algum shard ainda não começou o dia.
+def fetch_scheduler_run(run_day, user_id=None, db_path=None):
+    def load(path):
+        with connect_db(path) as conn:
+            cursor = conn.execute(
+                "SELECT * FROM scheduler_runs WHERE run_day = ?", (run_day,)
+            )
+            return cursor.fetchone()
+
+    if user_id is not None:
+        return load(user_db_path(user_id, db_path))
+    runs = fan_out(load, db_path)
+    if any(run is None for run in runs):
+        return None
+    return combine_scheduler_runs(runs)
+
+
+# Uma linha de scheduler_runs por shard vira um resumo só: contagens
+# somadas e finished_at preenchido apenas quando todos os shards terminaram
+def combine_scheduler_runs(runs):
+    if len(runs) == 1:
+        return runs[0]
+    finished = [run["finished_at"] for run in runs]
+    return {
+        "run_day": runs[0]["run_day"],
+        "consumed": sum(run["consumed"] for run in runs),
+        "refilled": sum(run["refilled"] for run in runs),
+        "skipped": sum(run["skipped"] for run in runs),
+        "started_at": min(run["started_at"] for run in runs),
+        "finished_at": None if None in finished else max(finished),
+    }
+
+
+# Resultado do reabastecimento dos medicamentos de referência do usuário
+# na data de compra informada
+def fetch_refill_events(user_id, refill_day, db_path=None):
+    db_path = user_db_path(user_id, db_path)
+    with connect_db(db_path) as conn:
+        cursor = conn.execute(
+            """
+            SELECT m.id, m.name, m.prescription_expiry, e.outcome, e.units
+            FROM refill_events e JOIN medications m ON m.id = e.medication_id
+            WHERE e.user_id = ? AND e.refill_day = ?
+            ORDER BY m.name
+            """,
+            (user_id, refill_day),
+        )
+        return cursor.fetchall()
@@ -0,0 +1,155 @@
+from datetime import date, timedelta
+
+from logic.config import get_default_refill_day, get_default_validity_days, load_config
+
+REFILL_CYCLE_DAYS = 30
+# Ciclos de compra projetados por medicamento
+FORECAST_CYCLES = 3
+DEFAULT_REORDER_LEAD_DAYS = 7
+# Reposição automática do medicamento de referência: 30 dias de dose, desde
+# que a receita esteja válida e não tenha mais de 6 meses no dia da compra
+# (o prazo vem de user_settings.validity_days de cada usuário).
+REFERENCE_DAYS = 30
+PRESCRIPTION_MAX_AGE_DAYS = 180
+
+_EPOCH = date(1970, 1, 1)
+_IN_CHUNK = 500
+
+
+def day_number(value):
+    return (value - _EPOCH).days
+
+
+def from_day_number(day):
+    return _EPOCH + timedelta(days=day)
+
+
+def can_refill(expiry_day, refill_day, max_age_days=PRESCRIPTION_MAX_AGE_DAYS):
+    return (
+        expiry_day is not None
+        and expiry_day >= refill_day
+        and expiry_day - max_age_days >= refill_day
+    )
+
+
+# Projeção de um medicamento a partir do estoque registrado no dia
+# consumed_through_day. Devolve (dia_da_falta, [(ciclo, dia_da_compra,
+# estoque_previsto_antes_da_compra), ...]); dia_da_falta é None quando a
+# dose é zero. Estoque previsto negativo indica quantas unidades faltarão.
+def project_medication(
+    med,
+    first_refill_day,
+    cycles=FORECAST_CYCLES,
+    max_age_days=PRESCRIPTION_MAX_AGE_DAYS,
+):
+    dosage = med["dosage_per_intake"] or 0
+    level = med["stock_in_units"]
+    day = med["consumed_through_day"]
+    stockout_day = None
+    projection = []
+    for cycle in range(cycles):
+        refill_day = first_refill_day + cycle * REFILL_CYCLE_DAYS
+        elapsed = max(refill_day - day, 0)
+        before_refill = level - dosage * elapsed
+        if stockout_day is None and dosage and before_refill < 0:
+            stockout_day = day + int(level // dosage)
+        projection.append((cycle, refill_day, before_refill))
+        level, day = max(before_refill, 0), max(refill_day, day)
+        if med["is_reference"] and can_refill(
+            med["prescription_expiry_day"], refill_day, max_age_days
+        ):
+            level += REFERENCE_DAYS * dosage
+    if stockout_day is None and dosage:
+        stockout_day = day + int(level // dosage)
+    return stockout_day, projection
+
+
+# Próxima data de compra a partir da data base, em forma fechada: não
+# depende de quantos ciclos se passaram desde a data base.
+def next_refill_date(refill_base, today=None, cycle_days=REFILL_CYCLE_DAYS):
+    today = today or date.today()
+    if refill_base >= today:
+        return refill_base
+    cycles = -(-(today - refill_base).days // cycle_days)
+    return refill_base + timedelta(days=cycles * cycle_days)
+
+
+# Data de compra mais recente até hoje (inclusive), ou None se a data base
+# ainda não chegou.
+def last_refill_date(refill_base, today=None, cycle_days=REFILL_CYCLE_DAYS):
+    today = today or date.today()
+    if refill_base > today:
+        return None
+    cycles = (today - refill_base).days // cycle_days
+    return refill_base + timedelta(days=cycles * cycle_days)
+
+
+# Recalcula a previsão apenas dos medicamentos informados, dentro da
+# transação do chamador; ids que não existem mais têm a previsão removida.
+# Cada medicamento usa a data base de compra e o prazo de receita do seu
+# usuário (user_settings), ou os padrões do config.json se não houver.
+def refresh_forecast(conn, med_ids, today=None):
+    med_ids = list(med_ids)
+    if not med_ids:
+        return
+    today = today or date.today()
+    default_refill_day = day_number(get_default_refill_day())
+    default_validity_days = get_default_validity_days()
+    lead_days = int(load_config().get("reorder_lead_days", DEFAULT_REORDER_LEAD_DAYS))
+    first_refill_days = {}
+    for start in range(0, len(med_ids), _IN_CHUNK):
+        chunk = med_ids[start : start + _IN_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        conn.execute(
+            f"DELETE FROM medication_forecast_cycles WHERE medication_id IN ({placeholders})",
+            chunk,
+        )
+        conn.execute(
+            f"DELETE FROM medication_forecast WHERE medication_id IN ({placeholders})",
+            chunk,
+        )
+        rows = conn.execute(
+            f"""
+            SELECT m.id, m.user_id, m.stock_in_units, m.dosage_per_intake,
+                   m.consumed_through_day, m.is_reference, m.prescription_expiry_day,
+                   s.refill_day, s.validity_days
+            FROM medications m LEFT JOIN user_settings s ON s.user_id = m.user_id
+            WHERE m.id IN ({placeholders})
+            """,
+            chunk,
+        ).fetchall()
+        forecasts, cycles = [], []
+        for med in rows:
+            refill_base = med["refill_day"]
+            if refill_base is None:
+                refill_base = default_refill_day
+            if refill_base not in first_refill_days:
+                first_refill_days[refill_base] = day_number(
+                    next_refill_date(from_day_number(refill_base), today)
+                )
+            stockout_day, projection = project_medication(
+                med,
+                first_refill_days[refill_base],
+                max_age_days=med["validity_days"] or default_validity_days,
+            )
+            reorder_day = stockout_day - lead_days if stockout_day is not None else None
+            forecasts.append((med["id"], med["user_id"], stockout_day, reorder_day))
+            cycles.extend((med["id"], *cycle) for cycle in projection)
+        conn.executemany(
+            "INSERT INTO medication_forecast "
+            "(medication_id, user_id, stockout_day, reorder_day) VALUES (?, ?, ?, ?)",
+            forecasts,
+        )
+        conn.executemany(
+            "INSERT INTO medication_forecast_cycles "
+            "(medication_id, cycle, refill_day, projected_stock) VALUES (?, ?, ?, ?)",
+            cycles,
+        )
+
+
+def refresh_all_forecasts(conn, user_id=None, today=None):
+    if user_id is None:
+        cursor = conn.execute("SELECT id FROM medications")
+    else:
+        cursor = conn.execute("SELECT id FROM medications WHERE user_id = ?", (user_id,))
+    refresh_forecast(conn, [row["id"] for row in cursor.fetchall()], today)
@@ -0,0 +1,229 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from logic.config import load_config
+
+logger = logging.getLogger("controle_medicamentos.db")
+
+DEFAULT_SLOW_QUERY_MS = 100
+# Consultas guardadas individualmente por execução; acima disso só os totais
+MAX_RECORDED_QUERIES = 1000
+# Linhas lidas por vez ao iterar um cursor: o tempo e a contagem são
+# acumulados por bloco, não por linha
+ITER_CHUNK_SIZE = 256
+
+_current_run = ContextVar("current_run", default=None)
+
+
+def _log(level, event, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields}, ensure_ascii=False))
+
+
+# Limite de consulta lenta: lido do config.json em configure_logging e a
+# cada start_run, não a cada consulta
+_slow_query_ms = None
+
+
+def refresh_slow_query_ms():
+    global _slow_query_ms
+    _slow_query_ms = float(load_config().get("slow_query_ms", DEFAULT_SLOW_QUERY_MS))
+    return _slow_query_ms
+
+
+def slow_query_ms():
+    if _slow_query_ms is None:
+        return refresh_slow_query_ms()
+    return _slow_query_ms
+
+
+# Estatísticas de uma execução do script Streamlit ou de um comando de CLI.
+# As consultas feitas em paralelo nos shards (database.fan_out) somam aqui
+# a partir de várias threads.
+class RunStats:
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.queries = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.slow_queries = 0
+        self.connections = 0
+        self.connect_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, record):
+        with self._lock:
+            self.query_count += 1
+            self.query_seconds += record["seconds"]
+            self.rows += record["rows"]
+            self.slow_queries += record["slow"]
+            if len(self.queries) < MAX_RECORDED_QUERIES:
+                self.queries.append(record)
+
+    def add_connection(self, seconds):
+        with self._lock:
+            self.connections += 1
+            self.connect_seconds += seconds
+
+    def summary(self):
+        return {
+            "run": self.label,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "queries": self.query_count,
+            "query_ms": round(self.query_seconds * 1000, 3),
+            "rows": self.rows,
+            "slow_queries": self.slow_queries,
+            "connections_opened": self.connections,
+            "connect_ms": round(self.connect_seconds * 1000, 3),
+        }
+
+
+def start_run(label):
+    refresh_slow_query_ms()
+    stats = RunStats(label)
+    _current_run.set(stats)
+    return stats
+
+
+def current_run():
+    return _current_run.get()
+
+
+def finish_run():
+    stats = _current_run.get()
+    if stats is None:
+        return None
+    _current_run.set(None)
+    _log(logging.INFO, "run", **stats.summary())
+    return stats
+
+
+def record_connection(db_path, seconds):
+    stats = _current_run.get()
+    if stats is not None:
+        stats.add_connection(seconds)
+    _log(logging.DEBUG, "connect", db=str(db_path), ms=round(seconds * 1000, 3))
+
+
+# SQL em uma linha só, para os logs; as instruções se repetem muito
+@lru_cache(maxsize=1024)
+def _normalize_sql(sql):
+    return " ".join(sql.split())
+
+
+# Cursor que mede cada instrução: o tempo do execute somado ao das leituras
+# (fetch*). O registro é fechado quando as linhas acabam, quando o cursor
+# executa outra instrução ou quando é descartado.
+class InstrumentedCursor(sqlite3.Cursor):
+    _record = None
+
+    def _start(self, sql, started):
+        self._finish()
+        self._record = {"sql": _normalize_sql(sql), "seconds": 0.0, "rows": 0}
+        self._add(started)
+
+    def _add(self, started, rows=0):
+        self._record["seconds"] += time.perf_counter() - started
+        self._record["rows"] += rows
+
+    def _finish(self):
+        record, self._record = self._record, None
+        if record is None:
+            return
+        if record["rows"] == 0 and self.rowcount > 0:
+            record["rows"] = self.rowcount
+        ms = record["seconds"] * 1000
+        record["slow"] = ms >= slow_query_ms()
+        stats = _current_run.get()
+        if stats is not None:
+            stats.add_query(record)
+        level = logging.WARNING if record["slow"] else logging.DEBUG
+        _log(level, "query", sql=record["sql"], ms=round(ms, 3), rows=record["rows"])
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._start(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._start(sql, started)
+            self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._record is not None:
+            self._add(started, row is not None)
+            if row is None:
+                self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(size if size is not None else self.arraysize)
+        if self._record is not None:
+            self._add(started, len(rows))
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._record is not None:
+            self._add(started, len(rows))
+            self._finish()
+        return rows
+
+    def __iter__(self):
+        return self._iter_rows()
+
+    def _iter_rows(self):
+        while rows := self.fetchmany(ITER_CHUNK_SIZE):
+            yield from rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# Configura a saída dos logs estruturados (uma linha JSON por evento)
+def configure_logging(level=None):
+    level = level or load_config().get("log_level", "WARNING")
+    refresh_slow_query_ms()
+    root = logging.getLogger("controle_medicamentos")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        root.addHandler(handler)
+    root.setLevel(level)
@@ -0,0 +1,165 @@
+# Livro de movimentos de estoque (stock_movements) e saldos periódicos
+# (stock_snapshots). Toda alteração de medications.stock_in_units grava aqui a
+# diferença, com o tipo do movimento; o saldo de um medicamento em qualquer
+# dia é o último snapshot até aquele dia mais os movimentos seguintes, e um
+# snapshot novo é gravado a cada ~SNAPSHOT_INTERVAL movimentos, então a soma
+# percorre no máximo um intervalo. Os dias dos movimentos de um medicamento não
+# diminuem (cada movimento leva o dia em que foi gravado).
+
+MOVEMENT_KINDS = ("refill", "purchase", "consumption", "adjustment")
+# Movimentos por medicamento entre dois snapshots
+SNAPSHOT_INTERVAL = 32
+# Diferenças de saldo menores que isso são arredondamento de ponto flutuante
+BALANCE_TOLERANCE = 1e-6
+
+INSERT_MOVEMENT_SQL = (
+    "INSERT INTO stock_movements (medication_id, user_id, day, kind, quantity) "
+)
+
+
+# Grava movimentos (medication_id, user_id, dia, tipo, quantidade); a
+# quantidade é positiva para entradas e negativa para saídas
+def record_movements(conn, movements):
+    conn.executemany(INSERT_MOVEMENT_SQL + "VALUES (?, ?, ?, ?, ?)", movements)
+
+
+# Antes de gravar novos estoques (novo_estoque, med_id), registra a diferença
+# em relação ao estoque atual como movimento `kind`
+def record_stock_targets(conn, updates, kind, day):
+    conn.executemany(
+        INSERT_MOVEMENT_SQL
+        + "SELECT id, user_id, ?, ?, ? - stock_in_units FROM medications "
+        "WHERE id = ? AND stock_in_units != ?",
+        [(day, kind, new_stock, med_id, new_stock) for new_stock, med_id in updates],
+    )
+
+
+# Estoque inicial dos medicamentos com id entre first_id e last_id
+# (recém-inseridos) como ajuste
+def record_opening_stock(conn, first_id, last_id, day):
+    conn.execute(
+        INSERT_MOVEMENT_SQL
+        + "SELECT id, user_id, ?, 'adjustment', stock_in_units FROM medications "
+        "WHERE id BETWEEN ? AND ? AND stock_in_units != 0",
+        (day, first_id, last_id),
+    )
+
+
+# Grava um snapshot para cada medicamento selecionado por `where` (condição
+# sobre medications m, com parâmetros nomeados em `params`) que acumulou
+# movimentos suficientes desde o último (medications.movements_since_snapshot,
+# incrementado por quem altera o estoque) e zera o contador. O limite varia
+# por medicamento entre interval / 2 e 1,5 × interval, para que os snapshots
+# de medicamentos criados juntos não caiam todos no mesmo dia. O saldo vem do
+# próprio livro (snapshot anterior + movimentos), não de stock_in_units, para
+# que a conciliação compare as duas fontes. Devolve a quantidade gravada.
+def take_snapshots(conn, where, params=None, interval=SNAPSHOT_INTERVAL):
+    snapshotted = conn.execute(
+        f"""
+        WITH last AS (
+            SELECT m.id AS medication_id,
+                   COALESCE((
+                       SELECT movement_id FROM stock_snapshots s
+                       WHERE s.medication_id = m.id
+                       ORDER BY movement_id DESC LIMIT 1
+                   ), 0) AS movement_id
+            FROM medications m
+            WHERE ({where})
+              AND m.movements_since_snapshot >= :half + m.id % :interval
+        ),
+        tail AS (
+            SELECT last.medication_id, last.movement_id AS base_id,
+                   SUM(sm.quantity) AS delta, MAX(sm.id) AS last_id,
+                   MAX(sm.day) AS last_day
+            FROM last
+            JOIN stock_movements sm
+              ON sm.medication_id = last.medication_id AND sm.id > last.movement_id
+            GROUP BY last.medication_id
+        )
+        INSERT INTO stock_snapshots (medication_id, movement_id, day, balance)
+        SELECT tail.medication_id, tail.last_id, tail.last_day,
+               COALESCE((
+                   SELECT balance FROM stock_snapshots s
+                   WHERE s.medication_id = tail.medication_id
+                     AND s.movement_id = tail.base_id
+               ), 0) + tail.delta
+        FROM tail
+        WHERE true
+        RETURNING medication_id
+        """,
+        {**(params or {}), "half": interval // 2, "interval": interval},
+    ).fetchall()
+    conn.executemany(
+        "UPDATE medications SET movements_since_snapshot = 0 WHERE id = ?",
+        [(row[0],) for row in snapshotted],
+    )
+    return len(snapshotted)
+
+
+# Saldo do medicamento no fim do dia `day` (None = saldo atual). Lê o último
+# snapshot até o dia e soma só os movimentos entre ele e o snapshot seguinte.
+# Devolve None para dias anteriores ao início do livro do medicamento.
+def stock_balance(conn, med_id, day=None):
+    day = day if day is not None else 2**62
+    row = conn.execute(
+        """
+        WITH base AS (
+            SELECT movement_id, balance FROM (
+                SELECT movement_id, balance FROM stock_snapshots
+                WHERE medication_id = :med_id AND day <= :day
+                UNION ALL
+                -- Sem snapshot inicial (medicamento criado depois do livro):
+                -- o saldo parte de zero
+                SELECT 0, 0 WHERE NOT EXISTS (
+                    SELECT 1 FROM stock_snapshots
+                    WHERE medication_id = :med_id AND movement_id = 0
+                )
+            )
+            ORDER BY movement_id DESC LIMIT 1
+        )
+        SELECT base.balance + COALESCE((
+            SELECT SUM(quantity) FROM stock_movements
+            WHERE medication_id = :med_id
+              AND id > base.movement_id
+              AND id <= COALESCE((
+                  SELECT MIN(movement_id) FROM stock_snapshots
+                  WHERE medication_id = :med_id AND movement_id > base.movement_id
+              ), 9223372036854775807)
+              AND day <= :day
+        ), 0)
+        FROM base
+        """,
+        {"med_id": med_id, "day": day},
+    ).fetchone()
+    return row[0] if row is not None else None
+
+
+# Medicamentos cujo estoque em medications difere do saldo do livro
+# (último snapshot + movimentos seguintes): (id, user_id, name,
+# stock_in_units, saldo_do_livro)
+def reconcile(conn, user_id=None):
+    user_filter = "WHERE m.user_id = ?" if user_id is not None else ""
+    cursor = conn.execute(
+        f"""
+        SELECT id, user_id, name, stock_in_units, ledger_balance FROM (
+            SELECT m.id, m.user_id, m.name, m.stock_in_units,
+                   COALESCE(s.balance, 0) + COALESCE((
+                       SELECT SUM(quantity) FROM stock_movements sm
+                       WHERE sm.medication_id = m.id
+                         AND sm.id > COALESCE(s.movement_id, 0)
+                   ), 0) AS ledger_balance
+            FROM medications m
+            LEFT JOIN stock_snapshots s
+              ON s.medication_id = m.id
+             AND s.movement_id = (
+                 SELECT MAX(movement_id) FROM stock_snapshots
+                 WHERE medication_id = m.id
+             )
+            {user_filter}
+        )
+        WHERE ABS(stock_in_units - ledger_balance) > ?
+        ORDER BY id
+        """,
+        (*((user_id,) if user_id is not None else ()), BALANCE_TOLERANCE),
+    )
+    return cursor.fetchall()
@@ -0,0 +1,454 @@
+# Migrações versionadas do esquema, controladas por PRAGMA user_version.
+# Cada passo recebe a conexão já dentro de uma transação; a lista só cresce:
+# nunca altere um passo publicado, acrescente um novo ao final.
+
+# Converte uma data ISO (texto) em número de dias desde 1970-01-01
+DAY_NUMBER_SQL = "CAST(julianday({column}) - 2440587.5 AS INTEGER)"
+
+# Versão que cria as tabelas de previsão; bancos vindos de antes dela as
+# recebem vazias e são preenchidos depois dos passos (migrate(after=...))
+FORECAST_TABLES_VERSION = 4
+
+
+def _v1_base_tables(conn):
+    # Cria tabela de usuários (e-mail único, senha hash)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL
+        )
+    """)
+    # Cria tabela de medicamentos com user_id
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            dosage_per_intake REAL NOT NULL,
+            type TEXT,
+            schedule TEXT,
+            packaging TEXT,
+            quantity_per_package INTEGER NOT NULL,
+            stock_in_units INTEGER NOT NULL,
+            status TEXT,
+            is_reference INTEGER,
+            prescription_expiry DATE,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    """)
+
+
+def _v2_expiry_day_and_indexes(conn):
+    # Validade da receita como número de dias, para comparações por intervalo
+    conn.execute("ALTER TABLE medications ADD COLUMN prescription_expiry_day INTEGER")
+    expiry_day = DAY_NUMBER_SQL.format(column="prescription_expiry")
+    conn.execute(f"UPDATE medications SET prescription_expiry_day = {expiry_day}")
+    new_expiry_day = DAY_NUMBER_SQL.format(column="NEW.prescription_expiry")
+    conn.execute(f"""
+        CREATE TRIGGER medications_expiry_day_insert
+        AFTER INSERT ON medications
+        BEGIN
+            UPDATE medications SET prescription_expiry_day = {new_expiry_day}
+            WHERE id = NEW.id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER medications_expiry_day_update
+        AFTER UPDATE OF prescription_expiry ON medications
+        BEGIN
+            UPDATE medications SET prescription_expiry_day = {new_expiry_day}
+            WHERE id = NEW.id;
+        END
+    """)
+    conn.execute(
+        "CREATE INDEX idx_medications_user_reference "
+        "ON medications (user_id, is_reference)"
+    )
+    conn.execute(
+        "CREATE INDEX idx_medications_user_expiry "
+        "ON medications (user_id, prescription_expiry_day)"
+    )
+
+
+def _v3_consumed_through_day(conn):
+    # Último dia cujo consumo já foi descontado do estoque. Registros existentes
+    # começam em "hoje" para não descontar retroativamente dias já ajustados.
+    today = DAY_NUMBER_SQL.format(column="date('now', 'localtime')")
+    conn.execute("ALTER TABLE medications ADD COLUMN consumed_through_day INTEGER")
+    conn.execute(f"UPDATE medications SET consumed_through_day = {today}")
+    conn.execute(f"""
+        CREATE TRIGGER medications_consumed_through_day_insert
+        AFTER INSERT ON medications
+        WHEN NEW.consumed_through_day IS NULL
+        BEGIN
+            UPDATE medications SET consumed_through_day = {today}
+            WHERE id = NEW.id;
+        END
+    """)
+
+
+def _v4_forecast_tables(conn):
+    # Previsão materializada de falta de estoque, atualizada por medicamento
+    conn.execute("""
+        CREATE TABLE medication_forecast (
+            medication_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            stockout_day INTEGER,
+            reorder_day INTEGER
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX idx_forecast_stockout ON medication_forecast (stockout_day)"
+    )
+    conn.execute(
+        "CREATE INDEX idx_forecast_user_stockout "
+        "ON medication_forecast (user_id, stockout_day)"
+    )
+    conn.execute("""
+        CREATE TABLE medication_forecast_cycles (
+            medication_id INTEGER NOT NULL,
+            cycle INTEGER NOT NULL,
+            refill_day INTEGER NOT NULL,
+            projected_stock REAL NOT NULL,
+            PRIMARY KEY (medication_id, cycle)
+        ) WITHOUT ROWID
+    """)
+    # O preenchimento depende do código de previsão atual e do esquema final,
+    # e por isso não é um passo: ver FORECAST_TABLES_VERSION
+
+
+def _v5_stock_exhaustion_day(conn):
+    # Dia em que o estoque acaba no ritmo atual (NULL se a dose for zero),
+    # indexado para que "medicamentos com alerta" seja uma busca por intervalo
+    exhaustion = (
+        "CASE WHEN {row}.dosage_per_intake > 0 THEN {row}.consumed_through_day"
+        " + CAST({row}.stock_in_units / {row}.dosage_per_intake AS INTEGER) END"
+    )
+    conn.execute("ALTER TABLE medications ADD COLUMN stock_exhaustion_day INTEGER")
+    conn.execute(
+        "UPDATE medications SET stock_exhaustion_day = "
+        + exhaustion.format(row="medications")
+    )
+    new_exhaustion = exhaustion.format(row="NEW")
+    # O consumo diário desloca estoque e consumed_through_day juntos e não
+    # muda o resultado; o WHEN evita regravar a linha nesses casos.
+    for event in (
+        "INSERT",
+        "UPDATE OF stock_in_units, dosage_per_intake, consumed_through_day",
+    ):
+        name = "insert" if event == "INSERT" else "update"
+        conn.execute(f"""
+            CREATE TRIGGER medications_exhaustion_day_{name}
+            AFTER {event} ON medications
+            WHEN NEW.stock_exhaustion_day IS NOT ({new_exhaustion})
+            BEGIN
+                UPDATE medications SET stock_exhaustion_day = {new_exhaustion}
+                WHERE id = NEW.id;
+            END
+        """)
+    conn.execute(
+        "CREATE INDEX idx_medications_user_exhaustion "
+        "ON medications (user_id, stock_exhaustion_day)"
+    )
+
+
+def _v6_pagination_indexes(conn):
+    # Paginação por chave (keyset) em ordem de id ou de nome, e busca por
+    # prefixo do nome (LIKE usa o índice NOCASE)
+    conn.execute(
+        "CREATE INDEX idx_medications_user_id ON medications (user_id, id)"
+    )
+    conn.execute(
+        "CREATE INDEX idx_medications_user_name "
+        "ON medications (user_id, name COLLATE NOCASE)"
+    )
+
+
+def _v7_scheduler_tables(conn):
+    # Uma linha por dia de execução do agendador (refill_scheduler.py);
+    # last_user_id marca até onde o dia já foi processado, para retomar
+    # depois de uma falha. refill_day é a data de compra atendida no dia.
+    conn.execute("""
+        CREATE TABLE scheduler_runs (
+            run_day INTEGER PRIMARY KEY,
+            refill_day INTEGER,
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            consumed INTEGER NOT NULL DEFAULT 0,
+            refilled INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            finished_at TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX idx_scheduler_runs_refill ON scheduler_runs (refill_day)")
+    # Resultado do reabastecimento de cada medicamento de referência por data
+    # de compra: 'refilled', 'expired' (receita vencida) ou 'too_old'
+    # (receita com mais de 6 meses)
+    conn.execute("""
+        CREATE TABLE refill_events (
+            medication_id INTEGER NOT NULL,
+            refill_day INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            outcome TEXT NOT NULL,
+            units REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (medication_id, refill_day)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "CREATE INDEX idx_refill_events_user_day ON refill_events (user_id, refill_day)"
+    )
+
+
+def _v8_user_settings(conn):
+    # Data base de compra, último reabastecimento e prazo da receita de cada
+    # usuário (antes únicos para todos, no config.json), como números de dias
+    conn.execute("""
+        CREATE TABLE user_settings (
+            user_id INTEGER PRIMARY KEY,
+            refill_day INTEGER NOT NULL,
+            last_stock_update INTEGER,
+            validity_days INTEGER NOT NULL DEFAULT 180
+        )
+    """)
+    # Só o banco é lido aqui: se o agendador já atendeu alguma compra, ela vira
+    # a data base e o último reabastecimento de todos os usuários (a mesma
+    # compra não é repetida). Sem histórico, as linhas são criadas na primeira
+    # leitura com os padrões do config.json (ensure_user_settings); os
+    # usuários que já existiam ficam em legacy_users para receber o
+    # last_stock_update do config.json, e não o de um usuário novo.
+    conn.execute("""
+        INSERT INTO user_settings (user_id, refill_day, last_stock_update)
+        SELECT u.id, r.refill_day, r.refill_day
+        FROM (SELECT id FROM users UNION SELECT user_id FROM medications) u,
+             (SELECT MAX(refill_day) AS refill_day FROM scheduler_runs) r
+        WHERE r.refill_day IS NOT NULL
+    """)
+    conn.execute("CREATE TABLE legacy_users (user_id INTEGER PRIMARY KEY)")
+    conn.execute("""
+        INSERT INTO legacy_users (user_id)
+        SELECT id FROM users UNION SELECT user_id FROM medications
+        EXCEPT SELECT user_id FROM user_settings
+    """)
+    conn.execute("DROP INDEX idx_scheduler_runs_refill")
+    conn.execute("ALTER TABLE scheduler_runs DROP COLUMN refill_day")
+
+
+def _v9_row_version(conn):
+    # Versão da linha para concorrência otimista: toda escrita em campos do
+    # medicamento incrementa row_version, e a edição só é gravada se a versão
+    # ainda for a que o usuário viu (logic.database.UnitOfWork)
+    conn.execute(
+        "ALTER TABLE medications ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1"
+    )
+
+
+def _v10_stock_ledger(conn):
+    # Livro de movimentos de estoque (logic.ledger): cada alteração de
+    # stock_in_units grava a diferença com o tipo do movimento
+    conn.execute("""
+        CREATE TABLE stock_movements (
+            id INTEGER PRIMARY KEY,
+            medication_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            kind TEXT NOT NULL
+                CHECK (kind IN ('refill', 'purchase', 'consumption', 'adjustment')),
+            quantity REAL NOT NULL
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX idx_stock_movements_medication "
+        "ON stock_movements (medication_id, id)"
+    )
+    # Saldo de um medicamento logo após o movimento movement_id
+    conn.execute("""
+        CREATE TABLE stock_snapshots (
+            medication_id INTEGER NOT NULL,
+            movement_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            balance REAL NOT NULL,
+            PRIMARY KEY (medication_id, movement_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "CREATE INDEX idx_stock_snapshots_day ON stock_snapshots (medication_id, day)"
+    )
+    # Movimentos gravados desde o último snapshot do medicamento: só quem
+    # passou de logic.ledger.SNAPSHOT_INTERVAL é examinado por take_snapshots
+    conn.execute(
+        "ALTER TABLE medications "
+        "ADD COLUMN movements_since_snapshot INTEGER NOT NULL DEFAULT 0"
+    )
+    # O histórico anterior não é conhecido: o estoque atual vira o saldo de
+    # abertura (movement_id 0) de cada medicamento
+    today = DAY_NUMBER_SQL.format(column="date('now', 'localtime')")
+    conn.execute(f"""
+        INSERT INTO stock_snapshots (medication_id, movement_id, day, balance)
+        SELECT id, 0, {today}, stock_in_units FROM medications
+    """)
+
+
+def _v11_name_search(conn):
+    # Índice de texto dos nomes (external content: o texto fica só em
+    # medications). user_id entra como coluna indexada para que a busca de um
+    # usuário cruze as duas listas de documentos no próprio FTS5. Sem acentos
+    # e sem diferenciar maiúsculas; prefixos de 2 a 4 letras pré-indexados.
+    conn.execute("""
+        CREATE VIRTUAL TABLE medications_fts USING fts5(
+            name, user_id,
+            content='medications', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )
+    """)
+    conn.execute("INSERT INTO medications_fts (medications_fts) VALUES ('rebuild')")
+    # Catálogo de nomes distintos de todos os usuários, para sugestões ao
+    # cadastrar; uses conta os medicamentos com aquele nome
+    conn.execute("""
+        CREATE TABLE medication_catalog (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+            uses INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE medication_catalog_fts USING fts5(
+            name,
+            content='medication_catalog', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER medication_catalog_fts_insert
+        AFTER INSERT ON medication_catalog
+        BEGIN
+            INSERT INTO medication_catalog_fts (rowid, name) VALUES (NEW.id, NEW.name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER medication_catalog_fts_delete
+        AFTER DELETE ON medication_catalog
+        BEGIN
+            INSERT INTO medication_catalog_fts (medication_catalog_fts, rowid, name)
+            VALUES ('delete', OLD.id, OLD.name);
+        END
+    """)
+    conn.execute("""
+        INSERT INTO medication_catalog (name, uses)
+        SELECT MIN(trim(name)), COUNT(*) FROM medications
+        WHERE trim(name) != ''
+        GROUP BY trim(name) COLLATE NOCASE
+    """)
+    # Mantém o índice e o catálogo em dia com medications; as atualizações
+    # que não mexem no nome (consumo, estoque) não disparam nada
+    add_name = """
+            INSERT INTO medications_fts (rowid, name, user_id)
+            VALUES (NEW.id, NEW.name, NEW.user_id);
+            INSERT INTO medication_catalog (name, uses)
+            SELECT trim(NEW.name), 1 WHERE trim(NEW.name) != ''
+            ON CONFLICT (name) DO UPDATE SET uses = uses + 1;
+    """
+    remove_name = """
+            INSERT INTO medications_fts (medications_fts, rowid, name, user_id)
+            VALUES ('delete', OLD.id, OLD.name, OLD.user_id);
+            UPDATE medication_catalog SET uses = uses - 1 WHERE name = trim(OLD.name);
+            DELETE FROM medication_catalog WHERE name = trim(OLD.name) AND uses <= 0;
+    """
+    conn.execute(f"""
+        CREATE TRIGGER medications_name_insert AFTER INSERT ON medications
+        BEGIN {add_name} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER medications_name_delete AFTER DELETE ON medications
+        BEGIN {remove_name} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER medications_name_update
+        AFTER UPDATE OF name, user_id ON medications
+        BEGIN {remove_name} {add_name} END
+    """)
+
+
+def _v12_shard_directory(conn):
+    # Diretório de shards (logic.shards): no banco principal, os arquivos de
+    # shard e o shard de cada usuário; vazias, o banco não é particionado.
+    # Os caminhos são relativos à pasta do banco principal.
+    conn.execute("""
+        CREATE TABLE shards (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "CREATE INDEX idx_user_shards_shard ON user_shards (shard_id, user_id)"
+    )
+
+
+def _v13_ledger_cascade(conn):
+    # Movimentos e saldos saem junto com o medicamento, por qualquer caminho
+    # de remoção; o que já tinha ficado para trás é apagado agora
+    conn.execute("""
+        CREATE TRIGGER medications_ledger_delete
+        AFTER DELETE ON medications
+        BEGIN
+            DELETE FROM stock_movements WHERE medication_id = OLD.id;
+            DELETE FROM stock_snapshots WHERE medication_id = OLD.id;
+        END
+    """)
+    for table in ("stock_movements", "stock_snapshots"):
+        conn.execute(f"""
+            DELETE FROM {table}
+            WHERE medication_id NOT IN (SELECT id FROM medications)
+        """)
+
+
+MIGRATIONS = [
+    _v1_base_tables,
+    _v2_expiry_day_and_indexes,
+    _v3_consumed_through_day,
+    _v4_forecast_tables,
+    _v5_stock_exhaustion_day,
+    _v6_pagination_indexes,
+    _v7_scheduler_tables,
+    _v8_user_settings,
+    _v9_row_version,
+    _v10_stock_ledger,
+    _v11_name_search,
+    _v12_shard_directory,
+    _v13_ledger_cascade,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# after(conn, versão_de_origem), se informado, roda na mesma transação,
+# depois do último passo e já com o esquema final.
+def migrate(conn, after=None):
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return
+    # BEGIN IMMEDIATE serializa processos concorrentes; a versão é relida
+    # dentro da transação para que cada passo rode uma única vez.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = get_schema_version(conn)
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[target - 1](conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+        if after is not None and version < SCHEMA_VERSION:
+            after(conn, version)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
@@ -0,0 +1,199 @@
+from array import array
+from datetime import date
+
+from logic.forecast import from_day_number
+
+# Colunas lidas de medications, na ordem dos campos de Medication
+MEDICATION_FIELDS = (
+    "id",
+    "user_id",
+    "name",
+    "dosage_per_intake",
+    "type",
+    "schedule",
+    "packaging",
+    "quantity_per_package",
+    "stock_in_units",
+    "status",
+    "is_reference",
+    "prescription_expiry",
+    "row_version",
+    "prescription_expiry_day",
+    "consumed_through_day",
+    "stock_exhaustion_day",
+)
+MEDICATION_SELECT = ", ".join(MEDICATION_FIELDS)
+
+# Colunas numéricas de MedicationTable guardadas em array: "q" (int64) ou
+# "d" (float64). O estoque fica em "q" enquanto todos os valores são
+# inteiros e passa a "d" quando o consumo diário deixou doses fracionadas;
+# colunas de dia que aceitam NULL usam "d" com NaN.
+NUMERIC_TYPECODES = {
+    "id": "q",
+    "user_id": "q",
+    "dosage_per_intake": "d",
+    "quantity_per_package": "q",
+    "stock_in_units": "q",
+    "is_reference": "q",
+    "row_version": "q",
+    "prescription_expiry_day": "d",
+    "consumed_through_day": "d",
+    "stock_exhaustion_day": "d",
+}
+_NULLABLE = ("prescription_expiry_day", "consumed_through_day", "stock_exhaustion_day")
+_NAN = float("nan")
+
+
+# Um medicamento lido do banco, com a validade da receita já convertida em
+# date e a dose em float. Os campos seguem MEDICATION_FIELDS.
+class Medication:
+    __slots__ = MEDICATION_FIELDS
+
+    def __init__(
+        self,
+        id,
+        user_id,
+        name,
+        dosage_per_intake,
+        med_type,
+        schedule,
+        packaging,
+        quantity_per_package,
+        stock_in_units,
+        status,
+        is_reference,
+        prescription_expiry,
+        row_version=1,
+        prescription_expiry_day=None,
+        consumed_through_day=None,
+        stock_exhaustion_day=None,
+    ):
+        self.id = id
+        self.user_id = user_id
+        self.name = name
+        self.dosage_per_intake = float(dosage_per_intake)
+        self.type = med_type
+        self.schedule = schedule
+        self.packaging = packaging
+        self.quantity_per_package = quantity_per_package
+        self.stock_in_units = stock_in_units
+        self.status = status
+        self.is_reference = bool(is_reference)
+        if prescription_expiry_day is not None:
+            self.prescription_expiry = from_day_number(prescription_expiry_day)
+        elif isinstance(prescription_expiry, str):
+            try:
+                self.prescription_expiry = date.fromisoformat(prescription_expiry)
+            except ValueError:
+                self.prescription_expiry = None
+        else:
+            self.prescription_expiry = prescription_expiry
+        self.row_version = row_version
+        self.prescription_expiry_day = prescription_expiry_day
+        self.consumed_through_day = consumed_through_day
+        self.stock_exhaustion_day = stock_exhaustion_day
+
+    def __repr__(self):
+        return f"Medication(id={self.id!r}, user_id={self.user_id!r}, name={self.name!r})"
+
+    # Valores no formato do banco (validade em texto ISO), na ordem de MEDICATION_FIELDS
+    def astuple(self):
+        expiry = self.prescription_expiry
+        return (
+            self.id,
+            self.user_id,
+            self.name,
+            self.dosage_per_intake,
+            self.type,
+            self.schedule,
+            self.packaging,
+            self.quantity_per_package,
+            self.stock_in_units,
+            self.status,
+            int(self.is_reference),
+            expiry.isoformat() if expiry is not None else None,
+            self.row_version,
+            self.prescription_expiry_day,
+            self.consumed_through_day,
+            self.stock_exhaustion_day,
+        )
+
+
+# row_factory para cursores de "SELECT {MEDICATION_SELECT} FROM medications"
+def medication_row(cursor, row):
+    return Medication(*row)
+
+
+def _numeric_column(name, values):
+    if name in _NULLABLE:
+        values = [_NAN if value is None else value for value in values]
+    elif name == "is_reference":
+        # Aceita NULL no esquema; NULL equivale a "não é referência"
+        values = [value or 0 for value in values]
+    try:
+        return array(NUMERIC_TYPECODES[name], values)
+    except TypeError:
+        return array("d", values)
+
+
+# Medicamentos em colunas: números em array (contíguos, sem um objeto por
+# valor) e textos em listas. Usado nos caminhos em lote (status_check),
+# em que as linhas vão direto do cursor para as colunas sem passar por
+# sqlite3.Row nem por Medication.
+class MedicationTable:
+    __slots__ = ("columns",)
+
+    def __init__(self, columns=None):
+        self.columns = columns or {
+            name: array(NUMERIC_TYPECODES[name]) if name in NUMERIC_TYPECODES else []
+            for name in MEDICATION_FIELDS
+        }
+
+    # Tuplas na ordem de MEDICATION_FIELDS (cursor sem row_factory)
+    @classmethod
+    def from_rows(cls, rows):
+        if not rows:
+            return cls()
+        columns = {}
+        for name, values in zip(MEDICATION_FIELDS, zip(*rows)):
+            if name in NUMERIC_TYPECODES:
+                columns[name] = _numeric_column(name, values)
+            else:
+                columns[name] = list(values)
+        return cls(columns)
+
+    @classmethod
+    def from_medications(cls, meds):
+        return cls.from_rows([med.astuple() for med in meds])
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def __iter__(self):
+        columns = [self.columns[name] for name in MEDICATION_FIELDS]
+        nullable = len(MEDICATION_FIELDS) - len(_NULLABLE)
+        for row in zip(*columns):
+            days = (None if day != day else int(day) for day in row[nullable:])
+            yield Medication(*row[:nullable], *days)
+
+    def slice(self, start, stop=None):
+        return MedicationTable(
+            {name: values[start:stop] for name, values in self.columns.items()}
+        )
+
+    def extend(self, other):
+        for name, values in self.columns.items():
+            other_values = other.columns[name]
+            if isinstance(values, array) and values.typecode != other_values.typecode:
+                values = self.columns[name] = array("d", values)
+                other_values = array("d", other_values)
+            values.extend(other_values)
+
+    # Índice do primeiro medicamento do próximo usuário depois da posição
+    # `index`; os medicamentos de cada usuário precisam estar juntos
+    def user_end(self, index):
+        user_ids = self.columns["user_id"]
+        user_id, end = user_ids[index], index + 1
+        while end < len(user_ids) and user_ids[end] == user_id:
+            end += 1
+        return end
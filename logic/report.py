@@ -0,0 +1,139 @@
+from collections import deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+import zipfile
+
+from logic.config import load_config
+from logic.forecast import next_refill_date
+from logic.database import (
+    fetch_alerting_medications,
+    fetch_user_ids,
+    get_refill_day,
+)
+from logic.status import alert_rows, evaluate_medications
+
+TITLE = "Relatório de Medicamentos com Alerta"
+HEADERS = ("Nome", "Estoque (dias)", "Receita vence em")
+COLUMNS_X = (50, 250, 400)
+LINE_HEIGHT = 20
+BOTTOM_MARGIN = 50
+
+
+# O reportlab só é importado quando o primeiro relatório é gerado; o módulo
+# de canvas e as medidas da página ficam em cache pelo resto do processo.
+@lru_cache(maxsize=1)
+def _page_setup():
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    return canvas.Canvas, A4
+
+
+def build_pdf_report(alerts, config_data, generated_on=None):
+    canvas_class, page_size = _page_setup()
+    generated_on = generated_on or date.today()
+    _, height = page_size
+    buffer = BytesIO()
+    c = canvas_class(buffer, pagesize=page_size)
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, height - 50, TITLE)
+    c.setFont("Helvetica", 10)
+    c.drawString(
+        50, height - 65, f"Data de geração: {generated_on.strftime('%d/%m/%Y')}"
+    )
+    y = height - 100
+    c.setFont("Helvetica-Bold", 11)
+    for x, header in zip(COLUMNS_X, HEADERS):
+        c.drawString(x, y, header)
+    c.setFont("Helvetica", 11)
+    for row in alerts:
+        y -= LINE_HEIGHT
+        if y < BOTTOM_MARGIN:
+            c.showPage()
+            c.setFont("Helvetica", 11)
+            y = height - 50
+        for x, value in zip(COLUMNS_X, row):
+            c.drawString(x, y, value)
+    y -= 40
+    c.setFont("Helvetica-Oblique", 10)
+    c.drawString(50, y, f"Total de alertas: {len(alerts)} medicamento(s)")
+    y -= 20
+    c.drawString(
+        50, y, f"Data inicial do controle: {config_data.get('initial_date', '-')}"
+    )
+    c.save()
+    return buffer.getvalue()
+
+
+def report_file_name(user_id):
+    return f"alertas_usuario_{user_id}.pdf"
+
+
+# Executado nos processos de trabalho: gera o PDF de um usuário, ou None se
+# nenhum medicamento dele requer atenção.
+def render_user_report(user_id, today, config_data, db_path=None):
+    refill_base = get_refill_day(user_id, db_path)
+    days_until_refill = (next_refill_date(refill_base, today) - today).days
+    meds = fetch_alerting_medications(
+        user_id, days_until_refill, today=today, db_path=db_path
+    )
+    alerts = alert_rows(evaluate_medications(meds, days_until_refill, today))
+    if not alerts:
+        return user_id, None
+    return user_id, build_pdf_report(alerts, config_data, today)
+
+
+def _iter_reports(user_ids, workers, args):
+    if workers <= 1:
+        for user_id in user_ids:
+            yield render_user_report(user_id, *args)
+        return
+    # No máximo 2 × workers relatórios prontos aguardando gravação. Processos
+    # novos (spawn), com as próprias conexões: um fork herdaria as do pai e
+    # as travas presas pelas outras threads
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        pending = deque()
+        for user_id in user_ids:
+            pending.append(executor.submit(render_user_report, user_id, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# Gera os relatórios de alerta de vários usuários em um diretório (um PDF por
+# usuário) ou em um único arquivo zip. Devolve os ids com relatório gerado.
+def render_reports(user_ids=None, out_dir=None, zip_path=None, workers=1, db_path=None):
+    if (out_dir is None) == (zip_path is None):
+        raise ValueError("Informe out_dir ou zip_path.")
+    args = (date.today(), load_config(), db_path)
+    if user_ids is None:
+        user_ids = fetch_user_ids(db_path)
+
+    written = []
+    archive = None
+    if zip_path is not None:
+        # PDFs já são comprimidos; ZIP_STORED evita recomprimir
+        archive = zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED)
+    else:
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        for user_id, pdf in _iter_reports(user_ids, workers, args):
+            if pdf is None:
+                continue
+            if archive is not None:
+                archive.writestr(report_file_name(user_id), pdf)
+            else:
+                (out_dir / report_file_name(user_id)).write_bytes(pdf)
+            written.append(user_id)
+    finally:
+        if archive is not None:
+            archive.close()
+    return written
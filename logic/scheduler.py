@@ -0,0 +1,161 @@
+from datetime import date
+
+from logic.consumption import consume_user_range
+from logic.database import (
+    bump_data_version,
+    combine_scheduler_runs,
+    ensure_user_settings,
+    fan_out,
+    write_transaction,
+)
+from logic.ledger import record_movements, take_snapshots
+from logic.forecast import (
+    REFERENCE_DAYS,
+    can_refill,
+    day_number,
+    from_day_number,
+    last_refill_date,
+    refresh_forecast,
+)
+
+# Usuários processados por transação
+DEFAULT_BATCH_SIZE = 500
+
+
+def refill_outcome(med, refill_day, validity_days):
+    if can_refill(med["prescription_expiry_day"], refill_day, validity_days):
+        return "refilled", REFERENCE_DAYS * med["dosage_per_intake"]
+    expiry_day = med["prescription_expiry_day"]
+    if expiry_day is None or expiry_day < refill_day:
+        return "expired", 0
+    return "too_old", 0
+
+
+# Usuários do lote com data de compra vencida e ainda não atendida:
+# {user_id: (dia_da_compra, validity_days)}. A data de compra mais recente é
+# atendida uma única vez, mesmo que o agendador não tenha rodado no dia exato
+# (ex.: computador desligado).
+def _due_refills(conn, user_ids, today):
+    ensure_user_settings(conn, user_ids, today)
+    due = {}
+    cursor = conn.execute(
+        "SELECT user_id, refill_day, last_stock_update, validity_days "
+        "FROM user_settings WHERE user_id BETWEEN ? AND ?",
+        (user_ids[0], user_ids[-1]),
+    )
+    for settings in cursor:
+        refill_date = last_refill_date(from_day_number(settings["refill_day"]), today)
+        if refill_date is None:
+            continue
+        refill_day = day_number(refill_date)
+        last_update = settings["last_stock_update"]
+        if last_update is None or last_update < refill_day:
+            due[settings["user_id"]] = (refill_day, settings["validity_days"])
+    return due
+
+
+# Reabastece os medicamentos de referência dos usuários com compra pendente e
+# marca a compra como atendida em user_settings (uma linha por usuário).
+# Devolve (reabastecidos, ignorados).
+def _refill_users(conn, user_ids, today):
+    due = _due_refills(conn, user_ids, today)
+    if not due:
+        return 0, 0
+    meds = conn.execute(
+        """
+        SELECT id, user_id, stock_in_units, dosage_per_intake, prescription_expiry_day
+        FROM medications
+        WHERE user_id BETWEEN ? AND ? AND is_reference = 1
+        """,
+        (user_ids[0], user_ids[-1]),
+    ).fetchall()
+    events, refills, movements = [], [], []
+    today_day = day_number(today)
+    for med in meds:
+        if med["user_id"] not in due:
+            continue
+        refill_day, validity_days = due[med["user_id"]]
+        outcome, units = refill_outcome(med, refill_day, validity_days)
+        events.append((med["id"], refill_day, med["user_id"], outcome, units))
+        if outcome == "refilled":
+            refills.append((med["stock_in_units"] + units, med["id"]))
+            movements.append((med["id"], med["user_id"], today_day, "refill", units))
+    conn.executemany(
+        "INSERT OR IGNORE INTO refill_events "
+        "(medication_id, refill_day, user_id, outcome, units) VALUES (?, ?, ?, ?, ?)",
+        events,
+    )
+    conn.executemany(
+        "UPDATE medications SET stock_in_units = ?, row_version = row_version + 1, "
+        "movements_since_snapshot = movements_since_snapshot + 1 WHERE id = ?",
+        refills,
+    )
+    record_movements(conn, movements)
+    conn.executemany(
+        "UPDATE user_settings SET last_stock_update = ? WHERE user_id = ?",
+        ((refill_day, user_id) for user_id, (refill_day, _) in due.items()),
+    )
+    refresh_forecast(conn, [med_id for _, med_id in refills], today)
+    return len(refills), len(events) - len(refills)
+
+
+def _start_run(conn, today):
+    run_day = day_number(today)
+    conn.execute(
+        "INSERT OR IGNORE INTO scheduler_runs (run_day) VALUES (?)", (run_day,)
+    )
+    return conn.execute(
+        "SELECT * FROM scheduler_runs WHERE run_day = ?", (run_day,)
+    ).fetchone()
+
+
+# Aplica o consumo diário e o reabastecimento de todos os usuários, em lotes
+# de batch_size usuários por transação. Cada lote grava junto o progresso
+# (last_user_id), então uma execução interrompida continua do último lote
+# confirmado, e rodar de novo depois de concluída não altera nada. Cada
+# shard tem sua própria linha de scheduler_runs e é processado em paralelo
+# com os demais. Devolve a linha do dia (o resumo dos shards, se houver).
+def run_scheduled_jobs(today=None, batch_size=DEFAULT_BATCH_SIZE, db_path=None):
+    today = today or date.today()
+    runs = fan_out(lambda path: _run_shard_jobs(today, batch_size, path), db_path)
+    return combine_scheduler_runs(runs)
+
+
+def _run_shard_jobs(today, batch_size, db_path):
+    while True:
+        with write_transaction(db_path) as conn:
+            run = _start_run(conn, today)
+            if run["finished_at"] is not None:
+                return run
+            user_ids = [
+                row["user_id"]
+                for row in conn.execute(
+                    "SELECT DISTINCT user_id FROM medications "
+                    "WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (run["last_user_id"], batch_size),
+                )
+            ]
+            if not user_ids:
+                conn.execute(
+                    "UPDATE scheduler_runs SET finished_at = CURRENT_TIMESTAMP "
+                    "WHERE run_day = ?",
+                    (run["run_day"],),
+                )
+                continue
+            first, last = user_ids[0], user_ids[-1]
+            consumed = consume_user_range(conn, today, first, last)
+            refilled, skipped = _refill_users(conn, user_ids, today)
+            take_snapshots(
+                conn, "m.user_id BETWEEN :first AND :last", {"first": first, "last": last}
+            )
+            conn.execute(
+                """
+                UPDATE scheduler_runs
+                SET last_user_id = ?, consumed = consumed + ?,
+                    refilled = refilled + ?, skipped = skipped + ?
+                WHERE run_day = ?
+                """,
+                (last, consumed, refilled, skipped, run["run_day"]),
+            )
+        for user_id in user_ids:
+            bump_data_version(user_id, db_path)
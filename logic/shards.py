@@ -0,0 +1,421 @@
+import bisect
+import heapq
+import sqlite3
+from pathlib import Path
+
+from logic.database import (
+    SHARD_ID_SPAN,
+    clear_read_cache,
+    clear_routes,
+    connect_db,
+    create_tables,
+    get_db_path,
+    shard_paths,
+)
+
+# Manutenção do particionamento (manage_shards.py): criação de shards e
+# movimentação de usuários entre bancos. Exige o app e o agendador parados:
+# as rotas ficam em cache nos processos e uma escrita durante a cópia de um
+# usuário se perderia.
+
+SHARD_DIR = "shards"
+# Usuários copiados por transação. Achar os medicamentos já removidos de um
+# lote percorre o livro de estoque inteiro, então lotes grandes compensam.
+MOVE_BATCH_SIZE = 5000
+# Espera por travas ao abrir os bancos de origem e destino
+MOVE_TIMEOUT_SECONDS = 30
+
+# Medicamentos com dados do usuário no banco `schema`, incluindo os já
+# removidos que ainda têm histórico (movimentos, reabastecimentos)
+USER_MEDICATION_IDS_SQL = """
+    SELECT id FROM {schema}.medications
+    WHERE user_id IN (SELECT user_id FROM temp.moving_users)
+    UNION SELECT medication_id FROM {schema}.stock_movements
+    WHERE user_id IN (SELECT user_id FROM temp.moving_users)
+    UNION SELECT medication_id FROM {schema}.refill_events
+    WHERE user_id IN (SELECT user_id FROM temp.moving_users)
+    UNION SELECT medication_id FROM {schema}.medication_forecast
+    WHERE user_id IN (SELECT user_id FROM temp.moving_users)
+"""
+
+# Tabelas copiadas: (tabela, filtro, colunas com ids renumerados). Os
+# filtros usam o apelido t para a linha de origem.
+BY_USER = "t.user_id IN (SELECT user_id FROM temp.moving_users)"
+BY_MEDICATION = "t.medication_id IN (SELECT old_id FROM temp.medication_map)"
+NEW_MEDICATION_ID = (
+    "(SELECT new_id FROM temp.medication_map WHERE old_id = t.{column})"
+)
+NEW_MOVEMENT_ID = (
+    "CASE WHEN t.movement_id = 0 THEN 0 ELSE "
+    "(SELECT new_id FROM temp.movement_map WHERE old_id = t.movement_id) END"
+)
+USER_TABLES = (
+    ("medications", BY_USER, {"id": NEW_MEDICATION_ID.format(column="id")}),
+    ("user_settings", BY_USER, {}),
+    ("legacy_users", BY_USER, {}),
+    (
+        "medication_forecast",
+        BY_USER,
+        {"medication_id": NEW_MEDICATION_ID.format(column="medication_id")},
+    ),
+    (
+        "medication_forecast_cycles",
+        BY_MEDICATION,
+        {"medication_id": NEW_MEDICATION_ID.format(column="medication_id")},
+    ),
+    (
+        "refill_events",
+        BY_USER,
+        {"medication_id": NEW_MEDICATION_ID.format(column="medication_id")},
+    ),
+    (
+        "stock_movements",
+        BY_MEDICATION,
+        {
+            "id": "(SELECT new_id FROM temp.movement_map WHERE old_id = t.id)",
+            "medication_id": NEW_MEDICATION_ID.format(column="medication_id"),
+        },
+    ),
+    (
+        "stock_snapshots",
+        BY_MEDICATION,
+        {
+            "medication_id": NEW_MEDICATION_ID.format(column="medication_id"),
+            "movement_id": NEW_MOVEMENT_ID,
+        },
+    ),
+)
+
+
+# Cria shards até o banco ter `count` deles (shards/meds-001.db, ...), com a
+# faixa de ids de medicamento de cada um. Devolve {id: caminho}.
+def add_shards(count, db_path=None):
+    db_path = Path(db_path or get_db_path())
+    shards = shard_paths(db_path)
+    for shard_id in range(max(shards, default=0) + 1, count + 1):
+        relative = Path(SHARD_DIR) / f"{db_path.stem}-{shard_id:03d}.db"
+        path = db_path.parent / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        create_tables(path)
+        with connect_db(path) as conn:
+            conn.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'medications', 0 "
+                "WHERE NOT EXISTS "
+                "(SELECT 1 FROM sqlite_sequence WHERE name = 'medications')"
+            )
+            conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'medications'",
+                (shard_id * SHARD_ID_SPAN,),
+            )
+        with connect_db(db_path) as conn:
+            conn.execute(
+                "INSERT INTO shards (id, path) VALUES (?, ?)",
+                (shard_id, relative.as_posix()),
+            )
+        clear_routes()
+    return shard_paths(db_path)
+
+
+# {user_id: shard_id} do diretório
+def _directory(db_path):
+    rows = connect_db(db_path).execute("SELECT user_id, shard_id FROM user_shards")
+    return {row["user_id"]: row["shard_id"] for row in rows}
+
+
+# Usuários com dados no banco: {user_id: quantidade de medicamentos}
+def _user_loads(path):
+    rows = connect_db(path).execute(
+        """
+        SELECT user_id, SUM(medications) AS medications FROM (
+            SELECT user_id, COUNT(*) AS medications FROM medications GROUP BY user_id
+            UNION ALL
+            SELECT user_id, 0 FROM user_settings
+        )
+        GROUP BY user_id
+        """
+    )
+    return {row["user_id"]: row["medications"] for row in rows}
+
+
+# Usuários e medicamentos por banco; o shard 0 é o banco principal, que só
+# tem dados enquanto o banco não foi particionado
+def shard_status(db_path=None):
+    db_path = Path(db_path or get_db_path())
+    banks = {0: db_path, **shard_paths(db_path)}
+    status = []
+    for shard_id, path in banks.items():
+        loads = _user_loads(path)
+        status.append(
+            {
+                "shard_id": shard_id,
+                "path": str(path),
+                "users": len(loads),
+                "medications": sum(loads.values()),
+            }
+        )
+    return status
+
+
+def _open_raw(path):
+    return sqlite3.connect(
+        str(path), timeout=MOVE_TIMEOUT_SECONDS, isolation_level=None
+    )
+
+
+def _set_moving_users(conn, user_ids):
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS moving_users (user_id INTEGER PRIMARY KEY)"
+    )
+    conn.execute("DELETE FROM temp.moving_users")
+    conn.executemany(
+        "INSERT INTO temp.moving_users (user_id) VALUES (?)",
+        [(user_id,) for user_id in user_ids],
+    )
+
+
+# Remove do banco `schema` todos os dados dos usuários em temp.moving_users;
+# os gatilhos mantêm os índices de busca e o catálogo de nomes
+def _delete_users(conn, schema="main"):
+    conn.execute("DROP TABLE IF EXISTS temp.doomed_medications")
+    conn.execute(
+        "CREATE TEMP TABLE doomed_medications AS "
+        + USER_MEDICATION_IDS_SQL.format(schema=schema)
+    )
+    for table, where, _ in reversed(USER_TABLES):
+        if where == BY_MEDICATION:
+            conn.execute(
+                f"DELETE FROM {schema}.{table} "
+                "WHERE medication_id IN (SELECT id FROM temp.doomed_medications)"
+            )
+        else:
+            conn.execute(
+                f"DELETE FROM {schema}.{table} "
+                "WHERE user_id IN (SELECT user_id FROM temp.moving_users)"
+            )
+    conn.execute("DROP TABLE temp.doomed_medications")
+
+
+# Próximo id livre da tabela no banco de destino, a partir de `floor`
+def _next_id(conn, table, floor):
+    row = conn.execute(f"SELECT MAX(COALESCE(MAX(id), 0), ?) FROM main.{table}", (floor,))
+    next_id = row.fetchone()[0] + 1
+    seq = conn.execute(
+        "SELECT seq FROM main.sqlite_sequence WHERE name = ?", (table,)
+    ).fetchone()
+    return max(next_id, seq[0] + 1) if seq else next_id
+
+
+def _copy_table(conn, table, where, renumbered):
+    columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    values = ", ".join(renumbered.get(column, f"t.{column}") for column in columns)
+    conn.execute(
+        f"INSERT INTO main.{table} ({', '.join(columns)}) "
+        f"SELECT {values} FROM src.{table} t WHERE {where}"
+    )
+
+
+# Copia os dados dos usuários de `source` para o shard `shard_id` em
+# `target`, numa transação do destino. Os ids de medicamento e de movimento
+# são renumerados na faixa do destino, na mesma ordem, para que o histórico
+# de cada medicamento continue ordenado pelo id do movimento. Dados que já
+# estivessem no destino (de uma movimentação interrompida) são substituídos.
+def _copy_users(source, target, shard_id, user_ids):
+    conn = _open_raw(target)
+    try:
+        conn.execute("ATTACH DATABASE ? AS src", (str(source),))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _set_moving_users(conn, user_ids)
+            _delete_users(conn)
+            first_medication = _next_id(conn, "medications", shard_id * SHARD_ID_SPAN)
+            conn.execute(
+                "CREATE TEMP TABLE medication_map "
+                "(old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "INSERT INTO temp.medication_map (old_id, new_id) "
+                "SELECT id, ? + ROW_NUMBER() OVER (ORDER BY id) - 1 FROM ("
+                + USER_MEDICATION_IDS_SQL.format(schema="src")
+                + ")",
+                (first_medication,),
+            )
+            conn.execute(
+                "CREATE TEMP TABLE movement_map "
+                "(old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "INSERT INTO temp.movement_map (old_id, new_id) "
+                "SELECT id, ? + ROW_NUMBER() OVER (ORDER BY id) - 1 "
+                f"FROM src.stock_movements t WHERE {BY_MEDICATION}",
+                (_next_id(conn, "stock_movements", 0),),
+            )
+            for table, where, renumbered in USER_TABLES:
+                _copy_table(conn, table, where, renumbered)
+            # Ids de medicamentos já removidos também ficam reservados
+            conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, "
+                "(SELECT COALESCE(MAX(new_id), 0) FROM temp.medication_map)) "
+                "WHERE name = 'medications'"
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def _delete_from(path, user_ids):
+    conn = _open_raw(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _set_moving_users(conn, user_ids)
+            _delete_users(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+# Move usuários ({user_id: shard_id}) para os shards indicados. Cada lote é
+# copiado para o destino, passa a apontar para ele no diretório e só então é
+# removido da origem; uma interrupção deixa no máximo uma cópia excedente,
+# que purge_strays (chamada por rebalance) remove. Devolve a quantidade de
+# usuários movidos.
+def move_users(moves, db_path=None):
+    db_path = Path(db_path or get_db_path())
+    shards = shard_paths(db_path)
+    unknown = set(moves.values()) - set(shards)
+    if unknown:
+        raise ValueError(f"Shard(s) inexistente(s): {sorted(unknown)}")
+    directory = _directory(db_path)
+    groups = {}
+    for user_id, shard_id in sorted(moves.items()):
+        source = shards.get(directory.get(user_id), db_path)
+        if source != shards[shard_id]:
+            groups.setdefault((source, shard_id), []).append(user_id)
+    moved = 0
+    for (source, shard_id), user_ids in groups.items():
+        for start in range(0, len(user_ids), MOVE_BATCH_SIZE):
+            batch = user_ids[start : start + MOVE_BATCH_SIZE]
+            _copy_users(source, shards[shard_id], shard_id, batch)
+            with connect_db(db_path) as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO user_shards (user_id, shard_id) VALUES (?, ?)",
+                    [(user_id, shard_id) for user_id in batch],
+                )
+            _delete_from(source, batch)
+            moved += len(batch)
+    clear_routes()
+    clear_read_cache()
+    return moved
+
+
+# Resolve cópias excedentes deixadas por movimentações interrompidas. Uma
+# cópia só é removida se o shard do diretório tem os dados completos do
+# usuário (a mesma quantidade de medicamentos); um usuário cujos dados só
+# existem fora do shard do diretório passa a apontar para o shard que os tem,
+# ou volta a ser distribuído se estão no banco principal. Devolve a
+# quantidade de cópias removidas.
+def purge_strays(db_path=None):
+    db_path = Path(db_path or get_db_path())
+    shards = shard_paths(db_path)
+    directory = _directory(db_path)
+    loads = {shard_id: _user_loads(path) for shard_id, path in shards.items()}
+    loads[0] = _user_loads(db_path)
+    adopted, unplaced, stray = {}, [], {}
+    for shard_id, users in loads.items():
+        for user_id, count in users.items():
+            owner = directory.get(user_id)
+            if owner == shard_id:
+                continue
+            owner_count = loads.get(owner, {}).get(user_id)
+            if owner_count == count:
+                stray.setdefault(shard_id, []).append(user_id)
+            elif owner_count:
+                continue
+            elif shard_id == 0:
+                if owner is not None:
+                    unplaced.append(user_id)
+            else:
+                adopted[user_id] = directory[user_id] = shard_id
+    with connect_db(db_path) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO user_shards (user_id, shard_id) VALUES (?, ?)",
+            adopted.items(),
+        )
+        conn.executemany(
+            "DELETE FROM user_shards WHERE user_id = ?",
+            [(user_id,) for user_id in unplaced],
+        )
+    for shard_id, user_ids in stray.items():
+        _delete_from(shards.get(shard_id, db_path), user_ids)
+    clear_routes()
+    clear_read_cache()
+    return sum(len(user_ids) for user_ids in stray.values())
+
+
+# Movimentações que equilibram a quantidade de medicamentos entre os shards:
+# os usuários ainda no banco principal vão para o shard mais leve, do maior
+# para o menor; depois, enquanto compensar, o maior usuário que cabe na
+# metade da diferença passa do shard mais pesado para o mais leve.
+# Devolve {user_id: shard_id}.
+def plan_rebalance(db_path=None):
+    db_path = Path(db_path or get_db_path())
+    shards = shard_paths(db_path)
+    if not shards:
+        return {}
+    directory = _directory(db_path)
+    members = {shard_id: [] for shard_id in shards}
+    for shard_id, path in shards.items():
+        for user_id, count in _user_loads(path).items():
+            if directory.get(user_id) == shard_id:
+                members[shard_id].append((count, user_id))
+    loads = {shard_id: sum(count for count, _ in users) for shard_id, users in members.items()}
+    moves = {}
+
+    lightest = [(load, shard_id) for shard_id, load in loads.items()]
+    heapq.heapify(lightest)
+    unplaced = sorted(
+        ((count, user_id) for user_id, count in _user_loads(db_path).items()),
+        reverse=True,
+    )
+    for count, user_id in unplaced:
+        load, shard_id = heapq.heappop(lightest)
+        moves[user_id] = shard_id
+        members[shard_id].append((count, user_id))
+        loads[shard_id] = load + count
+        heapq.heappush(lightest, (loads[shard_id], shard_id))
+
+    for users in members.values():
+        users.sort()
+    for _ in range(sum(len(users) for users in members.values())):
+        heavy = max(loads, key=loads.get)
+        light = min(loads, key=loads.get)
+        gap = loads[heavy] - loads[light]
+        users = members[heavy]
+        index = bisect.bisect_right(users, (gap // 2, float("inf"))) - 1
+        if index < 0 or users[index][0] == 0:
+            break
+        count, user_id = users.pop(index)
+        bisect.insort(members[light], (count, user_id))
+        loads[heavy] -= count
+        loads[light] += count
+        moves[user_id] = light
+    return moves
+
+
+# Equilibra os shards; devolve a quantidade de usuários movidos
+def rebalance(db_path=None):
+    purge_strays(db_path)
+    return move_users(plan_rebalance(db_path), db_path)
+
+
+# Particiona o banco em `count` shards (ou acrescenta shards a um banco já
+# particionado) e distribui os usuários
+def split(count, db_path=None):
+    add_shards(count, db_path)
+    return rebalance(db_path)
@@ -0,0 +1,168 @@
+from array import array
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from logic.models import Medication, MedicationTable
+
+PRESCRIPTION_ALERT_DAYS = 15
+
+STOCK_LABEL = "⚠ Estoque"
+EXPIRED_LABEL = "❌ Receita médica vencida! Não é possível comprar."
+
+# Colunas calculadas acrescentadas por evaluate_medications
+COMPUTED_COLUMNS = [
+    "days_until_refill",
+    "days_left",
+    "days_to_expiry",
+    "stock_alert",
+    "prescription_alert",
+    "prescription_expired",
+    "needs_attention",
+]
+
+_EPOCH = pd.Timestamp("1970-01-01")
+
+
+def _table_frame(table):
+    # Colunas numéricas viram arrays do NumPy sobre o buffer do array, sem
+    # converter valor a valor
+    return pd.DataFrame(
+        {
+            name: np.frombuffer(values, dtype=values.typecode)
+            if isinstance(values, array)
+            else values
+            for name, values in table.columns.items()
+        }
+    )
+
+
+def _to_frame(meds):
+    if isinstance(meds, pd.DataFrame):
+        return meds.reset_index(drop=True)
+    if isinstance(meds, MedicationTable):
+        return _table_frame(meds)
+    rows = list(meds)
+    if not rows:
+        return pd.DataFrame(
+            columns=["name", "stock_in_units", "dosage_per_intake", "prescription_expiry"]
+        )
+    if isinstance(rows[0], Medication):
+        return _table_frame(MedicationTable.from_medications(rows))
+    if isinstance(rows[0], dict):
+        return pd.DataFrame.from_records(rows)
+    return pd.DataFrame.from_records(
+        [tuple(row) for row in rows], columns=list(rows[0].keys())
+    )
+
+
+def _expiry_day_numbers(frame):
+    # Usa a coluna numérica gravada pelo banco; datas em texto são convertidas
+    # de uma só vez, e valores inválidos viram NaN (sem alerta).
+    if "prescription_expiry_day" in frame:
+        days = pd.to_numeric(frame["prescription_expiry_day"], errors="coerce")
+        if not days.isna().any():
+            return days.to_numpy(dtype="float64")
+    parsed = pd.to_datetime(
+        frame["prescription_expiry"], format="%Y-%m-%d", errors="coerce"
+    )
+    return (parsed - _EPOCH).dt.days.to_numpy(dtype="float64")
+
+
+# Calcula, para todo o lote de uma vez, a duração do estoque, os dias até o
+# vencimento da receita, os alertas e o rótulo de status de cada medicamento.
+# days_until_refill é um número ou um array com um valor por linha (lotes com
+# medicamentos de vários usuários).
+def evaluate_medications(
+    meds,
+    days_until_refill,
+    today=None,
+    prescription_alert_days=PRESCRIPTION_ALERT_DAYS,
+):
+    frame = _to_frame(meds)
+    today = today or date.today()
+    today_day = (pd.Timestamp(today) - _EPOCH).days
+
+    stock = frame["stock_in_units"].to_numpy(dtype="float64")
+    dosage = frame["dosage_per_intake"].to_numpy(dtype="float64")
+    days_left = np.divide(
+        stock, dosage, out=np.full_like(stock, np.inf), where=dosage != 0
+    )
+    days_to_expiry = _expiry_day_numbers(frame) - today_day
+
+    stock_alert = days_left < days_until_refill
+    prescription_expired = days_to_expiry < 0
+    prescription_alert = (days_to_expiry >= 0) & (
+        days_to_expiry < prescription_alert_days
+    )
+
+    frame["days_until_refill"] = np.broadcast_to(days_until_refill, days_left.shape)
+    frame["days_left"] = days_left
+    frame["days_to_expiry"] = pd.array(days_to_expiry, dtype="Int64")
+    frame["stock_alert"] = stock_alert
+    frame["prescription_alert"] = prescription_alert
+    frame["prescription_expired"] = prescription_expired
+    frame["needs_attention"] = stock_alert | prescription_alert | prescription_expired
+    frame["status"] = _status_labels(frame)
+    return frame
+
+
+def _status_labels(frame):
+    index = frame.index
+    stock_part = pd.Series(np.where(frame["stock_alert"], STOCK_LABEL, ""), index=index)
+    expiry_text = frame["days_to_expiry"].astype("string").fillna("")
+    rx_part = ("⚠ Receita vence em " + expiry_text + " dia(s)").where(
+        frame["prescription_alert"], ""
+    )
+    rx_part = rx_part.mask(frame["prescription_expired"], EXPIRED_LABEL)
+    both = (stock_part != "") & (rx_part != "")
+    labels = stock_part + pd.Series(np.where(both, ", ", ""), index=index) + rx_part
+    return labels.mask(labels == "", "OK").astype(object)
+
+
+# Linhas [nome, estoque em dias, vencimento da receita] usadas no relatório PDF
+def alert_rows(frame):
+    flagged = frame[frame["needs_attention"]]
+    return [
+        [
+            name,
+            f"{days_left:.1f} dias",
+            "-" if pd.isna(days_to_expiry) else f"{days_to_expiry} dias",
+        ]
+        for name, days_left, days_to_expiry in zip(
+            flagged["name"], flagged["days_left"], flagged["days_to_expiry"]
+        )
+    ]
+
+
+RECORD_FIELDS = [
+    "user_id",
+    "id",
+    "name",
+    "days_until_refill",
+    "stock_in_units",
+    "dosage_per_intake",
+    "days_left",
+    "prescription_expiry",
+    "days_to_expiry",
+    "stock_alert",
+    "prescription_alert",
+    "prescription_expired",
+    "status",
+]
+
+
+# Registros simples (tipos nativos do Python) para saída em JSON Lines/CSV;
+# valores infinitos ou ausentes viram None.
+def status_records(frame):
+    out = frame[RECORD_FIELDS].copy()
+    out["days_left"] = out["days_left"].where(np.isfinite(out["days_left"]))
+    out = out.astype(object).where(out.notna(), None)
+    return [
+        {
+            field: value.item() if isinstance(value, np.generic) else value
+            for field, value in zip(RECORD_FIELDS, row)
+        }
+        for row in out.itertuples(index=False, name=None)
+    ]
@@ -0,0 +1,265 @@
+import math
+import sqlite3
+from datetime import date
+from pathlib import Path
+
+from logic.database import (
+    MEDICATION_COLUMNS,
+    connect_db,
+    data_paths,
+    group_by_path,
+    insert_medications_many,
+    user_db_path,
+)
+
+DEFAULT_BATCH_SIZE = 10_000
+FORMATS = ("parquet", "csv")
+EXPORT_COLUMNS = ("id",) + MEDICATION_COLUMNS
+REQUIRED_COLUMNS = ("name", "dosage_per_intake", "stock_in_units", "prescription_expiry")
+# Mesmos padrões do formulário "Adicionar Medicamento"
+DEFAULTS = {
+    "type": "Tablet",
+    "schedule": "daily",
+    "packaging": "box",
+    "quantity_per_package": 30,
+    "status": "Active",
+    "is_reference": 0,
+}
+# Erros de validação guardados no resultado; acima disso só a contagem
+MAX_REPORTED_ERRORS = 100
+
+
+# O pyarrow só é importado quando há uma importação ou exportação
+def _arrow():
+    import pyarrow as pa
+
+    return pa
+
+
+def export_schema():
+    pa = _arrow()
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("user_id", pa.int64()),
+            ("name", pa.string()),
+            ("dosage_per_intake", pa.float64()),
+            ("type", pa.string()),
+            ("schedule", pa.string()),
+            ("packaging", pa.string()),
+            ("quantity_per_package", pa.int64()),
+            ("stock_in_units", pa.float64()),
+            ("status", pa.string()),
+            ("is_reference", pa.int64()),
+            ("prescription_expiry", pa.string()),
+        ]
+    )
+
+
+def detect_format(path, file_format=None):
+    file_format = file_format or Path(str(path)).suffix.lstrip(".").lower()
+    if file_format not in FORMATS:
+        raise ValueError(f"Formato não suportado: {file_format or '?'} (use parquet ou csv)")
+    return file_format
+
+
+# Lê os medicamentos com fetchmany e devolve um RecordBatch por bloco, sem
+# montar a tabela inteira na memória; sem user_id, um shard depois do outro
+def iter_record_batches(user_id=None, batch_size=DEFAULT_BATCH_SIZE, db_path=None):
+    if user_id is None:
+        paths = data_paths(db_path)
+    else:
+        paths = [user_db_path(user_id, db_path)]
+    for path in paths:
+        yield from _iter_record_batches(user_id, batch_size, path)
+
+
+def _iter_record_batches(user_id, batch_size, db_path):
+    pa = _arrow()
+    schema = export_schema()
+    conn = connect_db(db_path)
+    columns = ", ".join(EXPORT_COLUMNS)
+    if user_id is None:
+        cursor = conn.execute(f"SELECT {columns} FROM medications ORDER BY id")
+    else:
+        cursor = conn.execute(
+            f"SELECT {columns} FROM medications WHERE user_id = ? ORDER BY id",
+            (user_id,),
+        )
+    try:
+        while rows := cursor.fetchmany(batch_size):
+            arrays = [
+                pa.array(values, type=field.type)
+                for values, field in zip(zip(*rows), schema)
+            ]
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+    finally:
+        cursor.close()
+
+
+# Exporta para Parquet ou CSV (caminho ou arquivo aberto em modo binário).
+# Devolve a quantidade de medicamentos exportados.
+def export_medications(
+    dest,
+    file_format=None,
+    user_id=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    db_path=None,
+):
+    file_format = detect_format(dest, file_format)
+    schema = export_schema()
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(dest, schema)
+    else:
+        import pyarrow.csv as pcsv
+
+        writer = pcsv.CSVWriter(dest, schema)
+    exported = 0
+    try:
+        for batch in iter_record_batches(user_id, batch_size, db_path):
+            writer.write_batch(batch)
+            exported += batch.num_rows
+    finally:
+        writer.close()
+    return exported
+
+
+def _iter_source_batches(source, file_format, batch_size):
+    pa = _arrow()
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        yield from pq.ParquetFile(source).iter_batches(batch_size=batch_size)
+        return
+    import pyarrow.csv as pcsv
+
+    # Textos continuam texto (a validade não vira data nem o nome vira número)
+    text_columns = ("name", "type", "schedule", "packaging", "status", "prescription_expiry")
+    reader = pcsv.open_csv(
+        source,
+        read_options=pcsv.ReadOptions(block_size=1 << 20),
+        convert_options=pcsv.ConvertOptions(
+            column_types={column: pa.string() for column in text_columns},
+            strings_can_be_null=True,
+        ),
+    )
+    # Os blocos do leitor têm tamanho em bytes; reagrupa em lotes de
+    # batch_size linhas, guardando a sobra para o próximo lote
+    buffered, size = [], 0
+    for batch in reader:
+        buffered.append(batch)
+        size += batch.num_rows
+        if size < batch_size:
+            continue
+        table = pa.Table.from_batches(buffered)
+        full = size - size % batch_size
+        yield from table.slice(0, full).combine_chunks().to_batches(batch_size)
+        buffered = table.slice(full).combine_chunks().to_batches()
+        size -= full
+    if size:
+        yield from pa.Table.from_batches(buffered).combine_chunks().to_batches(batch_size)
+
+
+def _number(value, kind):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        raise ValueError("valor ausente")
+    number = kind(value)
+    if kind is int and number != float(value):
+        raise ValueError(f"{value!r} não é inteiro")
+    return number
+
+
+# Converte uma linha lida do arquivo em um medicamento pronto para inserir,
+# ou levanta ValueError com o motivo
+def validate_row(row, user_id=None):
+    med = {column: row.get(column) for column in MEDICATION_COLUMNS}
+    for column, default in DEFAULTS.items():
+        if med[column] is None:
+            med[column] = default
+    if user_id is not None:
+        med["user_id"] = user_id
+    if med["user_id"] is None:
+        raise ValueError("user_id ausente")
+    med["user_id"] = _number(med["user_id"], int)
+    med["name"] = (med["name"] or "").strip()
+    if not med["name"]:
+        raise ValueError("nome vazio")
+    med["dosage_per_intake"] = _number(med["dosage_per_intake"], float)
+    med["stock_in_units"] = _number(med["stock_in_units"], float)
+    med["quantity_per_package"] = _number(med["quantity_per_package"], int)
+    med["is_reference"] = int(bool(_number(med["is_reference"], int)))
+    if med["dosage_per_intake"] < 0 or med["stock_in_units"] < 0:
+        raise ValueError("dosagem e estoque não podem ser negativos")
+    expiry = med["prescription_expiry"]
+    if isinstance(expiry, date):
+        med["prescription_expiry"] = expiry.isoformat()[:10]
+    else:
+        try:
+            med["prescription_expiry"] = date.fromisoformat(str(expiry or "")).isoformat()
+        except ValueError:
+            raise ValueError(f"validade inválida: {expiry!r}") from None
+    return med
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.failed_chunks = []
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+# Importa de Parquet ou CSV em blocos de batch_size linhas. Linhas inválidas
+# são ignoradas e informadas no resultado; cada bloco é gravado em uma
+# transação própria por shard, então uma falha do banco desfaz apenas a
+# parte do bloco que ia para aquele shard, e só ela é informada como falha.
+# Com user_id, todos os medicamentos vão para esse usuário; sem ele, o
+# arquivo precisa ter a coluna user_id.
+def import_medications(
+    source,
+    file_format=None,
+    user_id=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    db_path=None,
+):
+    file_format = detect_format(getattr(source, "name", source), file_format)
+    result = ImportResult()
+    line = 0
+    for chunk_number, batch in enumerate(
+        _iter_source_batches(source, file_format, batch_size), start=1
+    ):
+        missing = [c for c in REQUIRED_COLUMNS if c not in batch.schema.names]
+        if missing:
+            raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(missing)}")
+        meds = []
+        for row in batch.to_pylist():
+            line += 1
+            try:
+                meds.append(validate_row(row, user_id))
+            except (TypeError, ValueError) as e:
+                result.reject(line, str(e))
+        try:
+            groups = group_by_path(
+                meds, lambda med: user_db_path(med["user_id"], db_path, assign=True)
+            )
+        except sqlite3.Error as e:
+            result.failed_chunks.append((chunk_number, str(e)))
+            continue
+        for path, group in groups.items():
+            try:
+                insert_medications_many(group, db_path)
+            except sqlite3.Error as e:
+                message = str(e)
+                if len(groups) > 1:
+                    message = f"{len(group)} medicamento(s) de {Path(path).name}: {e}"
+                result.failed_chunks.append((chunk_number, message))
+                continue
+            result.imported += len(group)
+    return result
@@ -0,0 +1,73 @@
+import argparse
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+
+from logic.config import file_lock
+from logic.database import get_db_path
+from logic.instrumentation import configure_logging, logger
+from logic.shards import move_users, rebalance, shard_status, split
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Particiona o banco em shards (um arquivo SQLite por grupo "
+        "de usuários) e move usuários entre eles. Pare o app e o agendador "
+        "antes de usar."
+    )
+    parser.add_argument("--db", help="caminho do banco de dados principal")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="usuários e medicamentos por shard")
+    split_parser = commands.add_parser(
+        "split", help="cria shards até o total informado e distribui os usuários"
+    )
+    split_parser.add_argument("shards", type=int)
+    commands.add_parser(
+        "rebalance", help="equilibra a quantidade de medicamentos entre os shards"
+    )
+    move_parser = commands.add_parser("move", help="move usuários para um shard")
+    move_parser.add_argument("shard", type=int)
+    move_parser.add_argument("users", type=int, nargs="+")
+    return parser.parse_args(argv)
+
+
+def print_status(db_path):
+    print(f"{'shard':>5}  {'usuários':>9}  {'medicamentos':>12}  arquivo")
+    for shard in shard_status(db_path):
+        print(
+            f"{shard['shard_id']:>5}  {shard['users']:>9}  "
+            f"{shard['medications']:>12}  {shard['path']}"
+        )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    db_path = Path(args.db or get_db_path())
+    if args.command == "status":
+        print_status(db_path)
+        return
+    lock_path = db_path.with_name(db_path.name + ".scheduler.lock")
+    with ExitStack() as stack:
+        # O agendador não pode rodar durante a movimentação
+        try:
+            stack.enter_context(file_lock(lock_path, blocking=False))
+        except BlockingIOError:
+            logger.error("O agendador está em execução; pare-o antes de continuar.")
+            sys.exit(1)
+        if args.command == "split":
+            moved = split(args.shards, db_path)
+        elif args.command == "rebalance":
+            moved = rebalance(db_path)
+        else:
+            try:
+                moved = move_users(dict.fromkeys(args.users, args.shard), db_path)
+            except ValueError as e:
+                logger.error("%s", e)
+                sys.exit(1)
+    print(f"{moved} usuário(s) movido(s).", file=sys.stderr)
+    print_status(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import sys
+
+from logic.instrumentation import configure_logging, finish_run, start_run
+from logic.transfer import (
+    DEFAULT_BATCH_SIZE,
+    FORMATS,
+    export_medications,
+    import_medications,
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Importa e exporta medicamentos em Parquet ou CSV, em blocos."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="exporta para um arquivo")
+    export.add_argument("path", help="arquivo de saída (.parquet ou .csv)")
+    export.add_argument("--user", type=int, help="apenas este usuário (padrão: todos)")
+
+    load = commands.add_parser("import", help="importa de um arquivo")
+    load.add_argument("path", help="arquivo de entrada (.parquet ou .csv)")
+    load.add_argument(
+        "--user",
+        type=int,
+        help="grava todos os medicamentos para este usuário "
+        "(padrão: coluna user_id do arquivo)",
+    )
+
+    for command in (export, load):
+        command.add_argument("--format", choices=FORMATS, help="padrão: pela extensão")
+        command.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        command.add_argument("--db", help="caminho do banco de dados")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    start_run(f"medications_io.{args.command}")
+    try:
+        if args.command == "export":
+            exported = export_medications(
+                args.path, args.format, args.user, args.batch_size, args.db
+            )
+            print(f"{exported} medicamento(s) exportado(s).")
+            return
+        result = import_medications(
+            args.path, args.format, args.user, args.batch_size, args.db
+        )
+    finally:
+        finish_run()
+
+    print(f"{result.imported} medicamento(s) importado(s).")
+    for line, message in result.errors:
+        print(f"Linha {line}: {message}", file=sys.stderr)
+    if result.rejected > len(result.errors):
+        print(
+            f"... e mais {result.rejected - len(result.errors)} linha(s) inválida(s).",
+            file=sys.stderr,
+        )
+    for chunk, message in result.failed_chunks:
+        print(f"Bloco {chunk} não importado: {message}", file=sys.stderr)
+    if result.rejected or result.failed_chunks:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import sqlite3
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from logic.config import file_lock
+from logic.database import get_db_path
+from logic.instrumentation import configure_logging, finish_run, logger, start_run
+from logic.scheduler import DEFAULT_BATCH_SIZE, run_scheduled_jobs
+
+# Intervalo entre verificações no modo contínuo; verificações de um dia já
+# processado só leem uma linha de scheduler_runs
+DEFAULT_INTERVAL_SECONDS = 900
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Aplica o consumo diário e o reabastecimento automático "
+        "de todos os usuários."
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="processa o dia atual e sai (para cron / Agendador de Tarefas)",
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=DEFAULT_INTERVAL_SECONDS,
+        help="segundos entre verificações no modo contínuo",
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--db", help="caminho do banco de dados")
+    return parser.parse_args(argv)
+
+
+def run_once(batch_size, db_path):
+    start_run("refill_scheduler")
+    try:
+        run = run_scheduled_jobs(batch_size=batch_size, db_path=db_path)
+    finally:
+        finish_run()
+    return run
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    db_path = Path(args.db or get_db_path())
+    lock_path = db_path.with_name(db_path.name + ".scheduler.lock")
+    with ExitStack() as stack:
+        # Uma única instância por banco; as demais saem imediatamente
+        try:
+            stack.enter_context(file_lock(lock_path, blocking=False))
+        except BlockingIOError:
+            logger.error("Outra instância do agendador já está em execução.")
+            sys.exit(1)
+        reported = None
+        while True:
+            try:
+                run = run_once(args.batch_size, db_path)
+            except sqlite3.OperationalError as e:
+                # Banco ocupado ou indisponível: o progresso confirmado fica
+                # salvo e a próxima verificação continua de onde parou
+                if args.once:
+                    raise
+                logger.error("Falha no agendador: %s", e)
+            else:
+                if dict(run) != reported:
+                    reported = dict(run)
+                    print(
+                        f"Dia processado: {run['consumed']} consumo(s), "
+                        f"{run['refilled']} reabastecimento(s), "
+                        f"{run['skipped']} ignorado(s) por receita.",
+                        file=sys.stderr,
+                    )
+            if args.once:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
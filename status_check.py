@@ -1,80 +1,351 @@
-from logic.database import fetch_all_medications
-from logic.config import get_refill_day
-from datetime import datetime, timedelta
+import argparse
+import csv
+import json
+import multiprocessing
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from logic.database import (
+    fetch_stockouts_between,
+    get_refill_days,
+    iter_shard_chunks,
+    reconcile_stock,
+)
+from logic.instrumentation import configure_logging, finish_run, start_run
+from logic.models import MedicationTable
+from logic.forecast import day_number, from_day_number, next_refill_date
+from logic.status import RECORD_FIELDS, evaluate_medications, status_records
 
-DB_PATH = "data/meds.db"
 DAYS_THRESHOLD = 30
 PRESCRIPTION_ALERT_DAYS = 15
+DEFAULT_CHUNK_SIZE = 5000
 
 
-def calculate_days_left(stock, dosage_per_intake):
-    if dosage_per_intake == 0:
-        return float("inf")
-    return stock / dosage_per_intake
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Verifica estoque e receitas dos medicamentos de todos os usuários."
+    )
+    parser.add_argument(
+        "--users",
+        type=lambda value: [int(v) for v in value.split(",") if v],
+        help="IDs de usuário separados por vírgula (padrão: todos)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processos para avaliar os lotes (1 = no processo atual)",
+    )
+    parser.add_argument(
+        "--format", choices=("text", "jsonl", "csv"), default="text"
+    )
+    parser.add_argument("--output", help="arquivo de saída (padrão: stdout)")
+    parser.add_argument("--db", help="caminho do banco de dados")
+    parser.add_argument(
+        "--stockouts-within",
+        type=int,
+        metavar="DIAS",
+        help="lista apenas os medicamentos com falta prevista nos próximos DIAS dias",
+    )
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="lista os medicamentos cujo estoque não confere com o livro de movimentos",
+    )
+    return parser.parse_args(argv)
 
 
-def prescription_expires_soon(expiry_str, threshold_days=15):
-    try:
-        expiry = datetime.strptime(expiry_str, "%Y-%m-%d").date()
-        days_left = (expiry - datetime.today().date()).days
-        return days_left < threshold_days, days_left
-    except ValueError:
-        return False, None
+# Agrupa os blocos lidos de um banco (MedicationTable) em lotes que nunca
+# dividem um usuário entre dois lotes (as linhas chegam ordenadas por user_id).
+def iter_user_batches(chunks, chunk_size):
+    batch = MedicationTable()
+    for table in chunks:
+        batch.extend(table)
+        # Corta depois do último medicamento do usuário que completa o lote
+        while len(batch) > chunk_size:
+            end = batch.user_end(chunk_size - 1)
+            if end == len(batch):
+                break
+            yield batch.slice(0, end)
+            batch = batch.slice(end)
+    if len(batch):
+        yield batch
 
 
-def calculate_next_refill_date(refill_base):
-    today = datetime.today().date()
-    while refill_base < today:
-        refill_base += timedelta(days=30)
-    return refill_base
-
+# Executado nos processos de trabalho: recebe o lote em colunas (a
+# MedicationTable é serializada como arrays, não linha a linha) e os dias até
+# a próxima compra de cada usuário do lote, e devolve os registros prontos
+# para escrita.
+def evaluate_batch(batch, days_until_refill, today):
+    user_ids = pd.Series(np.frombuffer(batch.columns["user_id"], dtype="int64"))
+    status = evaluate_medications(
+        batch,
+        user_ids.map(days_until_refill).to_numpy(dtype="int64"),
+        today=today,
+        prescription_alert_days=PRESCRIPTION_ALERT_DAYS,
+    )
+    return status_records(status)
 
-def check_medications():
-    print("\n=== 💊 Status dos Medicamentos ===\n")
 
-    # Carrega data base de compra
-    refill_base = get_refill_day()
-    next_refill = calculate_next_refill_date(refill_base)
-    days_until_refill = (next_refill - datetime.today().date()).days
+# Dias até a próxima compra de cada usuário do lote, pela data base de
+# compra de cada um (user_settings)
+def refill_countdown(batch, today, db_path=None):
+    refill_days = get_refill_days(set(batch.columns["user_id"]), db_path)
+    return {
+        user_id: (next_refill_date(refill_base, today) - today).days
+        for user_id, refill_base in refill_days.items()
+    }
 
-    print(f"🗓️  Próxima compra: {next_refill} (em {days_until_refill} dias)\n")
 
-    meds = fetch_all_medications(DB_PATH)
+# Avalia os lotes mantendo no máximo 2 × workers lotes em andamento, para que
+# a memória não cresça com o tamanho do banco; a ordem de saída é preservada.
+def iter_results(batches, workers, today, db_path=None):
+    def payload(batch):
+        return batch, refill_countdown(batch, today, db_path), today
 
-    if not meds:
-        print("Nenhum medicamento registrado.")
+    if workers <= 1:
+        for batch in batches:
+            yield from evaluate_batch(*payload(batch))
         return
 
-    for med in meds:
-        name = med["name"]
-        stock = med["stock_in_units"]
-        dosage = med["dosage_per_intake"]
-        expiry_str = med["prescription_expiry"]
+    # Processos novos (spawn), com as próprias conexões ao banco
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(evaluate_batch, *payload(batch)))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
 
-        print(f"🔹 {name} (Dose: {dosage}, Estoque: {stock})")
 
+class TextWriter:
+    def __init__(self, out):
+        self.out = out
+        self.user_id = None
+
+    def write(self, med):
+        if med["user_id"] != self.user_id:
+            self.user_id = med["user_id"]
+            print(
+                f"--- Usuário {self.user_id} "
+                f"(próxima compra em {med['days_until_refill']} dias) ---\n",
+                file=self.out,
+            )
+        print(
+            f"🔹 {med['name']} (Dose: {med['dosage_per_intake']}, "
+            f"Estoque: {med['stock_in_units']})",
+            file=self.out,
+        )
+        days_left = med["days_left"] if med["days_left"] is not None else float("inf")
         # Estoque
-        days_left = calculate_days_left(stock, dosage)
-        if days_left < days_until_refill:
+        if med["stock_alert"]:
             print(
-                f"  ❗ Repor antes do próximo ciclo (dura apenas {days_left:.1f} dias)"
-            )  # noqa: E501
+                f"  ❗ Repor antes do próximo ciclo (dura apenas {days_left:.1f} dias)",
+                file=self.out,
+            )
         else:
             print(
-                f"  ✅ Estoque cobre até o próximo ciclo ({days_left:.1f} dias restantes)"
-            )  # noqa: E501
-
+                f"  ✅ Estoque cobre até o próximo ciclo ({days_left:.1f} dias restantes)",
+                file=self.out,
+            )
         # Receita
-        expires_soon, days_to_expire = prescription_expires_soon(
-            expiry_str, PRESCRIPTION_ALERT_DAYS
-        )  # noqa: E501
-        if expires_soon:
-            print(f"  ⚠️ Receita vence em {days_to_expire} dias")
+        if med["prescription_alert"] or med["prescription_expired"]:
+            print(f"  ⚠️ Receita vence em {med['days_to_expiry']} dias", file=self.out)
         else:
-            print(f"  📅 Receita válida por mais {days_to_expire} dias")
+            print(
+                f"  📅 Receita válida por mais {med['days_to_expiry']} dias",
+                file=self.out,
+            )
+        print(file=self.out)
+
+
+class JsonLinesWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, med):
+        self.out.write(json.dumps(med, ensure_ascii=False) + "\n")
+
+
+class CsvWriter:
+    def __init__(self, out):
+        self.writer = csv.DictWriter(out, fieldnames=RECORD_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, med):
+        self.writer.writerow(med)
+
+
+WRITERS = {"text": TextWriter, "jsonl": JsonLinesWriter, "csv": CsvWriter}
+
 
-        print()
+def check_medications(
+    users=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    workers=1,
+    output_format="text",
+    out=None,
+    db_path=None,
+):
+    out = out or sys.stdout
+    today = datetime.today().date()
+
+    if output_format == "text":
+        print("\n=== 💊 Status dos Medicamentos ===\n", file=out)
+
+    writer = WRITERS[output_format](out)
+    # Os lotes são formados shard a shard: a ordem por user_id só vale
+    # dentro de cada shard
+    batches = (
+        batch
+        for chunks in iter_shard_chunks(users, chunk_size, db_path)
+        for batch in iter_user_batches(chunks, chunk_size)
+    )
+    summary = {"medications": 0, "stock_alerts": 0, "prescription_alerts": 0}
+    for med in iter_results(batches, workers, today, db_path):
+        writer.write(med)
+        summary["medications"] += 1
+        summary["stock_alerts"] += med["stock_alert"]
+        summary["prescription_alerts"] += (
+            med["prescription_alert"] or med["prescription_expired"]
+        )
+
+    if output_format == "text" and not summary["medications"]:
+        print("Nenhum medicamento registrado.", file=out)
+    return summary
+
+
+STOCKOUT_FIELDS = ["user_id", "id", "name", "stockout_date", "reorder_date"]
+
+
+# Uma consulta por intervalo na tabela de previsões, para todos os usuários ou
+# só os de `users` (filtrados na própria consulta)
+def report_stockouts(days, users=None, output_format="text", out=None, db_path=None):
+    out = out or sys.stdout
+    today_day = day_number(datetime.today().date())
+    rows = fetch_stockouts_between(today_day, today_day + days, users, db_path)
+    records = [
+        {
+            "user_id": row["user_id"],
+            "id": row["id"],
+            "name": row["name"],
+            "stockout_date": from_day_number(row["stockout_day"]).isoformat(),
+            "reorder_date": from_day_number(row["reorder_day"]).isoformat(),
+        }
+        for row in rows
+    ]
+    if output_format == "csv":
+        writer = csv.DictWriter(out, fieldnames=STOCKOUT_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    elif output_format == "jsonl":
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    else:
+        print(f"\n=== 📉 Falta prevista nos próximos {days} dias ===\n", file=out)
+        for record in records:
+            print(
+                f"🔹 Usuário {record['user_id']}: {record['name']} acaba em "
+                f"{record['stockout_date']} (comprar até {record['reorder_date']})",
+                file=out,
+            )
+    return {"stockouts": len(records)}
+
+
+RECONCILE_FIELDS = ["user_id", "id", "name", "stock_in_units", "ledger_balance"]
+
+
+# Compara o estoque gravado em medications com o saldo do livro de movimentos
+# (snapshot mais recente + movimentos seguintes) e lista as divergências
+def report_reconciliation(users=None, output_format="text", out=None, db_path=None):
+    out = out or sys.stdout
+    if users is None:
+        rows = reconcile_stock(db_path=db_path)
+    else:
+        rows = [row for user in users for row in reconcile_stock(user, db_path)]
+    records = [
+        {
+            "user_id": row["user_id"],
+            "id": row["id"],
+            "name": row["name"],
+            "stock_in_units": row["stock_in_units"],
+            "ledger_balance": row["ledger_balance"],
+        }
+        for row in rows
+    ]
+    if output_format == "csv":
+        writer = csv.DictWriter(out, fieldnames=RECONCILE_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    elif output_format == "jsonl":
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    else:
+        print("\n=== 📒 Conciliação do estoque com o livro ===\n", file=out)
+        for record in records:
+            print(
+                f"🔹 Usuário {record['user_id']}: {record['name']} tem "
+                f"{record['stock_in_units']} unidade(s), mas o livro soma "
+                f"{record['ledger_balance']}",
+                file=out,
+            )
+        if not records:
+            print("Estoque e livro conferem.", file=out)
+    return {"mismatches": len(records)}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    start_run("status_check")
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else None
+    try:
+        if args.stockouts_within is not None:
+            summary = report_stockouts(
+                args.stockouts_within, args.users, args.format, out, args.db
+            )
+            message = f"{summary['stockouts']} medicamento(s) com falta prevista"
+        elif args.reconcile:
+            summary = report_reconciliation(args.users, args.format, out, args.db)
+            message = (
+                f"{summary['mismatches']} medicamento(s) com estoque diferente do livro"
+            )
+        else:
+            summary = check_medications(
+                users=args.users,
+                chunk_size=args.chunk_size,
+                workers=args.workers,
+                output_format=args.format,
+                out=out,
+                db_path=args.db,
+            )
+            message = (
+                f"{summary['medications']} medicamento(s) verificados, "
+                f"{summary['stock_alerts']} alerta(s) de estoque, "
+                f"{summary['prescription_alerts']} alerta(s) de receita"
+            )
+    finally:
+        if out:
+            out.close()
+    print(message, file=sys.stderr)
+    stats = finish_run().summary()
+    print(
+        f"{stats['queries']} consulta(s) em {stats['query_ms']:.1f} ms "
+        f"({stats['slow_queries']} lenta(s)), {stats['rows']} linha(s), "
+        f"{stats['connections_opened']} conexão(ões) aberta(s) em "
+        f"{stats['connect_ms']:.1f} ms; total {stats['elapsed_ms']:.1f} ms",
+        file=sys.stderr,
+    )
 
 
 if __name__ == "__main__":
-    check_medications()
+    main()
@@ -0,0 +1,25 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from logic import auth
+
+
+class DummyHashTest(unittest.TestCase):
+    def test_default_rounds_use_the_shipped_hash(self):
+        dummy = auth._dummy_hash(auth.DEFAULT_BCRYPT_ROUNDS)
+        self.assertEqual(dummy, auth.DUMMY_PASSWORD_HASH)
+        self.assertEqual(auth.hash_rounds(dummy), auth.DEFAULT_BCRYPT_ROUNDS)
+        self.assertTrue(auth._check(b"dummy-password", dummy.encode()))
+
+    def test_other_rounds_are_computed_once(self):
+        rounds = 4
+        auth._dummy_hashes.pop(rounds, None)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            hashes = set(executor.map(auth._dummy_hash, [rounds] * 8))
+        # Sal aleatório: hashes iguais significam um único cálculo
+        self.assertEqual(len(hashes), 1)
+        self.assertEqual(auth.hash_rounds(hashes.pop()), rounds)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from logic import database
+from logic.instrumentation import finish_run, start_run
+
+
+class ExternalWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "meds.db"
+        database.insert_medication(
+            1, "Remédio", 1, "comprimido", "diário", "caixa", 30, 10,
+            "ativo", 0, "2099-01-01", self.db_path,
+        )
+
+    def tearDown(self):
+        database.close_connections()
+        database.clear_read_cache()
+        self.tmp.cleanup()
+
+    # Gravação por outra conexão, como faria o agendador em outro processo
+    def write_elsewhere(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute(sql)
+        conn.close()
+
+    def test_cached_list_sees_other_connection_writes(self):
+        self.assertEqual(len(database.fetch_all_medications(1, self.db_path)), 1)
+        self.write_elsewhere(
+            "INSERT INTO medications (user_id, name, dosage_per_intake, "
+            "quantity_per_package, stock_in_units) VALUES (1, 'Outro', 1, 30, 5)"
+        )
+        self.assertEqual(len(database.fetch_all_medications(1, self.db_path)), 2)
+
+    def test_cached_medication_sees_other_connection_writes(self):
+        med = database.fetch_all_medications(1, self.db_path)[0]
+        self.assertEqual(database.get_medication_by_id(med.id, self.db_path).stock_in_units, 10)
+        self.write_elsewhere(f"UPDATE medications SET stock_in_units = 3 WHERE id = {med.id}")
+        self.assertEqual(database.get_medication_by_id(med.id, self.db_path).stock_in_units, 3)
+
+    def test_rerun_on_new_thread_is_served_from_cache(self):
+        def rerun():
+            start_run("rerun")
+            database.fetch_all_medications(1, self.db_path)
+            database.fetch_medications_page(1, db_path=self.db_path)
+            stats.append(finish_run().summary())
+
+        stats = []
+        for _ in range(3):
+            thread = threading.Thread(target=rerun)
+            thread.start()
+            thread.join()
+        # Depois da primeira, só o PRAGMA data_version do vigia por leitura
+        for summary in stats[1:]:
+            self.assertEqual(summary["connections_opened"], 0)
+            self.assertEqual(summary["queries"], 2)
+
+    def test_unchanged_database_is_served_from_cache(self):
+        first = database.fetch_all_medications(1, self.db_path)
+        second = database.fetch_all_medications(1, self.db_path)
+        self.assertIs(first[0], second[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
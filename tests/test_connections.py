@@ -0,0 +1,68 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from logic import database
+
+
+# Executa fn numa thread nova, como cada execução da página no Streamlit
+def in_new_thread(fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "meds.db"
+        database.create_tables(self.db_path)
+
+    def tearDown(self):
+        database.close_connections()
+        database.clear_read_cache()
+        self.tmp.cleanup()
+
+    def connection_id(self):
+        conn = database.connect_db(self.db_path)
+        conn.execute("SELECT COUNT(*) FROM medications").fetchone()
+        return id(conn)
+
+    def test_finished_thread_hands_its_connection_to_the_next(self):
+        first = in_new_thread(self.connection_id)
+        self.assertEqual(in_new_thread(self.connection_id), first)
+
+    def test_concurrent_threads_get_their_own_connection(self):
+        barrier = threading.Barrier(2)
+        ids = []
+
+        def hold():
+            ids.append(self.connection_id())
+            barrier.wait()
+
+        threads = [threading.Thread(target=hold) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 2)
+
+    def test_open_transaction_is_rolled_back_on_release(self):
+        def leave_open():
+            conn = database.connect_db(self.db_path)
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO users (email, password_hash) VALUES ('a@b.c', 'x')"
+            )
+
+        in_new_thread(leave_open)
+        conn = database.connect_db(self.db_path)
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM users").fetchone()[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
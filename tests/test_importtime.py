@@ -0,0 +1,15 @@
+import unittest
+
+from benchmarks.importtime import LAZY_MODULES, STARTUP_MODULES, measure
+
+
+class StartupImportsTest(unittest.TestCase):
+    def test_heavy_modules_stay_lazy(self):
+        _, loaded = measure(STARTUP_MODULES)
+        self.assertEqual(
+            [module for module in loaded if module in LAZY_MODULES], []
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
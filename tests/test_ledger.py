@@ -0,0 +1,57 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from logic import database
+
+
+class DeleteLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "meds.db"
+        for index in range(4):
+            database.insert_medication(
+                1, f"Remédio {index}", 1, "comprimido", "diário", "caixa", 30, 10,
+                "ativo", 0, "2099-01-01", self.db_path,
+            )
+        self.med_ids = sorted(
+            med.id for med in database.fetch_all_medications(1, self.db_path)
+        )
+        for med_id in self.med_ids:
+            database.update_stock(med_id, 20, self.db_path, kind="purchase")
+
+    def tearDown(self):
+        database.close_connections()
+        database.clear_read_cache()
+        self.tmp.cleanup()
+
+    def ledger_rows(self, med_ids):
+        conn = database.connect_db(self.db_path)
+        placeholders = ",".join("?" * len(med_ids))
+        return [
+            conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE medication_id IN ({placeholders})",
+                med_ids,
+            ).fetchone()[0]
+            for table in ("stock_movements", "stock_snapshots")
+        ]
+
+    def test_delete_medication_removes_ledger(self):
+        self.assertNotEqual(self.ledger_rows(self.med_ids[:1]), [0, 0])
+        database.delete_medication(self.med_ids[0], self.db_path)
+        self.assertEqual(self.ledger_rows(self.med_ids[:1]), [0, 0])
+        self.assertNotEqual(self.ledger_rows(self.med_ids[1:]), [0, 0])
+
+    def test_delete_many_and_unit_of_work_remove_ledger(self):
+        database.delete_medications_many(self.med_ids[:2], self.db_path)
+        work = database.UnitOfWork(1, self.db_path)
+        for med in database.fetch_all_medications(1, self.db_path):
+            if med.id == self.med_ids[2]:
+                work.delete(med.id, med.row_version)
+        self.assertEqual(work.commit(), [])
+        self.assertEqual(self.ledger_rows(self.med_ids[:3]), [0, 0])
+        self.assertNotEqual(self.ledger_rows(self.med_ids[3:]), [0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from logic import database
+from logic.migrations import DAY_NUMBER_SQL, MIGRATIONS, SCHEMA_VERSION, migrate
+
+
+# Banco como estava na versão `version`, antes das migrações seguintes
+def database_at(db_path, version):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    MIGRATIONS[0](conn)
+    conn.execute(
+        "INSERT INTO medications (user_id, name, dosage_per_intake, "
+        "quantity_per_package, stock_in_units, is_reference, prescription_expiry) "
+        "VALUES (1, 'Antigo', 1, 30, 10, 1, '2099-01-01')"
+    )
+    for step in MIGRATIONS[1:version]:
+        step(conn)
+    conn.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+    return conn
+
+
+class UpgradeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "meds.db"
+
+    def tearDown(self):
+        self.conn.close()
+        database.close_connections()
+        self.tmp.cleanup()
+
+    def test_steps_leave_forecast_empty(self):
+        self.conn = database_at(self.db_path, 3)
+        migrate(self.conn)
+        self.assertEqual(
+            self.conn.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION
+        )
+        self.assertEqual(
+            self.conn.execute("SELECT COUNT(*) FROM medication_forecast").fetchone()[0], 0
+        )
+
+    def test_upgrade_from_v3_fills_forecast(self):
+        self.conn = database_at(self.db_path, 3)
+        database.create_tables(self.db_path)
+        conn = database.connect_db(self.db_path)
+        row = conn.execute("SELECT stockout_day FROM medication_forecast").fetchone()
+        self.assertIsNotNone(row)
+        # Sem histórico do agendador, user_settings fica para a primeira leitura
+        self.assertEqual(
+            conn.execute("SELECT COUNT(*) FROM user_settings").fetchone()[0], 0
+        )
+
+    def test_upgrade_from_v7_keeps_served_refill(self):
+        self.conn = database_at(self.db_path, 7)
+        served = self.conn.execute(
+            "SELECT " + DAY_NUMBER_SQL.format(column="'2026-01-05'")
+        ).fetchone()[0]
+        self.conn.execute(
+            "INSERT INTO scheduler_runs (run_day, refill_day) VALUES (?, ?)",
+            (served, served),
+        )
+        self.conn.commit()
+        migrate(self.conn)
+        settings = self.conn.execute(
+            "SELECT user_id, refill_day, last_stock_update FROM user_settings"
+        ).fetchall()
+        self.assertEqual([tuple(row) for row in settings], [(1, served, served)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from logic import database
+from logic.report import render_reports
+
+
+class WorkerProcessesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "meds.db"
+        for user_id in (1, 2, 3):
+            # Estoque para um dia: sempre em alerta
+            database.insert_medication(
+                user_id, f"Remédio {user_id}", 1, "comprimido", "diário", "caixa",
+                30, 1, "ativo", 1, "2099-01-01", self.db_path,
+            )
+
+    def tearDown(self):
+        database.close_connections()
+        database.clear_read_cache()
+        self.tmp.cleanup()
+
+    def test_render_reports_with_workers(self):
+        database.connect_db(self.db_path)
+        written = render_reports(
+            [1, 2, 3], out_dir=Path(self.tmp.name) / "pdf", workers=2,
+            db_path=self.db_path,
+        )
+        self.assertEqual(written, [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
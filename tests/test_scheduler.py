@@ -0,0 +1,164 @@
+import json
+import tempfile
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+from logic import config, database, scheduler
+from logic.forecast import day_number
+from logic.scheduler import run_scheduled_jobs
+from tests.test_migrations import database_at
+
+# Data base 2026-01-01 com ciclos de 30 dias: a compra mais recente até
+# TODAY é 2026-09-28
+TODAY = date(2026, 10, 17)
+LATEST_REFILL = date(2026, 9, 28)
+PREVIOUS_REFILL = date(2026, 8, 29)
+
+
+class SchedulerTestCase(unittest.TestCase):
+    last_stock_update = LATEST_REFILL
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "meds.db"
+        config_path = Path(self.tmp.name) / "config.json"
+        config_path.write_text(
+            json.dumps(
+                {
+                    "refill_day": "2026-01-01",
+                    "last_stock_update": self.last_stock_update.isoformat(),
+                    "bcrypt_rounds": 4,
+                }
+            ),
+            encoding="utf-8",
+        )
+        patcher = mock.patch.object(config, "CONFIG_PATH", config_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        database.close_connections()
+        database.clear_read_cache()
+        self.tmp.cleanup()
+
+    def insert_reference(self, user_id, stock=10):
+        database.insert_medication(
+            user_id, f"Referência {user_id}", 1, "comprimido", "diário", "caixa",
+            30, stock, "ativo", 1, "2099-01-01", self.db_path,
+        )
+
+    def refills(self):
+        conn = database.connect_db(self.db_path)
+        return conn.execute(
+            "SELECT COUNT(*) FROM stock_movements WHERE kind = 'refill'"
+        ).fetchone()[0]
+
+    def last_stock_update_of(self, user_id):
+        return database.get_user_settings(user_id, self.db_path)["last_stock_update"]
+
+    # Banco da versão 7 (configuração só no config.json) atualizado agora
+    def upgrade(self):
+        database_at(self.db_path, 7).close()
+        database.create_tables(self.db_path)
+
+
+class NewUserSettingsTest(SchedulerTestCase):
+    def test_new_user_is_not_refilled_for_a_date_before_registering(self):
+        user_id = database.create_user("novo@exemplo.com", "senha", self.db_path)
+        self.insert_reference(user_id)
+        run_scheduled_jobs(today=TODAY, db_path=self.db_path)
+        self.assertEqual(self.refills(), 0)
+        self.assertEqual(self.last_stock_update_of(user_id), day_number(LATEST_REFILL))
+
+
+class LegacyUserSettingsTest(SchedulerTestCase):
+    def test_refill_applied_by_old_version_is_not_repeated(self):
+        self.upgrade()
+        run_scheduled_jobs(today=TODAY, db_path=self.db_path)
+        self.assertEqual(self.refills(), 0)
+        self.assertEqual(self.last_stock_update_of(1), day_number(LATEST_REFILL))
+
+
+class LegacyUserBehindTest(SchedulerTestCase):
+    last_stock_update = PREVIOUS_REFILL
+
+    def test_pending_refill_is_applied_once(self):
+        # O config.json parou no ciclo anterior: a compra mais recente é feita
+        self.upgrade()
+        self.assertEqual(self.last_stock_update_of(1), day_number(PREVIOUS_REFILL))
+        run_scheduled_jobs(today=TODAY, db_path=self.db_path)
+        self.assertEqual(self.refills(), 1)
+        run_scheduled_jobs(today=TODAY, db_path=self.db_path)
+        self.assertEqual(self.refills(), 1)
+
+
+class ResumeTest(SchedulerTestCase):
+    last_stock_update = PREVIOUS_REFILL
+
+    # Versão 7 com três usuários, todos devendo a compra mais recente e três
+    # dias de consumo
+    def legacy_database(self, db_path):
+        conn = database_at(db_path, 7)
+        for user_id in (2, 3):
+            conn.execute(
+                "INSERT INTO medications (user_id, name, dosage_per_intake, "
+                "quantity_per_package, stock_in_units, is_reference, "
+                "prescription_expiry) VALUES (?, 'Antigo', 1, 30, 10, 1, '2099-01-01')",
+                (user_id,),
+            )
+        conn.commit()
+        conn.close()
+        database.create_tables(db_path)
+        with database.connect_db(db_path) as conn:
+            conn.execute(
+                "UPDATE medications SET consumed_through_day = ?",
+                (day_number(TODAY - timedelta(days=3)),),
+            )
+
+    def ledger(self, db_path):
+        conn = database.connect_db(db_path)
+        return conn.execute(
+            "SELECT medication_id, day, kind, quantity FROM stock_movements "
+            "ORDER BY medication_id, id"
+        ).fetchall()
+
+    def last_user_id(self):
+        conn = database.connect_db(self.db_path)
+        return conn.execute("SELECT last_user_id FROM scheduler_runs").fetchone()[0]
+
+    def test_failed_batch_resumes_without_repeating_work(self):
+        self.legacy_database(self.db_path)
+        refill_users = scheduler._refill_users
+        calls = []
+
+        def fail_second_batch(conn, user_ids, today):
+            calls.append(user_ids)
+            if len(calls) == 2:
+                raise RuntimeError("falha no segundo lote")
+            return refill_users(conn, user_ids, today)
+
+        with mock.patch.object(scheduler, "_refill_users", fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                run_scheduled_jobs(today=TODAY, batch_size=1, db_path=self.db_path)
+        # O primeiro lote ficou gravado; o segundo foi desfeito por inteiro
+        self.assertEqual(calls, [[1], [2]])
+        self.assertEqual(self.last_user_id(), 1)
+        self.assertEqual(self.refills(), 1)
+
+        run_scheduled_jobs(today=TODAY, batch_size=1, db_path=self.db_path)
+        self.assertEqual(self.last_user_id(), 3)
+        self.assertEqual(self.refills(), 3)
+        # Mesmo livro de uma execução sem falha
+        uninterrupted = Path(self.tmp.name) / "uninterrupted.db"
+        self.legacy_database(uninterrupted)
+        run_scheduled_jobs(today=TODAY, batch_size=1, db_path=uninterrupted)
+        self.assertEqual(
+            [tuple(row) for row in self.ledger(self.db_path)],
+            [tuple(row) for row in self.ledger(uninterrupted)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from logic import database
+from logic.shards import add_shards
+from status_check import check_medications, iter_user_batches, report_stockouts
+
+USERS = range(1, 9)
+MEDICATIONS_PER_USER = 2
+
+
+def insert_medications(db_path):
+    for user_id in USERS:
+        for index in range(MEDICATIONS_PER_USER):
+            database.insert_medication(
+                user_id,
+                f"Remédio {user_id}-{index}",
+                1,
+                "comprimido",
+                "diário",
+                "caixa",
+                30,
+                10 + index,
+                "ativo",
+                index == 0,
+                "2099-01-01",
+                db_path,
+            )
+
+
+class ShardedStatusCheckTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "meds.db"
+        database.create_tables(self.db_path)
+        add_shards(2, self.db_path)
+        insert_medications(self.db_path)
+
+    def tearDown(self):
+        database.close_connections()
+        database.clear_routes()
+        database.clear_read_cache()
+        self.tmp.cleanup()
+
+    def test_batches_never_cross_shards_or_exceed_chunk_size(self):
+        chunk_size = 3
+        batches = [
+            batch
+            for chunks in database.iter_shard_chunks(None, chunk_size, self.db_path)
+            for batch in iter_user_batches(chunks, chunk_size)
+        ]
+        seen = []
+        for batch in batches:
+            # O lote só passa do limite para não dividir o último usuário
+            self.assertLess(len(batch), chunk_size + MEDICATIONS_PER_USER)
+            user_ids = list(batch.columns["user_id"])
+            self.assertEqual(user_ids, sorted(user_ids))
+            seen.extend(dict.fromkeys(user_ids))
+        # Nenhum usuário aparece em dois lotes
+        self.assertEqual(sorted(seen), list(USERS))
+
+    def test_check_medications_with_small_chunks(self):
+        out = io.StringIO()
+        summary = check_medications(
+            chunk_size=2, output_format="jsonl", out=out, db_path=self.db_path
+        )
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(summary["medications"], len(USERS) * MEDICATIONS_PER_USER)
+        self.assertEqual(len(records), summary["medications"])
+        self.assertEqual(
+            sorted({record["user_id"] for record in records}), list(USERS)
+        )
+
+    def test_check_medications_with_workers(self):
+        out = io.StringIO()
+        summary = check_medications(
+            chunk_size=2, workers=2, output_format="jsonl", out=out,
+            db_path=self.db_path,
+        )
+        self.assertEqual(summary["medications"], len(USERS) * MEDICATIONS_PER_USER)
+
+    def test_check_medications_selected_users(self):
+        out = io.StringIO()
+        summary = check_medications(
+            users=[2, 3, 5], chunk_size=2, output_format="jsonl", out=out,
+            db_path=self.db_path,
+        )
+        self.assertEqual(summary["medications"], 3 * MEDICATIONS_PER_USER)
+
+    def test_check_medications_with_long_user_list(self):
+        # Mais ids que o limite de um único IN, com repetidos e inexistentes
+        users = [*range(1, 1200), 3, 5]
+        summary = check_medications(
+            users=users, chunk_size=2, output_format="jsonl", out=io.StringIO(),
+            db_path=self.db_path,
+        )
+        self.assertEqual(summary["medications"], len(USERS) * MEDICATIONS_PER_USER)
+
+    def test_reading_unknown_users_does_not_assign_shards(self):
+        def assigned():
+            conn = database.connect_db(self.db_path)
+            return conn.execute("SELECT COUNT(*) FROM user_shards").fetchone()[0]
+
+        # Só as inserções gravaram no diretório
+        self.assertEqual(assigned(), len(USERS))
+        report_stockouts(
+            7, users=range(1, 5001), output_format="jsonl", out=io.StringIO(),
+            db_path=self.db_path,
+        )
+        self.assertEqual(database.fetch_all_medications(9999, self.db_path), [])
+        self.assertEqual(assigned(), len(USERS))
+
+    def test_report_stockouts_filters_users(self):
+        out = io.StringIO()
+        everyone = report_stockouts(
+            60, output_format="jsonl", out=out, db_path=self.db_path
+        )
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        selected = {2, 7}
+        out = io.StringIO()
+        summary = report_stockouts(
+            60, users=[*selected, 1000], output_format="jsonl", out=out,
+            db_path=self.db_path,
+        )
+        filtered = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertGreater(everyone["stockouts"], summary["stockouts"])
+        self.assertEqual(
+            sorted(filtered, key=lambda record: record["id"]),
+            sorted(
+                (record for record in records if record["user_id"] in selected),
+                key=lambda record: record["id"],
+            ),
+        )
+        self.assertEqual(summary, {"stockouts": len(filtered)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from logic import database
+from logic.shards import add_shards
+from logic.transfer import export_medications, import_medications, validate_row
+
+FIELDS = ("name", "dosage_per_intake", "stock_in_units", "prescription_expiry")
+
+
+class RoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = Path(self.tmp.name) / "source.db"
+        database.insert_medication(
+            1, "Fracionado", 0.5, "comprimido", "diário", "caixa", 30, 8.5,
+            "ativo", 1, "2099-01-01", self.source,
+        )
+        database.insert_medication(
+            1, "Inteiro", 1, "comprimido", "diário", "caixa", 30, 12,
+            "ativo", 0, "2099-02-01", self.source,
+        )
+
+    def tearDown(self):
+        database.close_connections()
+        database.clear_read_cache()
+        self.tmp.cleanup()
+
+    def medications(self, db_path):
+        return sorted(
+            tuple(getattr(med, field) for field in FIELDS)
+            for med in database.fetch_all_medications(1, db_path)
+        )
+
+    def round_trip(self, file_format):
+        dest = Path(self.tmp.name) / f"meds.{file_format}"
+        self.assertEqual(export_medications(dest, db_path=self.source), 2)
+        target = Path(self.tmp.name) / f"target-{file_format}.db"
+        result = import_medications(dest, db_path=target)
+        self.assertEqual((result.imported, result.rejected), (2, 0))
+        self.assertEqual(self.medications(target), self.medications(self.source))
+
+    def test_csv_keeps_fractional_stock(self):
+        self.round_trip("csv")
+
+    def test_parquet_keeps_fractional_stock(self):
+        self.round_trip("parquet")
+
+    def test_validate_row_accepts_fractional_stock(self):
+        row = {
+            "user_id": 1, "name": "X", "dosage_per_intake": 1,
+            "stock_in_units": "2.25", "prescription_expiry": "2099-01-01",
+        }
+        self.assertEqual(validate_row(row)["stock_in_units"], 2.25)
+
+
+class ShardedImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "meds.db"
+        database.create_tables(self.db_path)
+        self.shards = add_shards(2, self.db_path)
+        self.source = Path(self.tmp.name) / "meds.csv"
+        self.source.write_text(
+            "user_id,name,dosage_per_intake,stock_in_units,prescription_expiry\n"
+            "1,Um,1,10,2099-01-01\n"
+            "2,Dois,1,10,2099-01-01\n"
+            "3,Três,1,10,2099-01-01\n",
+            encoding="utf-8",
+        )
+
+    def tearDown(self):
+        database.close_connections()
+        database.clear_read_cache()
+        self.tmp.cleanup()
+
+    def test_failed_shard_does_not_hide_committed_ones(self):
+        failing = database.user_db_path(2, self.db_path)
+        insert = database._insert_medications_many
+
+        def fail_on_one_shard(medications, db_path):
+            if db_path == failing:
+                raise sqlite3.OperationalError("database is locked")
+            return insert(medications, db_path)
+
+        with mock.patch.object(database, "_insert_medications_many", fail_on_one_shard):
+            result = import_medications(self.source, db_path=self.db_path)
+        committed = sum(
+            len(database.fetch_all_medications(user_id, self.db_path))
+            for user_id in (1, 2, 3)
+        )
+        self.assertEqual(committed, 2)
+        self.assertEqual(result.imported, committed)
+        self.assertEqual(len(result.failed_chunks), 1)
+        self.assertIn(Path(failing).name, result.failed_chunks[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
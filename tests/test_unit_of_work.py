@@ -0,0 +1,95 @@
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from logic import database
+
+
+class UnitOfWorkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "meds.db"
+        database.insert_medication(
+            1, "Remédio", 1, "comprimido", "diário", "caixa", 30, 10,
+            "ativo", 0, "2099-01-01", self.db_path,
+        )
+        self.med = database.fetch_all_medications(1, self.db_path)[0]
+
+    def tearDown(self):
+        database.close_connections()
+        database.clear_read_cache()
+        self.tmp.cleanup()
+
+    def current(self):
+        return database.get_medication_by_id(self.med.id, self.db_path)
+
+    def movements(self):
+        conn = database.connect_db(self.db_path)
+        return conn.execute(
+            "SELECT kind, quantity FROM stock_movements "
+            "WHERE medication_id = ? ORDER BY id",
+            (self.med.id,),
+        ).fetchall()
+
+    def test_stale_row_version_is_a_conflict(self):
+        first = database.UnitOfWork(1, self.db_path)
+        second = database.UnitOfWork(1, self.db_path)
+        first.update(self.med.id, self.med.row_version, name="Primeira")
+        second.update(self.med.id, self.med.row_version, name="Segunda")
+        self.assertEqual(first.commit(), [])
+        self.assertEqual(second.commit(), [self.med.id])
+        med = self.current()
+        self.assertEqual(med.name, "Primeira")
+        self.assertEqual(med.row_version, self.med.row_version + 1)
+
+    def test_edit_and_purchase_are_one_update(self):
+        opening = len(self.movements())
+        statements = []
+        conn = database.connect_db(self.db_path)
+        conn.set_trace_callback(statements.append)
+        work = database.UnitOfWork(1, self.db_path)
+        work.update(self.med.id, self.med.row_version, stock_in_units=15)
+        work.purchase(self.med.id, self.med.row_version, 5)
+        try:
+            self.assertEqual(work.commit(), [])
+        finally:
+            conn.set_trace_callback(None)
+        # O rastreamento repete o comando a cada gatilho disparado por ele
+        updates = {
+            sql for sql in statements
+            if sql.startswith("UPDATE medications SET") and "row_version + 1" in sql
+        }
+        self.assertEqual(len(updates), 1)
+        med = self.current()
+        self.assertEqual(med.stock_in_units, 20)
+        self.assertEqual(med.row_version, self.med.row_version + 1)
+        self.assertEqual(
+            [tuple(row) for row in self.movements()[opening:]],
+            [("adjustment", 5), ("purchase", 5)],
+        )
+
+    def test_commit_retries_while_database_is_busy(self):
+        # Outro escritor segura a trava por mais que RETRY_BUSY_TIMEOUT_MS
+        other = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.addCleanup(other.close)
+        other.execute("BEGIN IMMEDIATE")
+        release = threading.Timer(
+            3 * database.RETRY_BUSY_TIMEOUT_MS / 1000, other.commit
+        )
+        release.start()
+        self.addCleanup(release.join)
+        work = database.UnitOfWork(1, self.db_path)
+        work.update(self.med.id, self.med.row_version, name="Depois")
+        with mock.patch.object(
+            database.time, "sleep", wraps=database.time.sleep
+        ) as sleep:
+            self.assertEqual(work.commit(), [])
+        self.assertGreater(sleep.call_count, 0)
+        self.assertEqual(self.current().name, "Depois")
+
+
+if __name__ == "__main__":
+    unittest.main()